@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Respostas condicionais (ETag / 304) para rotas de leitura
+"""
+
+import gzip
+from typing import Callable, Dict, NamedTuple, Optional
+from flask import current_app, request
+
+class SerializedBody(NamedTuple):
+    """Corpo JSON já serializado de uma versão de coleção"""
+    etag: str
+    body: bytes
+    gzipped: Optional[bytes]
+
+# Último corpo serializado por recorte de coleção (ex.: 'patches', 'zoom_patches-A')
+_bodies: Dict[str, SerializedBody] = {}
+
+def conditional_json(etag: str, build: Callable[[], Dict], cache_key: Optional[str] = None):
+    """Responde 304 se o cliente já tem esta versão (If-None-Match), senão o JSON de build() com o ETag.
+
+    Com cache_key, o corpo é serializado uma única vez por ETag e reaproveitado
+    pelas próximas requisições (também em gzip, se o cliente aceitar).
+    """
+    if request.if_none_match.contains_weak(etag):
+        # Nada mudou: não monta nem serializa o corpo
+        response = current_app.response_class(status=304)
+    else:
+        serialized = _serialized_body(etag, build, cache_key)
+        response = current_app.response_class(mimetype='application/json')
+        if serialized.gzipped and 'gzip' in request.accept_encodings:
+            response.set_data(serialized.gzipped)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response.set_data(serialized.body)
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    # O navegador guarda a resposta mas sempre revalida com o servidor
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _serialized_body(etag: str, build: Callable[[], Dict], cache_key: Optional[str]) -> SerializedBody:
+    """Corpo da versão pedida: do cache se o ETag bater, senão serializa (e guarda se houver cache_key)"""
+    cached = _bodies.get(cache_key) if cache_key else None
+    if cached and cached.etag == etag:
+        return cached
+    body = current_app.json.dumps(build()).encode('utf-8')
+    gzipped = None
+    min_bytes = current_app.config.get('API_GZIP_MIN_BYTES', 0)
+    if cache_key and min_bytes and len(body) >= min_bytes:
+        gzipped = gzip.compress(body, compresslevel=6)
+    serialized = SerializedBody(etag, body, gzipped)
+    if cache_key:
+        # Troca atômica: requisições concorrentes veem o corpo antigo ou o novo inteiro
+        _bodies[cache_key] = serialized
+    return serialized
@@ -7,6 +7,7 @@ import logging
 from flask import Blueprint, request, jsonify, current_app, send_file, Response
 import os
 from datetime import datetime, timedelta
+from app.api.http_cache import conditional_json
 
 midi_bp = Blueprint('midi', __name__)
 logger = logging.getLogger(__name__)
@@ -91,6 +92,88 @@ def load_patch():
             'error': str(e)
         }), 500
 
+@midi_bp.route('/patch/activation_stats', methods=['GET'])
+def get_activation_stats():
+    """Retorna a latência da ativação de patches via entrada MIDI (callback → port.send)"""
+    try:
+        midi_controller = current_app.midi_controller
+        return jsonify({
+            'success': True,
+            'data': midi_controller.get_activation_stats()
+        })
+    except Exception as e:
+        logger.error(f"Erro ao obter estatísticas de ativação: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@midi_bp.route('/metrics', methods=['GET'])
+def get_latency_metrics():
+    """Retorna os histogramas de latência por etapa (lookup, enqueue, send) e dispositivo"""
+    try:
+        midi_controller = current_app.midi_controller
+        return jsonify({
+            'success': True,
+            'data': midi_controller.get_latency_metrics()
+        })
+    except Exception as e:
+        logger.error(f"Erro ao obter métricas de latência: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@midi_bp.route('/devices/pool', methods=['GET'])
+def get_connection_pool():
+    """Retorna a saúde e as estatísticas das portas do pool de conexões"""
+    try:
+        midi_controller = current_app.midi_controller
+        return jsonify({
+            'success': True,
+            'data': midi_controller.get_connection_pool_stats(),
+            'recovery': midi_controller.get_recovery_stats(),
+            'strategies': midi_controller.get_send_strategies()
+        })
+    except Exception as e:
+        logger.error(f"Erro ao obter estatísticas do pool: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@midi_bp.route('/devices/transmit_stats', methods=['GET'])
+def get_transmit_stats():
+    """Retorna profundidade e tempo de escoamento das filas de transmissão"""
+    try:
+        midi_controller = current_app.midi_controller
+        return jsonify({
+            'success': True,
+            'data': midi_controller.get_transmit_stats()
+        })
+    except Exception as e:
+        logger.error(f"Erro ao obter estatísticas de transmissão: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@midi_bp.route('/devices/state', methods=['GET'])
+def get_devices_state():
+    """Retorna o último estado conhecido (programa e CCs) de cada porta de saída"""
+    try:
+        midi_controller = current_app.midi_controller
+        return jsonify({
+            'success': True,
+            'data': midi_controller.get_device_states()
+        })
+    except Exception as e:
+        logger.error(f"Erro ao obter estado dos dispositivos: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @midi_bp.route('/effect/toggle', methods=['POST'])
 def toggle_effect():
     """Liga/desliga um efeito"""
@@ -232,7 +315,13 @@ def update_midi_config():
             }), 400
         
         midi_controller = current_app.midi_controller
-        success = midi_controller.update_midi_config(data)
+        try:
+            success = midi_controller.update_midi_config(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         if success:
             return jsonify({
@@ -418,18 +507,24 @@ def send_note():
 
 @midi_bp.route('/commands/received', methods=['GET'])
 def get_received_commands():
-    """Lista comandos MIDI recebidos"""
+    """Lista comandos MIDI recebidos (todos do buffer, ou só os após ?after=N; ?sync=1 só retorna o cursor)"""
     try:
         midi_controller = current_app.midi_controller
-        commands = midi_controller.get_received_commands()
+        after = request.args.get('after', type=int)
+        commands, last_seq = midi_controller.read_received_commands(after)
+        
+        # Cliente que pede sincronização só recebe o cursor, sem reprocessar comandos antigos
+        if after is None and request.args.get('sync', type=int):
+            commands = []
         
         # Log de debug
         if commands:
-            logger.info(f"Retornando {len(commands)} comandos MIDI recebidos")
+            logger.debug(f"Retornando {len(commands)} comandos MIDI recebidos")
         
         return jsonify({
             'success': True,
-            'commands': commands
+            'commands': commands,
+            'last_seq': last_seq
         })
         
     except Exception as e:
@@ -693,12 +788,13 @@ def get_banks():
     """Lista todos os bancos"""
     try:
         db_manager = current_app.db_manager
-        banks = db_manager.get_all_banks()
+        etag = current_app.cache_manager.etag('banks')
         
-        return jsonify({
+        # Só consulta o banco de dados se o cliente não tiver esta versão
+        return conditional_json(etag, lambda: {
             'success': True,
-            'data': [bank.to_dict() for bank in banks]
-        })
+            'data': [bank.to_dict() for bank in db_manager.get_all_banks()]
+        }, cache_key='banks')
         
     except Exception as e:
         logger.error(f"Erro ao listar bancos: {str(e)}")
@@ -773,6 +869,8 @@ def create_bank():
         
         db_manager = current_app.db_manager
         bank_id = db_manager.create_bank(bank)
+        # Versão dos bancos e mapeamentos do controlador MIDI, uma única vez por alteração
+        current_app.cache_manager.banks_changed()
         
         return jsonify({
             'success': True,
@@ -844,6 +942,8 @@ def update_bank(bank_id):
                 bank.mappings.append(mapping)
         
         success = db_manager.update_bank(bank)
+        # Versão dos bancos e mapeamentos do controlador MIDI, uma única vez por alteração
+        current_app.cache_manager.banks_changed()
         
         if success:
             return jsonify({
@@ -869,6 +969,8 @@ def delete_bank(bank_id):
     try:
         db_manager = current_app.db_manager
         success = db_manager.delete_bank(bank_id)
+        # Versão dos bancos e mapeamentos do controlador MIDI, uma única vez por alteração
+        current_app.cache_manager.banks_changed()
         
         if success:
             return jsonify({
@@ -894,6 +996,8 @@ def activate_bank(bank_id):
     try:
         db_manager = current_app.db_manager
         success = db_manager.set_active_bank(bank_id)
+        # Versão dos bancos e mapeamentos do controlador MIDI, uma única vez por alteração
+        current_app.cache_manager.banks_changed()
         
         if success:
             return jsonify({
@@ -980,23 +1084,21 @@ def test_device_connection():
         
         # Testa conexão com o dispositivo
         try:
-            import mido
+            # Envia uma mensagem de teste pela porta persistente do pool
+            ok, error = midi_controller.test_output(device_name)
+            if not ok:
+                raise IOError(error)
+            
+            return jsonify({
+                'success': True,
+                'message': f'Dispositivo {device_name} está respondendo corretamente',
+                'data': {
+                    'device_name': device_name,
+                    'status': 'connected',
+                    'test_result': 'success'
+                }
+            })
             
-            # Tenta abrir a porta e enviar uma mensagem de teste
-            with mido.open_output(device_name) as port:
-                test_msg = mido.Message('program_change', channel=0, program=0)
-                port.send(test_msg)
-                
-                return jsonify({
-                    'success': True,
-                    'message': f'Dispositivo {device_name} está respondendo corretamente',
-                    'data': {
-                        'device_name': device_name,
-                        'status': 'connected',
-                        'test_result': 'success'
-                    }
-                })
-                
         except Exception as e:
             error_msg = str(e).lower()
             
@@ -1098,9 +1200,10 @@ def get_zoom_patches(bank_letter):
         bank_number = bank_mapping[bank_letter]
         midi_controller = current_app.midi_controller
         
-        # Tenta importar patches da Zoom G3X
+        # Nomes do cache se já lidos deste pedal; senão lê da Zoom G3X (?force=1 sempre relê)
         if midi_controller.zoom_g3x and midi_controller.device_status['zoom_g3x']['connected']:
-            patches = midi_controller.zoom_g3x.get_bank_patches(bank_number)
+            force = request.args.get('force', '0') in ('1', 'true')
+            patches = midi_controller.get_zoom_bank_patches(bank_letter, force=force)
             if patches:
                 return jsonify({
                     'success': True,
@@ -1214,10 +1317,22 @@ def zoom_complete_data():
         midi_port = None
         identity_info = None
         
+        midi_controller = current_app.midi_controller
+        shared = midi_controller.zoom_g3x if midi_controller.zoom_g3x and midi_controller.device_status['zoom_g3x']['connected'] else None
+        
         # Tenta encontrar a porta da Zoom G3X
         try:
-            ports = mido.get_output_names()
-            zoom_ports = [port for port in ports if 'zoom' in port.lower() or 'g3x' in port.lower()]
+            if shared:
+                # Usa o controlador já conectado (nomes do cache se já lidos deste pedal)
+                zoom = shared
+                midi_port = device_name = shared.device_name
+                device_connected = True
+                identity_info = shared.get_fingerprint()
+                zoom_ports = []
+            else:
+                # Portas do snapshot do monitor (não enumera o ALSA)
+                ports = midi_controller.port_watcher.snapshot()['outputs']
+                zoom_ports = [port for port in ports if 'zoom' in port.lower() or 'g3x' in port.lower()]
             
             if zoom_ports:
                 midi_port = zoom_ports[0]
@@ -1240,11 +1355,7 @@ def zoom_complete_data():
         if device_connected:
             for bank in ['A', 'B', 'C']:
                 try:
-                    # Converte letra do banco para número
-                    bank_mapping = {'A': 0, 'B': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5, 'G': 6, 'H': 7, 'I': 8, 'J': 9}
-                    bank_number = bank_mapping[bank]
-                    
-                    patches = zoom.get_bank_patches(bank_number)
+                    patches = midi_controller.get_zoom_bank_patches(bank, zoom=zoom)
                     if patches:
                         real_names = [p for p in patches if not p['name'].startswith('Patch ')]
                         generic_names = [p for p in patches if p['name'].startswith('Patch ')]
@@ -1289,7 +1400,7 @@ def zoom_complete_data():
             'device_connected': device_connected,
             'total_banks_analyzed': len(banks_data),
             'total_real_names_found': total_real_names,
-            'midi_ports_available': len(mido.get_output_names()) if 'mido' in globals() else 0,
+            'midi_ports_available': len(midi_controller.port_watcher.snapshot()['outputs']),
             'identity_info': identity_info
         }
         
@@ -1319,8 +1430,8 @@ def zoom_complete_data():
                 'type': 'success'
             })
         
-        # Desconecta o controlador
-        if device_connected:
+        # Desconecta o controlador temporário (o compartilhado continua conectado)
+        if device_connected and zoom is not shared:
             zoom.disconnect()
         
         return jsonify({
@@ -1350,14 +1461,9 @@ def chocolate_channel_selected(channel):
         
         # Busca patches para este canal
         cache_manager = current_app.cache_manager
-        patches = cache_manager.get_patches()
         
-        # Filtra patches que usam o canal especificado
-        matching_patches = []
-        for patch in patches:
-            if (patch.get('input_device') == 'Chocolate MIDI' and 
-                patch.get('input_channel') == channel):
-                matching_patches.append(patch)
+        # Patches que usam o canal especificado (índice por dispositivo e canal)
+        matching_patches = cache_manager.find_patches('input_channel', 'Chocolate MIDI', channel)
         
         if not matching_patches:
             logger.warning(f"⚠️ Nenhum patch encontrado para canal {channel}")
@@ -1400,40 +1506,63 @@ def chocolate_channel_selected(channel):
 
 @midi_bp.route('/zoom/patches/update', methods=['POST'])
 def update_zoom_patches():
-    """Lê todos os patches da Zoom e salva na tabela zoom_patches e atualiza o cache"""
+    """Inicia a leitura em background de todos os patches da Zoom (bancos alterados salvos no banco e no cache)"""
     try:
-        bank_mapping = {
-            'A': 0, 'B': 1, 'C': 2, 'D': 3, 'E': 4,
-            'F': 5, 'G': 6, 'H': 7, 'I': 8, 'J': 9
-        }
         midi_controller = current_app.midi_controller
-        db_manager = current_app.db_manager
-        cache_manager = current_app.cache_manager
-        all_patches = []
-        for bank_letter, bank_number in bank_mapping.items():
-            if midi_controller.zoom_g3x and midi_controller.device_status['zoom_g3x']['connected']:
-                patches = midi_controller.zoom_g3x.get_bank_patches(bank_number)
-                if patches:
-                    for patch in patches:
-                        all_patches.append({
-                            'bank': bank_letter,
-                            'number': patch['number'],
-                            'name': patch['name'],
-                        })
-        db_manager.save_zoom_patches(all_patches)
-        cache_manager.update_zoom_patches_cache()
-        return jsonify({'success': True, 'message': f'{len(all_patches)} patches da Zoom atualizados no banco e cache.'})
+        # Sem force só os bancos cujo checksum mudou são regravados
+        force = request.args.get('force', '0') in ('1', 'true')
+        job = midi_controller.start_zoom_patch_dump(current_app.cache_manager, force=force)
+        if not job:
+            return jsonify({'success': False, 'error': 'Zoom G3X não está conectado'}), 400
+        return jsonify({
+            'success': True,
+            'message': 'Leitura dos patches da Zoom iniciada. Acompanhe em /api/midi/zoom/patches/update/stream.',
+            'data': job.status()
+        }), 202
     except Exception as e:
         logger.error(f"Erro ao atualizar patches da Zoom: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@midi_bp.route('/zoom/patches/update/status', methods=['GET'])
+def get_zoom_patches_update_status():
+    """Retorna o progresso por banco da leitura dos patches da Zoom"""
+    job = current_app.midi_controller.zoom_patch_dump
+    if not job:
+        return jsonify({'success': False, 'error': 'Nenhuma leitura iniciada'}), 404
+    return jsonify({'success': True, 'data': job.status()})
+
+@midi_bp.route('/zoom/patches/update/stream', methods=['GET'])
+def stream_zoom_patches_update():
+    """Transmite (Server-Sent Events) os nomes lidos, bancos salvos e a conclusão da leitura"""
+    import json
+    
+    job = current_app.midi_controller.zoom_patch_dump
+    if not job:
+        return jsonify({'success': False, 'error': 'Nenhuma leitura iniciada'}), 404
+    after = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', 0, type=int)
+    
+    def generate(cursor):
+        while True:
+            events, finished = job.wait_events(cursor)
+            for event in events:
+                cursor = event['seq']
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if finished:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+    
+    return Response(generate(after), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @midi_bp.route('/zoom/patches_db/<bank_letter>', methods=['GET'])
 def get_zoom_patches_db(bank_letter):
     """Retorna os patches da Zoom do cache para o banco informado"""
     try:
         cache_manager = current_app.cache_manager
+        etag = cache_manager.etag('zoom_patches', bank_letter)
         patches = cache_manager.get_zoom_patches_by_bank(bank_letter)
-        return jsonify({'success': True, 'data': patches})
+        return conditional_json(etag, lambda: {'success': True, 'data': patches}, cache_key=f'zoom_patches-{bank_letter}')
     except Exception as e:
         logger.error(f"Erro ao buscar patches da Zoom no cache: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
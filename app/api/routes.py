@@ -7,6 +7,7 @@ import logging
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
 from app.database.database import get_db
+from app.api.http_cache import conditional_json
 import os
 
 api_bp = Blueprint('api', __name__)
@@ -17,13 +18,15 @@ def get_patches():
     """Lista todos os patches"""
     try:
         cache_manager = current_app.cache_manager
+        # Versão lida antes dos dados: numa corrida o ETag fica velho, nunca os dados
+        etag = cache_manager.etag('patches')
         patches = cache_manager.get_patches()
         
-        return jsonify({
+        return conditional_json(etag, lambda: {
             'success': True,
             'data': patches,
             'count': len(patches)
-        })
+        }, cache_key='patches')
         
     except Exception as e:
         logger.error(f"Erro ao listar patches: {str(e)}")
@@ -295,12 +298,13 @@ def get_effects():
     """Lista todos os efeitos disponíveis"""
     try:
         cache_manager = current_app.cache_manager
+        etag = cache_manager.etag('effects')
         effects = cache_manager.get_effects()
         
-        return jsonify({
+        return conditional_json(etag, lambda: {
             'success': True,
             'data': effects
-        })
+        }, cache_key='effects')
         
     except Exception as e:
         logger.error(f"Erro ao listar efeitos: {str(e)}")
@@ -408,16 +412,15 @@ def get_used_channels():
     """Retorna lista de canais já utilizados em patches"""
     try:
         cache_manager = current_app.cache_manager
-        patches = cache_manager.get_patches()
         
         used_channels = []
-        for patch in patches:
-            if patch.get('input_channel') is not None:
+        for (_, input_channel), count in cache_manager.index_counts('input_channel').items():
+            if input_channel is not None:
                 # Verifica se é um número válido (0-127)
                 try:
-                    channel = int(patch['input_channel'])
+                    channel = int(input_channel)
                     if 0 <= channel <= 127:
-                        used_channels.append(channel)
+                        used_channels.extend([channel] * count)
                 except (ValueError, TypeError):
                     # Ignora valores que não são números válidos
                     continue
@@ -439,23 +442,19 @@ def get_used_zoom_patches():
     """Retorna lista de patches da Zoom G3X já utilizados (banco + patch local)"""
     try:
         cache_manager = current_app.cache_manager
-        patches = cache_manager.get_patches()
-        print(f'[DEBUG_BACKEND] Total de patches no sistema: {len(patches)}')
-        print(f'[DEBUG_BACKEND] patches lidos do cache: {patches}')
         used_patches = []
-        for patch in patches:
-            if patch.get('zoom_bank') and patch.get('zoom_patch') is not None:
+        for (bank_letter, zoom_patch), count in cache_manager.index_counts('zoom_patch').items():
+            if bank_letter and zoom_patch is not None:
                 try:
-                    global_patch_number = int(patch['zoom_patch'])
-                    bank_letter = patch['zoom_bank']
+                    global_patch_number = int(zoom_patch)
                     if 0 <= global_patch_number <= 99:
                         local_patch_number = global_patch_number % 10
-                        used_patches.append({
+                        used_patches.extend([{
                             'bank': bank_letter,
                             'patch': local_patch_number,
                             'global_patch': global_patch_number,
                             'combination': f"{bank_letter}{local_patch_number}"
-                        })
+                        } for _ in range(count)])
                 except (ValueError, TypeError):
                     continue
         print(f'[DEBUG_BACKEND] Patches usados da Zoom retornados: {used_patches}')
@@ -477,14 +476,9 @@ def get_patches_by_channel(channel):
         logger.info(f"🔍 Buscando patches para canal {channel}")
         
         cache_manager = current_app.cache_manager
-        patches = cache_manager.get_patches()
         
-        # Filtra patches que usam o canal especificado
-        matching_patches = []
-        for patch in patches:
-            if (patch.get('input_device') == 'Chocolate MIDI' and 
-                patch.get('input_channel') == channel):
-                matching_patches.append(patch)
+        # Patches que usam o canal especificado (índice por dispositivo e canal)
+        matching_patches = cache_manager.find_patches('input_channel', 'Chocolate MIDI', channel)
         
         logger.info(f"✅ Encontrados {len(matching_patches)} patches para canal {channel}")
         
@@ -512,8 +506,11 @@ def get_active_patch():
         last_command = None
         active_patch = None
         
-        # Primeiro, verifica se há comandos MIDI recentes
-        received_commands = midi_controller.get_received_commands()
+        # Primeiro, verifica comandos MIDI recebidos após o cursor do cliente (?after=N).
+        # Sem cursor, Program Changes já ativam o patch em processo e o último patch ativado vale
+        # (um PC antigo no buffer não pode sobrepor ativações posteriores pela interface/API).
+        after = request.args.get('after', type=int)
+        received_commands = midi_controller.get_received_commands(after) if after is not None else []
         logger.info(f"🔍 [PATCH_ACTIVE_DEBUG] Comandos MIDI recebidos: {len(received_commands) if received_commands else 0}")
         
         if received_commands:
@@ -526,15 +523,10 @@ def get_active_patch():
         # Se há comando MIDI recente, busca o patch correspondente
         if last_command and last_command.get('program') is not None:
             cache_manager = current_app.cache_manager
-            patches = cache_manager.get_patches()
-            logger.info(f"🔍 [PATCH_ACTIVE_DEBUG] Total de patches no cache: {len(patches)}")
-            
-            for patch in patches:
-                if (patch.get('input_device') == 'Chocolate MIDI' and 
-                    patch.get('program') == last_command['program']):
-                    active_patch = patch
-                    logger.info(f"🔍 [PATCH_ACTIVE_DEBUG] Patch encontrado via MIDI: {patch.get('name')}")
-                    break
+            # Mesma resolução da ativação feita pela entrada MIDI (input_channel, depois program)
+            active_patch = cache_manager.find_patch_for_program('Chocolate MIDI', last_command['program'])
+            if active_patch:
+                logger.info(f"🔍 [PATCH_ACTIVE_DEBUG] Patch encontrado via MIDI: {active_patch.get('name')}")
         
         # Se não encontrou via comando MIDI, usa o último patch ativado via API/disco
         if not active_patch:
@@ -4,28 +4,64 @@ RaspMIDI - Gerenciador de Cache
 """
 
 import logging
+import sqlite3
 import threading
 import time
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+import zlib
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
 
 from app.database.database import get_db
 from app.database.models import Patch, Effect
+from app.cache.patch_snapshot import PatchSnapshot, build_snapshot, index_key
+from app.midi.patch_plan import PatchPlan
 
 class CacheManager:
     """Gerenciador de cache para pré-carregamento de dados"""
     
+    # Índices secundários de patches: nome -> campos que formam a chave
+    INDEX_FIELDS = {
+        'input_channel': ('input_device', 'input_channel'),
+        'program': ('input_device', 'program'),
+        'zoom_patch': ('zoom_bank', 'zoom_patch')
+    }
+    
+    ZOOM_BANK_LETTERS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
+    
+    # Coleções com versão (banks fica no banco de dados; as rotas informam as alterações)
+    VERSIONED_COLLECTIONS = ('patches', 'zoom_patches', 'effects', 'config', 'banks')
+    
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self._cache = {}
-        self._cache_timestamps = {}
-        self._lock = threading.Lock()
+        self._lock = threading.RLock()
         self._loaded = False
         self._last_load_time = None
         
-        # Configurações de cache
-        self.cache_timeout = 300  # 5 minutos
-        self.auto_reload = True
+        # Callbacks notificados a cada alteração na coleção de patches e nos bancos de mapeamento
+        self._patch_listeners = []
+        self._bank_listeners = []
+        
+        # Patches publicados como snapshot imutável (lista, índices e planos de transmissão):
+        # quem escreve monta um novo sob _lock e troca a referência; leitura sem lock
+        self._patches = build_snapshot((), self.INDEX_FIELDS)
+        self._patches_loaded = False
+        
+        # Versão de cada coleção, incrementada a cada alteração (base dos ETags da API).
+        # A época distingue processos: após reiniciar, ETags antigos não batem
+        self._versions = {name: 0 for name in self.VERSIONED_COLLECTIONS}
+        self._epoch = f"{int(time.time()):x}"
+        self._version_lock = threading.Lock()
+        
+        # Sem expiração: escritas deste processo atualizam o cache na hora e
+        # gravações de outros processos são detectadas pelo PRAGMA data_version
+        self.poll_interval = 1.0
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        self._banks_seen = None
+        # Contador de alterações (tabela table_versions) de cada coleção já refletido no cache
+        self._db_seen = {}
+        self._watch_stats = {'checks': 0, 'external_changes': 0, 'last_change': None}
         
         self.logger.info("Cache Manager inicializado")
     
@@ -46,27 +82,29 @@ class CacheManager:
                 if not db:
                     self.logger.error("Banco de dados não inicializado")
                     return False
+                # Contadores lidos antes dos dados: escrita no meio só causa uma releitura a mais
+                self._db_seen.update(db.get_table_versions())
                 # Carrega patches
                 patches = db.get_all_patches()
-                self._cache['patches'] = [patch.to_dict() for patch in patches]
-                self._cache_timestamps['patches'] = datetime.now()
+                self._publish_patches([patch.to_dict() for patch in patches])
                 # Carrega patches da Zoom
                 zoom_patches = {}
-                for bank_letter in ['A','B','C','D','E','F','G','H','I','J']:
+                for bank_letter in self.ZOOM_BANK_LETTERS:
                     zoom_patches[bank_letter] = db.get_zoom_patches_by_bank(bank_letter)
                 self._cache['zoom_patches'] = zoom_patches
-                self._cache_timestamps['zoom_patches'] = datetime.now()
+                self._cache['zoom_fingerprints'] = db.get_zoom_bank_fingerprints()
+                self.bump_version('zoom_patches')
                 # Carrega efeitos padrão do Zoom G3X
                 from app.config import Config
                 self._cache['effects'] = Config.ZOOM_EFFECTS
-                self._cache_timestamps['effects'] = datetime.now()
+                self.bump_version('effects')
                 # Carrega configurações
                 self._cache['config'] = {
                     'max_patches': Config.MAX_PATCHES,
                     'default_patch_name': Config.DEFAULT_PATCH_NAME,
                     'bluetooth_enabled': Config.BLUETOOTH_ENABLED
                 }
-                self._cache_timestamps['config'] = datetime.now()
+                self.bump_version('config')
                 self._loaded = True
                 self._last_load_time = datetime.now()
                 self.logger.info(f"Cache carregado com {len(patches)} patches e patches da Zoom para {len(zoom_patches)} bancos")
@@ -81,32 +119,66 @@ class CacheManager:
         self.logger.info("Recarregando dados no cache...")
         return self.load_all_data()
     
-    def get_patches(self) -> List[Dict]:
-        """Obtém todos os patches do cache"""
-        # Remover lock problemático temporariamente
-        if not self._is_cache_valid('patches'):
-            self._load_patches()
-        return self._cache.get('patches', [])
+    def get_patches(self) -> Tuple[Dict, ...]:
+        """Obtém todos os patches do cache (somente leitura)"""
+        return self._patch_snapshot().patches
     
     def get_patch(self, patch_id: int) -> Optional[Dict]:
         """Obtém um patch específico do cache"""
-        patches = self.get_patches()
-        for patch in patches:
-            if patch['id'] == patch_id:
-                return patch
+        return self._patch_snapshot().by_id.get(patch_id)
+    
+    def find_patches(self, index: str, *key) -> List[Dict]:
+        """Patches com a chave em um índice secundário (ex.: 'input_channel', 'Chocolate MIDI', 3)"""
+        return list(self._patch_snapshot().indexes[index].get(index_key(key), ()))
+    
+    def find_patch_for_program(self, input_device: str, program: int) -> Optional[Dict]:
+        """Patch associado a um Program Change recebido: por input_channel, depois por program"""
+        indexes = self._patch_snapshot().indexes
+        key = index_key((input_device, program))
+        for index in ('input_channel', 'program'):
+            matches = indexes[index].get(key)
+            if matches:
+                # Primeiro patch da coleção, como na busca linear original
+                return matches[0]
         return None
     
+    def index_counts(self, index: str) -> Dict[tuple, int]:
+        """Quantidade de patches por chave de um índice secundário"""
+        return {key: len(patches) for key, patches in self._patch_snapshot().indexes[index].items()}
+    
+    def _patch_snapshot(self) -> PatchSnapshot:
+        """Snapshot atual dos patches (carrega do banco na primeira leitura)"""
+        if not self._patches_loaded:
+            with self._lock:
+                if not self._patches_loaded:
+                    self._load_patches()
+        return self._patches
+    
+    def get_version(self, name: str) -> int:
+        """Versão atual de uma coleção"""
+        return self._versions[name]
+    
+    def bump_version(self, name: str) -> int:
+        """Marca uma coleção como alterada e retorna a nova versão"""
+        with self._version_lock:
+            self._versions[name] += 1
+            return self._versions[name]
+    
+    def etag(self, name: str, *parts) -> str:
+        """ETag da coleção na versão atual (partes extras distinguem recortes, ex.: banco da Zoom)"""
+        return '-'.join([name, *(str(part) for part in parts), self._epoch, str(self._versions[name])])
+    
     def get_effects(self) -> Dict:
         """Obtém os efeitos do cache"""
         with self._lock:
-            if not self._is_cache_valid('effects'):
+            if 'effects' not in self._cache:
                 self._load_effects()
             return self._cache.get('effects', {})
     
     def get_config(self) -> Dict:
         """Obtém as configurações do cache"""
         with self._lock:
-            if not self._is_cache_valid('config'):
+            if 'config' not in self._cache:
                 self._load_config()
             return self._cache.get('config', {})
     
@@ -140,25 +212,23 @@ class CacheManager:
                 # Atualiza no banco usando merge (passando dados parciais)
                 from app.database.models import Patch
                 patch_obj = Patch.from_dict(patch_data)
+                before = self._db_version('patches')
                 success = db.update_patch(patch_obj, partial_data=patch_data)
                 
                 if success:
-                    # Atualiza no cache
+                    self._mark_own_write('patches', before, 1)
+                    # Novo snapshot com os dados completos do objeto Patch no lugar do antigo
+                    updated_patch_dict = db.get_patch(patch_id).to_dict()
                     patches = self.get_patches()
-                    for i, cached_patch in enumerate(patches):
-                        if cached_patch['id'] == patch_id:
-                            # Atualiza com os dados completos do objeto Patch
-                            updated_patch_dict = db.get_patch(patch_id).to_dict()
-                            patches[i] = updated_patch_dict
-                            self._cache_timestamps['patches'] = datetime.now()
-                            self.logger.info(f"✅ [CACHE] Patch {patch_id} atualizado no cache e banco")
-                            self.logger.debug(f"📋 [CACHE] Dados atualizados: {updated_patch_dict}")
-                            return True
+                    if patch_id in self._patches.by_id:
+                        self._publish_patches(updated_patch_dict if p['id'] == patch_id else p for p in patches)
+                        self.logger.info(f"✅ [CACHE] Patch {patch_id} atualizado no cache e banco")
+                        self.logger.debug(f"📋 [CACHE] Dados atualizados: {updated_patch_dict}")
+                        return True
                     
                     # Se não encontrou no cache, adiciona
                     self.logger.warning(f"⚠️ [CACHE] Patch {patch_id} não encontrado no cache, adicionando")
-                    patches.append(db.get_patch(patch_id).to_dict())
-                    self._cache_timestamps['patches'] = datetime.now()
+                    self._publish_patches(patches + (updated_patch_dict,))
                     return True
                 else:
                     self.logger.error(f"❌ [CACHE] Falha ao atualizar patch {patch_id} no banco")
@@ -175,7 +245,6 @@ class CacheManager:
         try:
             self.logger.info(f"🔧 Iniciando adição de patch: {patch_data.get('name', 'Sem nome')}")
             
-            # Remover lock problemático - usar timeout se necessário
             db = get_db()
             if not db:
                 self.logger.error("❌ Banco de dados não disponível")
@@ -187,17 +256,20 @@ class CacheManager:
             patch = Patch.from_dict(patch_data)
             self.logger.info(f"✅ Objeto Patch criado: {patch.name}")
             
-            patch_id = db.create_patch(patch)
-            self.logger.info(f"🔧 Resultado da criação no banco: patch_id = {patch_id}")
+            # Banco e cache sob o mesmo lock: o monitor do banco não relê entre os dois
+            with self._lock:
+                before = self._db_version('patches')
+                patch_id = db.create_patch(patch)
+                self.logger.info(f"🔧 Resultado da criação no banco: patch_id = {patch_id}")
+                if patch_id:
+                    patch.id = patch_id
+                    self._mark_own_write('patches', before, 1)
+                    patches = self.get_patches()
+                    if patch_id not in self._patches.by_id:
+                        # Dados como o banco os devolve (iguais aos de uma releitura)
+                        patches = self._publish_patches(patches + (db.get_patch(patch_id).to_dict(),)).patches
             
             if patch_id:
-                # Adiciona no cache sem lock
-                patch.id = patch_id
-                with self._lock:
-                    patches = self.get_patches()
-                    patches.append(patch.to_dict())
-                    self._cache_timestamps['patches'] = datetime.now()
-                
                 self.logger.info(f"✅ Patch {patch.name} criado com ID {patch_id}")
                 self.logger.info(f"📊 Total de patches no cache: {len(patches)}")
                 return patch_id
@@ -220,13 +292,13 @@ class CacheManager:
                     return False
                 
                 # Deleta do banco
+                before = self._db_version('patches')
                 success = db.delete_patch(patch_id)
                 
                 if success:
-                    # Remove do cache
-                    patches = self.get_patches()
-                    patches[:] = [p for p in patches if p['id'] != patch_id]
-                    self._cache_timestamps['patches'] = datetime.now()
+                    self._mark_own_write('patches', before, 1)
+                    # Novo snapshot sem o patch
+                    self._publish_patches(p for p in self.get_patches() if p['id'] != patch_id)
                     
                     self.logger.info(f"Patch {patch_id} deletado")
                     return True
@@ -237,27 +309,51 @@ class CacheManager:
             self.logger.error(f"Erro ao deletar patch: {str(e)}")
             return False
     
-    def _is_cache_valid(self, key: str) -> bool:
-        """Verifica se o cache para uma chave é válido"""
-        if key not in self._cache_timestamps:
+    def _load_patches(self) -> bool:
+        """Carrega patches do banco no cache (True se mudaram)"""
+        db = get_db()
+        if not db:
             return False
-        
-        timestamp = self._cache_timestamps[key]
-        return datetime.now() - timestamp < timedelta(seconds=self.cache_timeout)
+        self._db_seen['patches'] = self._db_version('patches')
+        patches = [patch.to_dict() for patch in db.get_all_patches()]
+        # Comparação por id: a ordem da lista no cache pode diferir da consulta
+        if self._patches_loaded and {patch['id']: patch for patch in patches} == dict(self._patches.by_id):
+            return False
+        self._publish_patches(patches)
+        return True
     
-    def _load_patches(self):
-        """Carrega patches no cache"""
-        db = get_db()
-        if db:
-            patches = db.get_all_patches()
-            self._cache['patches'] = [patch.to_dict() for patch in patches]
-            self._cache_timestamps['patches'] = datetime.now()
+    def _publish_patches(self, patches) -> PatchSnapshot:
+        """Monta o snapshot da nova coleção, troca a referência e notifica (chamar com _lock)"""
+        snapshot = build_snapshot(patches, self.INDEX_FIELDS, previous=self._patches)
+        self._patches = snapshot
+        self._patches_loaded = True
+        self._notify_patches_changed()
+        self.logger.debug(f"Snapshot de patches publicado: {len(snapshot.patches)} patches, {len(snapshot.plans)} planos")
+        return snapshot
+    
+    def get_patch_plan(self, patch_id: int) -> Optional[PatchPlan]:
+        """Retorna o plano de transmissão pré-compilado do patch (None se não houver)"""
+        return self._patches.plans.get(patch_id)
+    
+    def add_patches_listener(self, callback):
+        """Registra callback chamado com a lista de patches após cada alteração"""
+        self._patch_listeners.append(callback)
+    
+    def _notify_patches_changed(self):
+        """Incrementa a versão dos patches e notifica os listeners da alteração"""
+        self.bump_version('patches')
+        patches = self._patches.patches
+        for callback in self._patch_listeners:
+            try:
+                callback(patches)
+            except Exception as e:
+                self.logger.error(f"Erro ao notificar alteração de patches: {str(e)}")
     
     def _load_effects(self):
         """Carrega efeitos no cache"""
         from app.config import Config
         self._cache['effects'] = Config.ZOOM_EFFECTS
-        self._cache_timestamps['effects'] = datetime.now()
+        self.bump_version('effects')
     
     def _load_config(self):
         """Carrega configurações no cache"""
@@ -267,7 +363,7 @@ class CacheManager:
             'default_patch_name': Config.DEFAULT_PATCH_NAME,
             'bluetooth_enabled': Config.BLUETOOTH_ENABLED
         }
-        self._cache_timestamps['config'] = datetime.now()
+        self.bump_version('config')
     
     def get_cache_info(self) -> Dict:
         """Retorna informações sobre o cache"""
@@ -275,9 +371,15 @@ class CacheManager:
             'loaded': self._loaded,
             'last_load_time': self._last_load_time.isoformat() if self._last_load_time else None,
             'cache_size': len(self._cache),
-            'patches_count': len(self._cache.get('patches', [])),
+            'patches_count': len(self._patches.patches),
+            'compiled_plans': len(self._patches.plans),
+            'versions': dict(self._versions),
             'effects_count': len(self._cache.get('effects', {})),
-            'cache_timeout': self.cache_timeout
+            'poll_interval': self.poll_interval,
+            'watching': self._watch_thread is not None,
+            'db_checks': self._watch_stats['checks'],
+            'external_changes': self._watch_stats['external_changes'],
+            'last_external_change': self._watch_stats['last_change']
         }
 
     def set_active_patch(self, patch_id: int):
@@ -291,24 +393,208 @@ class CacheManager:
 
     def get_zoom_patches_by_bank(self, bank_letter: str) -> list:
         """Obtém patches da Zoom do cache para um banco"""
-        if not self._is_cache_valid('zoom_patches'):
-            self._load_zoom_patches()
+        self._ensure_zoom_patches()
         return self._cache.get('zoom_patches', {}).get(bank_letter, [])
 
-    def _load_zoom_patches(self):
-        """Recarrega patches da Zoom do banco para o cache"""
+    def _ensure_zoom_patches(self):
+        """Carrega os patches da Zoom na primeira leitura"""
+        if 'zoom_patches' not in self._cache:
+            with self._lock:
+                if 'zoom_patches' not in self._cache:
+                    self._load_zoom_patches()
+
+    def _load_zoom_patches(self) -> bool:
+        """Recarrega patches da Zoom do banco para o cache (True se mudaram)"""
         db = get_db()
         if not db:
             self.logger.error("Banco de dados não disponível para recarregar zoom_patches")
-            return
+            return False
+        self._db_seen['zoom_patches'] = self._db_version('zoom_patches')
         zoom_patches = {}
-        for bank_letter in ['A','B','C','D','E','F','G','H','I','J']:
+        for bank_letter in self.ZOOM_BANK_LETTERS:
             zoom_patches[bank_letter] = db.get_zoom_patches_by_bank(bank_letter)
+        fingerprints = db.get_zoom_bank_fingerprints()
+        if (zoom_patches, fingerprints) == (self._cache.get('zoom_patches'), self._cache.get('zoom_fingerprints')):
+            return False
         self._cache['zoom_patches'] = zoom_patches
-        self._cache_timestamps['zoom_patches'] = datetime.now()
+        self._cache['zoom_fingerprints'] = fingerprints
+        self.bump_version('zoom_patches')
         self.logger.info("Patches da Zoom recarregados no cache")
+        return True
+
+    def set_zoom_bank_patches(self, bank_letter: str, patches: list):
+        """Atualiza no cache os patches da Zoom de um banco já salvo no banco de dados"""
+        with self._lock:
+            self._ensure_zoom_patches()
+            self._cache.setdefault('zoom_patches', {})[bank_letter] = [
+                {'number': patch['number'], 'name': patch['name']} for patch in patches
+            ]
+            self.bump_version('zoom_patches')
+
+    @staticmethod
+    def zoom_bank_checksum(patches: list) -> str:
+        """Checksum dos nomes de um banco da Zoom (ordem por número)"""
+        names = '\x00'.join(f"{patch['number']}:{patch['name']}" for patch in sorted(patches, key=lambda p: p['number']))
+        return f"{zlib.crc32(names.encode('utf-8')):08x}"
+    
+    def is_zoom_bank_current(self, bank_letter: str, fingerprint: Optional[str], first_name: Optional[str]) -> bool:
+        """True se o banco já foi lido deste mesmo pedal e o nome do primeiro patch (sonda) não mudou"""
+        if not fingerprint or not first_name:
+            return False
+        self._ensure_zoom_patches()
+        stored = self._cache.get('zoom_fingerprints', {}).get(bank_letter)
+        patches = self._cache.get('zoom_patches', {}).get(bank_letter)
+        if not (stored and stored[0] == fingerprint and patches):
+            return False
+        first = min(patches, key=lambda patch: patch['number'])
+        return first['number'] == 0 and first['name'] == first_name
+    
+    def store_zoom_bank(self, bank_letter: str, patches: list, fingerprint: Optional[str], force: bool = False) -> bool:
+        """Grava um banco lido do pedal só se identidade ou checksum mudaram (True se gravou)"""
+        checksum = self.zoom_bank_checksum(patches)
+        self._ensure_zoom_patches()
+        stored = self._cache.get('zoom_fingerprints', {}).get(bank_letter)
+        if not force and stored == (fingerprint, checksum):
+            return False
+        db = get_db()
+        if not db:
+            self.logger.error("Banco de dados não disponível para salvar zoom_patches")
+            return False
+        with self._lock:
+            # Linhas alteradas: as do banco substituído, as novas e o fingerprint
+            rows = len(self._cache.get('zoom_patches', {}).get(bank_letter, [])) + len(patches)
+            before = self._db_version('zoom_patches')
+            db.save_zoom_bank_patches(bank_letter, patches)
+            if fingerprint:
+                db.save_zoom_bank_fingerprint(bank_letter, fingerprint, checksum)
+                self._cache.setdefault('zoom_fingerprints', {})[bank_letter] = (fingerprint, checksum)
+                rows += 1
+            self.set_zoom_bank_patches(bank_letter, patches)
+            self._mark_own_write('zoom_patches', before, rows)
+        self.logger.info(f"Banco {bank_letter} da Zoom atualizado (checksum {checksum})")
+        return True
 
     def update_zoom_patches_cache(self):
         """Atualiza o cache dos patches da Zoom (deve ser chamado após atualizar o banco)"""
         with self._lock:
-            self._load_zoom_patches() 
\ No newline at end of file
+            self._load_zoom_patches() 
+
+    def start_watching(self, interval: Optional[float] = None):
+        """Inicia a thread que detecta gravações de outros processos no banco"""
+        if self._watch_thread:
+            return
+        db = get_db()
+        if not db or db.db_path == ':memory:':
+            return
+        if interval:
+            self.poll_interval = interval
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch_loop, args=(db.db_path,),
+                                              name="cache-db-watcher", daemon=True)
+        self._watch_thread.start()
+        self.logger.info(f"Monitor de alterações do banco iniciado (a cada {self.poll_interval:.1f} s)")
+
+    def stop_watching(self):
+        """Para a thread de monitoramento do banco"""
+        self._watch_stop.set()
+        self._watch_thread = None
+
+    def _watch_loop(self, db_path: str):
+        """Consulta PRAGMA data_version numa conexão própria: o valor muda quando outra conexão grava"""
+        try:
+            conn = sqlite3.connect(db_path)
+        except Exception as e:
+            self.logger.error(f"Erro ao abrir conexão de monitoramento do banco: {str(e)}")
+            self._watch_thread = None
+            return
+        last_version = None
+        try:
+            while True:
+                try:
+                    version = conn.execute('PRAGMA data_version').fetchone()[0]
+                    self._watch_stats['checks'] += 1
+                    if last_version is None:
+                        # Primeira leitura: referência para as próximas
+                        with self._lock:
+                            self._db_seen['banks'] = self._db_version('banks')
+                            self._banks_seen = self._read_banks()
+                    elif version != last_version:
+                        self.reload_changed()
+                    last_version = version
+                except Exception as e:
+                    self.logger.error(f"Erro ao verificar alterações no banco: {str(e)}")
+                if self._watch_stop.wait(self.poll_interval):
+                    return
+        finally:
+            conn.close()
+
+    def reload_changed(self) -> List[str]:
+        """Relê do banco só as coleções cujo contador de alterações andou (retorna as que mudaram)"""
+        db = get_db()
+        if not db:
+            return []
+        changed = []
+        with self._lock:
+            # Escritas deste processo já aplicadas ao cache avançaram _db_seen: nada a reler
+            versions = db.get_table_versions()
+            stale = {name for name, version in versions.items() if version != self._db_seen.get(name)}
+            if 'patches' in stale and self._load_patches():
+                changed.append('patches')
+            # Patches da Zoom ainda não lidos serão carregados do banco na primeira consulta
+            if 'zoom_patches' in stale and 'zoom_patches' in self._cache and self._load_zoom_patches():
+                changed.append('zoom_patches')
+        if 'banks' in stale and self.banks_changed():
+            changed.append('banks')
+        if changed:
+            self._watch_stats['external_changes'] += 1
+            self._watch_stats['last_change'] = datetime.now().isoformat()
+            self.logger.info(f"Alterações externas no banco recarregadas no cache: {', '.join(changed)}")
+        return changed
+
+    def _db_version(self, collection: str) -> Optional[int]:
+        """Contador de alterações atual de uma coleção no banco"""
+        db = get_db()
+        return db.get_table_versions().get(collection) if db else None
+
+    def _mark_own_write(self, collection: str, before: Optional[int], rows: int):
+        """Marca como já vista uma escrita deste processo aplicada ao cache (chamar com _lock).
+
+        Só vale se o contador andou exatamente as linhas gravadas a partir do último
+        estado visto; qualquer escrita alheia no meio deixa a releitura para o monitor.
+        """
+        if before is None or before != self._db_seen.get(collection):
+            return
+        after = self._db_version(collection)
+        if after == before + rows:
+            self._db_seen[collection] = after
+
+    def add_banks_listener(self, callback):
+        """Registra callback chamado (sem argumentos) após cada alteração nos bancos de mapeamento"""
+        self._bank_listeners.append(callback)
+
+    def banks_changed(self) -> bool:
+        """Compara os bancos com o último estado visto; se mudaram, incrementa a versão e notifica (True).
+
+        Chamado pelas rotas após gravar e pelo monitor do banco: quem chegar
+        primeiro publica a alteração, o outro não encontra diferença.
+        """
+        with self._lock:
+            self._db_seen['banks'] = self._db_version('banks')
+            banks = self._read_banks()
+            if banks is None or banks == self._banks_seen:
+                return False
+            self._banks_seen = banks
+            self.bump_version('banks')
+        for callback in self._bank_listeners:
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error(f"Erro ao notificar alteração de bancos: {str(e)}")
+        return True
+
+    def _read_banks(self) -> Optional[List[Dict]]:
+        """Bancos de mapeamento como estão no banco de dados (só para detectar mudanças)"""
+        db = get_db()
+        if not db:
+            return None
+        return [bank.to_dict() for bank in db.get_all_banks()]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Snapshot imutável da coleção de patches
+"""
+
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, NamedTuple, Optional, Tuple
+
+from app.midi.patch_plan import PatchPlan, compile_patch_plan
+
+class PatchSnapshot(NamedTuple):
+    """Coleção de patches com índices e planos, publicada de uma só vez.
+
+    Nada aqui é alterado depois de montado: quem escreve monta um snapshot
+    novo e troca a referência, então quem lê vê sempre um estado completo
+    sem precisar de lock. Os dicionários dos patches são compartilhados
+    entre snapshots e tratados como somente leitura (copie antes de alterar).
+    """
+    patches: Tuple[Dict, ...]
+    by_id: Mapping[int, Dict]
+    indexes: Mapping[str, Mapping[tuple, Tuple[Dict, ...]]]
+    plans: Mapping[int, PatchPlan]
+
+def index_key(values: Iterable) -> tuple:
+    """Chave de índice normalizada: números gravados como texto ('3') valem como inteiros"""
+    return tuple(int(value) if isinstance(value, str) and value.strip().isdigit() else value
+                 for value in values)
+
+def build_snapshot(patches: Iterable[Dict], index_fields: Dict[str, tuple],
+                   previous: Optional[PatchSnapshot] = None) -> PatchSnapshot:
+    """Monta um snapshot; planos de patches que não mudaram são reaproveitados do anterior"""
+    patches = tuple(patches)
+    indexes = {name: {} for name in index_fields}
+    plans = {}
+    previous_plans = previous.plans if previous else {}
+    for patch in patches:
+        for name, fields in index_fields.items():
+            key = index_key(patch.get(field) for field in fields)
+            indexes[name].setdefault(key, []).append(patch)
+        plan = previous_plans.get(patch['id'])
+        if plan is None or plan.source is not patch:
+            plan = compile_patch_plan(patch)
+        if plan:
+            plans[patch['id']] = plan
+    return PatchSnapshot(
+        patches=patches,
+        by_id=MappingProxyType({patch['id']: patch for patch in patches}),
+        indexes=MappingProxyType({
+            name: MappingProxyType({key: tuple(matches) for key, matches in entries.items()})
+            for name, entries in indexes.items()
+        }),
+        plans=MappingProxyType(plans)
+    )
@@ -33,6 +33,27 @@ class Config:
         'chocolate': 'Chocolate MIDI'
     }
     
+    # Cadência da fila de transmissão do Zoom G3X (segundos após cada mensagem)
+    ZOOM_PC_DELAY = 0.1   # Tempo para o pedal processar a troca de patch
+    ZOOM_CC_DELAY = 0.05  # Pausa entre comandos CC de efeitos
+    ZOOM_SYSEX_TIMEOUT = 0.5  # Espera máxima por resposta SysEx do pedal
+    ZOOM_SYSEX_MAX_IN_FLIGHT = 4  # Requisições SysEx pendentes ao mesmo tempo na leitura de nomes
+    
+    # Backends do mido testados na inicialização para escolher a estratégia de envio por porta
+    MIDI_BACKEND_CANDIDATES = [
+        'mido.backends.rtmidi/LINUX_ALSA',
+        'mido.backends.rtmidi',
+        'mido.backends.portmidi',
+        'mido.backends.pygame'
+    ]
+    MIDI_BACKEND_PROBE_SAMPLES = 5  # Envios medidos por backend
+    
+    # CCs recebidos por segundo, por (canal, controle), antes de agrupar (0 desativa)
+    MIDI_CC_COALESCE_RATE = 50
+    
+    # Espera máxima (s) por um comando no actor de uma porta de saída (a entrada MIDI nunca espera)
+    MIDI_DEVICE_CALL_TIMEOUT = 5.0
+    
     # Configurações Bluetooth
     BLUETOOTH_ENABLED = True
     CHOCOLATE_BT_NAME = 'Chocolate MIDI'
@@ -40,7 +61,8 @@ class Config:
     
     # Configurações de cache
     CACHE_ENABLED = True
-    CACHE_TIMEOUT = 300  # 5 minutos
+    CACHE_POLL_INTERVAL = 1.0  # Segundos entre verificações de gravações externas no banco (PRAGMA data_version)
+    API_GZIP_MIN_BYTES = 1024  # Respostas JSON em cache a partir deste tamanho também ficam em gzip (0 desativa)
     
     # Configurações de patches
     MAX_PATCHES = 100
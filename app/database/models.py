@@ -258,7 +258,14 @@ class Bank:
 
 class DatabaseManager:
     """Gerenciador do banco de dados"""
-    
+
+    # Tabelas que alimentam cada coleção do cache
+    VERSIONED_TABLES = {
+        'patches': ('patches',),
+        'zoom_patches': ('zoom_patches', 'zoom_bank_fingerprints'),
+        'banks': ('banks', 'bank_mappings'),
+    }
+
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.init_tables()
@@ -358,8 +365,45 @@ class DatabaseManager:
                 )
             ''')
             
+            # Identidade do pedal e checksum dos nomes de cada banco lido
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS zoom_bank_fingerprints (
+                    bank TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    checksum TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+
+            # Contador de alterações por coleção do cache, mantido por triggers (uma unidade por linha):
+            # o monitor do cache só relê a coleção cujo contador andou
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS table_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            for collection, tables in self.VERSIONED_TABLES.items():
+                cursor.execute('INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)', (collection,))
+                for table in tables:
+                    for event in ('INSERT', 'UPDATE', 'DELETE'):
+                        cursor.execute(f'''
+                            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+                            AFTER {event} ON {table}
+                            BEGIN
+                                UPDATE table_versions SET version = version + 1 WHERE name = '{collection}';
+                            END
+                        ''')
+
             conn.commit()
-    
+
+    def get_table_versions(self) -> Dict[str, int]:
+        """Retorna {coleção: contador de alterações} das tabelas monitoradas pelo cache"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name, version FROM table_versions')
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
     def create_patch(self, patch: Patch) -> int:
         """Cria um novo patch"""
         with sqlite3.connect(self.db_path) as conn:
@@ -381,64 +425,48 @@ class DatabaseManager:
             conn.commit()
             return cursor.lastrowid
     
+    @staticmethod
+    def _patch_from_row(row: sqlite3.Row) -> Patch:
+        """Monta o Patch pelo nome das colunas (bancos antigos têm zoom_bank_letter no fim da tabela)"""
+        return Patch(
+            id=row['id'],
+            name=row['name'],
+            effects=json.loads(row['effects']),
+            input_device=row['input_device'],
+            input_channel=row['input_channel'],
+            output_device=row['output_device'],
+            command_type=row['command_type'],
+            zoom_bank=row['zoom_bank'],
+            zoom_patch=row['zoom_patch'],
+            zoom_bank_letter=row['zoom_bank_letter'],
+            program=row['program'],
+            cc=row['cc'],
+            value=row['value'],
+            note=row['note'],
+            velocity=row['velocity'],
+            created_at=row['created_at'],
+            updated_at=row['updated_at']
+        )
+    
     def get_patch(self, patch_id: int) -> Optional[Patch]:
         """Obtém um patch por ID"""
         with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM patches WHERE id = ?', (patch_id,))
             row = cursor.fetchone()
             
             if row:
-                return Patch(
-                    id=row[0],
-                    name=row[1],
-                    effects=json.loads(row[2]),
-                    input_device=row[3],
-                    input_channel=row[4],
-                    output_device=row[5],
-                    command_type=row[6],
-                    zoom_bank=row[7],
-                    zoom_patch=row[8],
-                    program=row[9],
-                    cc=row[10],
-                    value=row[11],
-                    note=row[12],
-                    velocity=row[13],
-                    created_at=row[14],
-                    updated_at=row[15],
-                    zoom_bank_letter=row[16]
-                )
+                return self._patch_from_row(row)
             return None
     
     def get_all_patches(self) -> List[Patch]:
         """Obtém todos os patches"""
         with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM patches ORDER BY name')
-            rows = cursor.fetchall()
-            
-            patches = []
-            for row in rows:
-                patches.append(Patch(
-                    id=row[0],
-                    name=row[1],
-                    effects=json.loads(row[2]),
-                    input_device=row[3],
-                    input_channel=row[4],
-                    output_device=row[5],
-                    command_type=row[6],
-                    zoom_bank=row[7],
-                    zoom_patch=row[8],
-                    program=row[9],
-                    cc=row[10],
-                    value=row[11],
-                    note=row[12],
-                    velocity=row[13],
-                    created_at=row[14],
-                    updated_at=row[15],
-                    zoom_bank_letter=row[16]
-                ))
-            return patches
+            return [self._patch_from_row(row) for row in cursor.fetchall()]
     
     def update_patch(self, patch: Patch, partial_data: dict = None) -> bool:
         """Atualiza um patch, preservando campos não enviados (merge). Adiciona logs detalhados."""
@@ -719,6 +747,35 @@ class DatabaseManager:
                 ))
             conn.commit()
 
+    def save_zoom_bank_patches(self, bank: str, patches: list):
+        """Salva (substitui) os patches da Zoom de um único banco"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM zoom_patches WHERE bank = ?', (bank,))
+            now = datetime.now().isoformat()
+            cursor.executemany('''
+                INSERT INTO zoom_patches (bank, number, name, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', [(bank, patch['number'], patch['name'], patch.get('updated_at') or now) for patch in patches])
+            conn.commit()
+
+    def get_zoom_bank_fingerprints(self) -> dict:
+        """Retorna {banco: (fingerprint, checksum)} dos bancos da Zoom já lidos"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT bank, fingerprint, checksum FROM zoom_bank_fingerprints')
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    
+    def save_zoom_bank_fingerprint(self, bank: str, fingerprint: str, checksum: str):
+        """Registra a identidade do pedal e o checksum de um banco da Zoom"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO zoom_bank_fingerprints (bank, fingerprint, checksum, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', (bank, fingerprint, checksum, datetime.now().isoformat()))
+            conn.commit()
+
     def get_zoom_patches_by_bank(self, bank: str) -> list:
         """Retorna todos os patches da Zoom para um banco (letra)"""
         with sqlite3.connect(self.db_path) as conn:
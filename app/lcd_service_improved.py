@@ -44,6 +44,7 @@ class LCDServiceImproved:
         self.bank_name = "Inicializando..."
         self.last_commands = []
         self.api_base_url = "http://localhost:5000/api"
+        self.last_midi_seq = None  # Cursor próprio no buffer de comandos recebidos
         self.chocolate_connected = False
         self.zoom_connected = False
         self.animation_frame = 0
@@ -384,9 +385,12 @@ class LCDServiceImproved:
     def get_midi_commands(self):
         """Obtém comandos MIDI recebidos da API"""
         try:
-            response = requests.get(f"{self.api_base_url}/midi/commands/received", timeout=2)
+            params = {'after': self.last_midi_seq} if self.last_midi_seq is not None else {'sync': 1}
+            response = requests.get(f"{self.api_base_url}/midi/commands/received", params=params, timeout=2)
             if response.status_code == 200:
                 data = response.json()
+                if data.get('success'):
+                    self.last_midi_seq = data.get('last_seq', self.last_midi_seq)
                 if data.get('success') and data.get('commands'):
                     return data['commands']
             return []
@@ -55,6 +55,15 @@ def create_app(config_name=None):
         
         # Carrega dados iniciais no cache
         cache_manager.load_all_data()
+        cache_manager.start_watching(config[config_name].CACHE_POLL_INTERVAL)
+        
+        # Permite ao controlador MIDI ativar patches diretamente (sem HTTP)
+        midi_controller.set_cache_manager(cache_manager)
+        
+        # Compila os mapeamentos do banco ativo e recompila a cada alteração nos bancos
+        # (rotas deste processo ou gravações de outro processo detectadas pelo cache)
+        midi_controller.reload_bank_mappings(db_manager)
+        cache_manager.add_banks_listener(lambda: midi_controller.reload_bank_mappings(db_manager))
         
         # Registra blueprints
         from app.api.routes import api_bp
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Escolha do backend do mido por porta de saída
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.config import Config
+
+class BackendProber:
+    """Mede abertura e envio de cada backend do mido disponível para uma porta.
+
+    Cada backend candidato que enxerga a porta é aberto e recebe algumas
+    mensagens Active Sensing (0xFE, que os pedais ignoram e não respondem,
+    então nada chega ao correlacionador de SysEx); o vencedor é o de menor tempo médio de envio, com a abertura como
+    desempate. O resultado é guardado pelo MIDIController em
+    midi_config.json e só é refeito quando um envio falha.
+    """
+
+    def __init__(self, candidates: List[str] = None, samples: int = None):
+        self.logger = logging.getLogger(__name__)
+        self.candidates = candidates or Config.MIDI_BACKEND_CANDIDATES
+        self.samples = samples or Config.MIDI_BACKEND_PROBE_SAMPLES
+
+    def probe(self, port_name: str) -> Optional[Dict]:
+        """Testa os backends para a porta e retorna a estratégia vencedora (None se nenhum abrir).
+
+        Quem chama deve fechar antes o handle do pool para a mesma porta.
+        """
+        results = [result for result in (self._measure(name, port_name) for name in self.candidates) if result]
+        if not results:
+            self.logger.warning(f"Nenhum backend MIDI conseguiu abrir {port_name}")
+            return None
+        best = min(results, key=lambda result: (result['send_ms'], result['open_ms']))
+        self.logger.info(
+            f"Backend escolhido para {port_name}: {best['backend']} "
+            f"(abertura {best['open_ms']:.2f} ms, envio {best['send_ms']:.3f} ms, {len(results)} testados)"
+        )
+        return dict(best, probed_at=time.time(), candidates=results)
+
+    def _measure(self, backend_name: str, port_name: str) -> Optional[Dict]:
+        """Abre a porta com o backend e mede abertura e envio"""
+        port = None
+        try:
+            import mido
+            backend = mido.Backend(backend_name, load=True)
+            if port_name not in backend.get_output_names():
+                return None
+            message = mido.Message('active_sensing')
+            
+            started = time.perf_counter()
+            port = backend.open_output(port_name)
+            open_ms = (time.perf_counter() - started) * 1000
+            
+            started = time.perf_counter()
+            for _ in range(self.samples):
+                port.send(message)
+            send_ms = (time.perf_counter() - started) * 1000 / self.samples
+            return {'backend': backend_name, 'open_ms': open_ms, 'send_ms': send_ms}
+        except Exception as e:
+            self.logger.debug(f"Backend {backend_name} indisponível para {port_name}: {str(e)}")
+            return None
+        finally:
+            if port:
+                try:
+                    port.close()
+                except Exception:
+                    pass
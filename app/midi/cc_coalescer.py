@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Agrupamento de Control Change contínuos (último valor vence)
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict
+
+class CCCoalescer:
+    """Limita a taxa de CCs recebidos por controle, sempre entregando o valor final.
+
+    A chave é (canal, controle). A primeira mensagem de um controle parado é
+    encaminhada na hora; as que chegam antes de passar 1/max_rate segundos
+    ficam pendentes e cada nova substitui a anterior (suprimida). Uma thread
+    entrega o valor pendente assim que o intervalo vence, então o último
+    valor de uma varredura de pedal de expressão nunca se perde. Mensagens
+    de controles diferentes não esperam umas pelas outras. flush(canal)
+    entrega na hora os pendentes do canal, para que uma mensagem não agrupada
+    (PC, nota) nunca passe à frente de um CC recebido antes dela.
+    """
+
+    def __init__(self, forward: Callable, max_rate: float):
+        self.logger = logging.getLogger(__name__)
+        self._forward = forward
+        self.interval = 1.0 / max_rate
+        self._cond = threading.Condition()
+        # Serializa as entregas: o que a thread já retirou sai antes de um flush
+        self._deliver_lock = threading.Lock()
+        self._last = {}     # (canal, controle) -> instante do último encaminhamento
+        self._pending = {}  # (canal, controle) -> (mensagem, prazo)
+        self._running = True
+        self._thread = None
+        self._stats = {'received': 0, 'forwarded': 0, 'suppressed': 0, 'delayed': 0}
+
+    def submit(self, message):
+        """Encaminha o CC agora ou guarda como pendente (último valor vence)"""
+        key = (message.channel, message.control)
+        now = time.monotonic()
+        with self._cond:
+            self._stats['received'] += 1
+            last = self._last.get(key)
+            if key not in self._pending and (last is None or now - last >= self.interval):
+                self._last[key] = now
+                self._stats['forwarded'] += 1
+                forward_now = True
+            else:
+                pending = self._pending.get(key)
+                if pending:
+                    # Valor intermediário substituído antes de ser entregue
+                    self._stats['suppressed'] += 1
+                    deadline = pending[1]
+                else:
+                    deadline = last + self.interval
+                self._pending[key] = (message, deadline)
+                self._ensure_thread()
+                self._cond.notify()
+                forward_now = False
+        if forward_now:
+            self._forward(message)
+
+    def flush(self, channel: int):
+        """Entrega agora (na thread do chamador) os CCs pendentes do canal"""
+        with self._deliver_lock:
+            with self._cond:
+                keys = [key for key in self._pending if key[0] == channel]
+                if not keys:
+                    return
+                now = time.monotonic()
+                messages = []
+                for key in keys:
+                    messages.append(self._pending.pop(key)[0])
+                    self._last[key] = now
+                self._stats['forwarded'] += len(messages)
+                self._stats['delayed'] += len(messages)
+            self._deliver(messages)
+    
+    def stop(self):
+        """Entrega os valores pendentes e encerra a thread"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def get_stats(self) -> Dict:
+        """Retorna mensagens recebidas, encaminhadas e suprimidas"""
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending), max_rate=1.0 / self.interval)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="midi-cc-coalescer", daemon=True)
+            self._thread.start()
+
+    def _deliver(self, messages):
+        for message in messages:
+            try:
+                self._forward(message)
+            except Exception as e:
+                self.logger.error(f"Erro ao entregar CC agrupado: {str(e)}")
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if self._pending:
+                        wait = min(deadline for _, deadline in self._pending.values()) - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            # Um flush concorrente espera esta entrega (e vice-versa)
+            with self._deliver_lock:
+                with self._cond:
+                    now = time.monotonic()
+                    due = [key for key, (_, deadline) in self._pending.items() if deadline <= now or not self._running]
+                    messages = []
+                    for key in due:
+                        messages.append(self._pending.pop(key)[0])
+                        self._last[key] = now
+                    self._stats['forwarded'] += len(messages)
+                    self._stats['delayed'] += len(messages)
+                    running = self._running
+                self._deliver(messages)
+            if not running:
+                return
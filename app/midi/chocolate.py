@@ -7,6 +7,8 @@ import logging
 import mido
 from typing import Dict, Optional
 
+from app.midi.raw_send import write_raw
+
 class ChocolateController:
     """Controlador específico para Chocolate MIDI"""
     
@@ -14,6 +16,14 @@ class ChocolateController:
         self.logger = logging.getLogger(__name__)
         self.port = None
         self.connected = False
+        self.device_name = None
+        self.send_listener = None  # Chamado após cada port.send (medição de latência)
+        # Hooks do pool de portas do MIDIController (opcionais)
+        self.port_opener = None
+        self.port_closer = None
+        self.port_sender = None
+        self.raw_sender = None  # (bytes, porta) -> bool
+        self.port_lister = None  # Portas de saída do snapshot do MIDIController
         
         self.logger.info("Controlador Chocolate MIDI inicializado")
     
@@ -24,7 +34,7 @@ class ChocolateController:
             self.logger.info(f"📋 Verificando se a porta existe...")
             
             # Verifica se a porta existe antes de tentar conectar
-            available_outputs = mido.get_output_names()
+            available_outputs = self.port_lister() if self.port_lister else mido.get_output_names()
             self.logger.info(f"📋 Portas de saída disponíveis: {available_outputs}")
             
             if port_name not in available_outputs:
@@ -32,8 +42,11 @@ class ChocolateController:
                 return False
             
             self.logger.info(f"✅ Porta {port_name} encontrada, tentando abrir...")
-            self.port = mido.open_output(port_name)
+            self.port = self.port_opener(port_name) if self.port_opener else mido.open_output(port_name)
+            if self.port is None:
+                raise IOError(f"Não foi possível abrir a porta {port_name}")
             self.connected = True
+            self.device_name = port_name
             self.logger.info(f"✅ Chocolate MIDI conectado na porta: {port_name}")
             return True
             
@@ -42,11 +55,40 @@ class ChocolateController:
             self.logger.error(f"❌ Tipo do erro: {type(e).__name__}")
             return False
     
+    def _send(self, message):
+        """Envia pela porta do pool (reabre se preciso) ou diretamente pela porta local"""
+        if self.port_sender and self.device_name:
+            if not self.port_sender(message, self.device_name):
+                raise IOError(f"Falha ao enviar para {self.device_name}")
+            # self.port é atualizada pelo MIDIController quando o pool reabre a porta
+            return
+        self.port.send(message)
+        if self.send_listener:
+            self.send_listener()
+    
+    def send_raw(self, data) -> bool:
+        """Envia uma mensagem MIDI completa já em bytes (sem montar nem validar mido.Message)"""
+        try:
+            if not self.connected:
+                return False
+            if self.raw_sender and self.device_name:
+                return self.raw_sender(data, self.device_name)
+            write_raw(self.port, data)
+            if self.send_listener:
+                self.send_listener()
+            return True
+        except Exception as e:
+            self.logger.error(f"Erro ao enviar bytes MIDI: {str(e)}")
+            return False
+    
     def disconnect(self):
         """Desconecta do Chocolate MIDI"""
         try:
             if self.port:
-                self.port.close()
+                if self.port_closer and self.device_name:
+                    self.port_closer(self.device_name)
+                else:
+                    self.port.close()
                 self.port = None
                 self.connected = False
                 self.logger.info("Chocolate MIDI desconectado")
@@ -61,7 +103,7 @@ class ChocolateController:
                 return False
             
             message = mido.Message('note_on', channel=channel, note=note, velocity=velocity)
-            self.port.send(message)
+            self._send(message)
             
             self.logger.debug(f"Note On enviado: Channel={channel}, Note={note}, Velocity={velocity}")
             return True
@@ -77,7 +119,7 @@ class ChocolateController:
                 return False
             
             message = mido.Message('note_off', channel=channel, note=note)
-            self.port.send(message)
+            self._send(message)
             
             self.logger.debug(f"Note Off enviado: Channel={channel}, Note={note}")
             return True
@@ -93,7 +135,7 @@ class ChocolateController:
                 return False
             
             message = mido.Message('control_change', channel=channel, control=cc, value=value)
-            self.port.send(message)
+            self._send(message)
             
             self.logger.debug(f"CC enviado: Channel={channel}, CC={cc}, Value={value}")
             return True
@@ -109,7 +151,7 @@ class ChocolateController:
                 return False
             
             message = mido.Message('program_change', channel=channel, program=program)
-            self.port.send(message)
+            self._send(message)
             
             self.logger.debug(f"PC enviado: Channel={channel}, Program={program}")
             return True
@@ -125,7 +167,7 @@ class ChocolateController:
                 return False
             
             message = mido.Message('sysex', data=data)
-            self.port.send(message)
+            self._send(message)
             
             self.logger.debug(f"SysEx enviado: {data}")
             return True
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Buffer circular de comandos MIDI recebidos
+"""
+
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Registro compacto: (seq, tipo, canal, dado1, dado2, timestamp)
+# dado1/dado2 = note/velocity, cc/value ou program/None conforme o tipo
+_DATA_FIELDS = {
+    'note_on': ('note', 'velocity'),
+    'note_off': ('note', 'velocity'),
+    'control_change': ('cc', 'value'),
+    'cc': ('cc', 'value'),
+    'program_change': ('program', None),
+    'pc': ('program', None),
+}
+
+class CommandRingBuffer:
+    """Buffer circular pré-alocado com números de sequência crescentes.
+
+    A escrita (callback MIDI) não usa lock: reserva a sequência com um
+    contador atômico, grava o slot e publica a nova cabeça. Cada leitor
+    guarda a última sequência vista e pede apenas o que veio depois dela,
+    então vários consumidores podem ler sem consumir os comandos dos outros.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._counter = itertools.count(1)
+        self._head = 0   # Última sequência publicada
+        self._floor = 0  # Sequências <= floor foram descartadas (clear)
+
+    def append(self, command: Dict) -> int:
+        """Adiciona um comando e retorna sua sequência"""
+        fields = _DATA_FIELDS.get(command.get('type'), (None, None))
+        seq = next(self._counter)
+        self._slots[seq % self.capacity] = (
+            seq,
+            command.get('type'),
+            command.get('channel', 0),
+            command.get(fields[0]) if fields[0] else None,
+            command.get(fields[1]) if fields[1] else None,
+            command.get('timestamp') or time.time()
+        )
+        if seq > self._head:
+            self._head = seq
+        return seq
+
+    def read(self, after_seq: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Retorna (comandos com seq > after_seq, última sequência publicada)"""
+        head = self._head
+        start = max(after_seq or 0, self._floor, head - self.capacity) + 1
+        commands = []
+        for seq in range(start, head + 1):
+            record = self._slots[seq % self.capacity]
+            # Slot sobrescrito ou ainda não gravado por um escritor concorrente
+            if record is None or record[0] != seq:
+                continue
+            commands.append(self._to_dict(record))
+        return commands, head
+
+    def clear(self):
+        """Descarta os comandos atuais sem invalidar os cursores dos leitores"""
+        self._floor = self._head
+
+    def __len__(self) -> int:
+        return self._head - max(self._floor, self._head - self.capacity)
+
+    @staticmethod
+    def _to_dict(record) -> Dict:
+        seq, command_type, channel, data1, data2, timestamp = record
+        command = {
+            'seq': seq,
+            'type': command_type,
+            'channel': channel,
+            'timestamp': timestamp
+        }
+        fields = _DATA_FIELDS.get(command_type)
+        if fields:
+            command[fields[0]] = data1
+            if fields[1]:
+                command[fields[1]] = data2
+        return command
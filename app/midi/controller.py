@@ -7,14 +7,25 @@ import logging
 import threading
 import time
 import json
+import math
 import os
 import atexit
-from typing import Dict, List, Optional
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
 import mido
 
 from app.config import Config
 from app.midi.zoom_g3x import ZoomG3XController
 from app.midi.chocolate import ChocolateController
+from app.midi.command_buffer import CommandRingBuffer
+from app.midi.device_state import DeviceStateMirror
+from app.midi.zoom_dump import ZoomPatchDump, PATCHES_PER_BANK as ZOOM_PATCHES_PER_BANK
+from app.midi.port_watcher import PortWatcher, port_base_name
+from app.midi.backend_probe import BackendProber
+from app.midi.latency_metrics import LatencyMetrics
+from app.midi.device_actor import DeviceActor
+from app.midi.raw_send import write_raw
+from app.midi.cc_coalescer import CCCoalescer
 
 class MIDIController:
     """Controlador principal MIDI"""
@@ -42,9 +53,65 @@ class MIDIController:
         
         self.chocolate_patches = []
         
+        # Comandos MIDI recebidos (buffer circular com números de sequência)
+        self._received_commands = CommandRingBuffer()
+        
+        # Agrupamento de CCs contínuos (pedal de expressão) antes do processamento.
+        # CCs com mapeamento de valor específico (footswitches) nunca são agrupados
+        self.cc_coalescer = None
+        self._discrete_ccs = frozenset()  # (canal, controle)
+        # Serializa o processamento: callbacks das portas e a thread do agrupador
+        self._input_lock = threading.RLock()
+        self._configure_cc_coalescing()
+        
+        # Tabela compilada dos mapeamentos do banco ativo:
+        # (tipo, canal, controle, valor) -> (ordem, BankMapping)
+        self._bank_dispatch = {}
+        
+        # Gerenciador de cache (injetado pela aplicação) para ativação direta de patches
+        self.cache_manager = None
+        
+        # Medição de latência da ativação via entrada MIDI (callback → port.send)
+        self._activation_trace = threading.local()  # .t0: ativação em andamento na thread
+        self._input_context = threading.local()  # .active: processando uma mensagem de entrada
+        self._activation_stats = {'count': 0, 'last_ms': None, 'max_ms': None, 'total_ms': 0.0}
+        # Histogramas por etapa (lookup, enqueue, send) e dispositivo
+        self.latency_metrics = LatencyMetrics()
+        
         # Pool de conexões MIDI para evitar múltiplas aberturas
         self._midi_connections = {}
+        self._connection_stats = {}
         self._connection_lock = threading.Lock()
+        self._open_locks = {}  # Uma abertura lenta não trava as outras portas
+        
+        # Uma thread (actor) por porta de saída executa os envios daquele dispositivo
+        self._device_actors = {}
+        
+        # Backend do mido escolhido por porta de saída (guardado em midi_config.json)
+        self.backend_prober = BackendProber()
+        
+        # Último estado conhecido de cada porta de saída (programa e CCs enviados)
+        self._device_states = {}
+        
+        # Listeners por porta de entrada (monitoramento, respostas SysEx do Zoom)
+        self._input_listeners = {}
+        
+        # Último job de leitura dos nomes de patches da Zoom
+        self.zoom_patch_dump = None
+        
+        # Snapshot versionado das portas disponíveis (única fonte de enumeração do ALSA)
+        self.port_watcher = PortWatcher()
+        self._available_ports = {'inputs': [], 'outputs': [], 'version': 0}
+        
+        # Portas do pool que sumiram (queda USB) aguardando recuperação, por nome sem cliente:porta
+        self._dropouts = {}
+        self._recovering = set()
+        self._dropout_lock = threading.Lock()  # Monitor de portas e actors registram/recuperam quedas
+        self._recovery_stats = {'dropouts': 0, 'recoveries': 0, 'last_ms': None, 'max_ms': None, 'last_port': None}
+        
+        # Tabela de rotas de saída: nome amigável ou real -> (porta real, controlador, tipo)
+        self._output_routes = {}
+        self._rebuild_output_routes()
         
         # Registra cleanup automático
         atexit.register(self.cleanup)
@@ -58,6 +125,9 @@ class MIDIController:
             
             # Para monitoramento
             self.stop_midi_input_monitoring()
+            self.port_watcher.stop()
+            if self.cc_coalescer:
+                self.cc_coalescer.stop()
             
             # Desconecta controladores específicos
             if self.zoom_g3x:
@@ -65,6 +135,9 @@ class MIDIController:
             if self.chocolate:
                 self.chocolate.disconnect()
             
+            for actor in list(self._device_actors.values()):
+                actor.stop()
+            
             # Fecha todas as conexões do pool
             with self._connection_lock:
                 for port_name, port in self._midi_connections.items():
@@ -100,37 +173,81 @@ class MIDIController:
         except Exception as e:
             self.logger.error(f"Erro durante cleanup: {e}")
     
-    def _get_midi_connection(self, port_name: str, port_type: str = 'output'):
+    @staticmethod
+    def _connection_key(port_name: str, port_type: str, backend: Optional[str] = None) -> str:
+        """Chave do pool para uma porta (e backend, se específico)"""
+        key = f"{port_type}_{port_name}"
+        return f"{key}@{backend}" if backend else key
+    
+    def _get_midi_connection(self, port_name: str, port_type: str = 'output', backend: Optional[str] = None):
         """Obtém conexão MIDI do pool ou cria nova"""
-        connection_key = f"{port_type}_{port_name}"
+        connection_key = self._connection_key(port_name, port_type, backend)
         
         with self._connection_lock:
-            if connection_key in self._midi_connections:
-                port = self._midi_connections[connection_key]
-                if port and hasattr(port, 'closed') and not port.closed:
+            stats = self._connection_stats.setdefault(connection_key, {
+                'opens': 0, 'sends': 0, 'errors': 0, 'reopens': 0,
+                'healthy': True, 'last_error': None, 'opened_at': None
+            })
+            port = self._midi_connections.get(connection_key)
+            if port and stats['healthy'] and not getattr(port, 'closed', False):
+                return port
+            open_lock = self._open_locks.setdefault(connection_key, threading.Lock())
+        
+        # A abertura (lenta no ALSA) trava só esta porta, não o pool inteiro
+        with open_lock:
+            with self._connection_lock:
+                port = self._midi_connections.get(connection_key)
+                if port and stats['healthy'] and not getattr(port, 'closed', False):
+                    # Outra thread abriu enquanto esperávamos
                     return port
-                else:
-                    # Remove conexão inválida
-                    del self._midi_connections[connection_key]
+                # Remove conexão inválida
+                stale = self._midi_connections.pop(connection_key, None)
+            if stale:
+                try:
+                    stale.close()
+                except Exception:
+                    pass
             
             # Cria nova conexão
             try:
+                # Backend forçado, ou a estratégia escolhida para a porta
+                backend_name = backend or (self._port_strategy(port_name) if port_type == 'output' else None)
+                opener = mido.Backend(backend_name) if backend_name else mido
                 if port_type == 'input':
-                    port = mido.open_input(port_name)
+                    port = opener.open_input(port_name)
                 else:
-                    port = mido.open_output(port_name)
+                    port = opener.open_output(port_name)
                 
-                self._midi_connections[connection_key] = port
+                with self._connection_lock:
+                    self._midi_connections[connection_key] = port
+                    stats['opens'] += 1
+                    stats['healthy'] = True
+                    stats['opened_at'] = time.time()
+                if port_type == 'output':
+                    # Porta (re)aberta: o estado do dispositivo é desconhecido
+                    self._device_state(port_name).invalidate()
+                    if not backend:
+                        self._refresh_controller_port(port_name, port)
                 self.logger.debug(f"Nova conexão MIDI criada: {connection_key}")
                 return port
                 
             except Exception as e:
+                with self._connection_lock:
+                    stats['errors'] += 1
+                    stats['healthy'] = False
+                    stats['last_error'] = str(e)
                 self.logger.error(f"Erro ao criar conexão MIDI {connection_key}: {e}")
                 return None
     
-    def _close_midi_connection(self, port_name: str, port_type: str = 'output'):
+    def _refresh_controller_port(self, port_name: str, port):
+        """Aponta os controladores ligados à porta para o handle recém-aberto pelo pool"""
+        for controller in (self.zoom_g3x, self.chocolate):
+            if controller and getattr(controller, 'device_name', None) == port_name:
+                controller.port = port
+    
+    def _close_midi_connection(self, port_name: str, port_type: str = 'output', backend: Optional[str] = None):
         """Fecha conexão MIDI específica"""
-        connection_key = f"{port_type}_{port_name}"
+        connection_key = self._connection_key(port_name, port_type, backend)
         
         with self._connection_lock:
             if connection_key in self._midi_connections:
@@ -144,19 +261,269 @@ class MIDIController:
                 finally:
                     del self._midi_connections[connection_key]
     
-    def _send_midi_with_connection_pool(self, message, port_name: str, port_type: str = 'output'):
-        """Envia mensagem MIDI usando pool de conexões"""
-        try:
-            port = self._get_midi_connection(port_name, port_type)
-            if port:
-                port.send(message)
+    def _send_midi_with_connection_pool(self, message, port_name: str, port_type: str = 'output', backend: Optional[str] = None):
+        """Envia mensagem MIDI usando pool de conexões; saídas só são escritas pelo actor da porta"""
+        if port_type == 'output':
+            return self._run_on_device(port_name, self._pool_send_now, message, port_name, port_type, backend)
+        return self._pool_send_now(message, port_name, port_type, backend)
+    
+    def _pool_send_now(self, message, port_name: str, port_type: str = 'output', backend: Optional[str] = None):
+        """Envia uma mensagem mido pela conexão do pool"""
+        return self._pool_write(
+            port_name, port_type, backend,
+            lambda port: port.send(message),
+            lambda state: state.apply(message)
+        )
+    
+    def _send_raw_with_connection_pool(self, data, port_name: str) -> bool:
+        """Envia bytes MIDI crus (já validados) pela porta de saída do pool, na thread do actor da porta"""
+        return self._run_on_device(port_name, self._pool_send_raw_now, data, port_name)
+    
+    def _pool_send_raw_now(self, data, port_name: str) -> bool:
+        """Envia bytes crus pela conexão do pool"""
+        return self._pool_write(
+            port_name, 'output', None,
+            lambda port: write_raw(port, data),
+            lambda state: state.apply_bytes(data)
+        )
+    
+    def _pool_write(self, port_name: str, port_type: str, backend: Optional[str], write, apply_state) -> bool:
+        """Laço de envio do pool: write(porta) escreve, apply_state(espelho) registra o envio.
+
+        Reabre a porta uma vez em caso de erro; se a falha persistir, uma
+        terceira tentativa só acontece se um novo teste trocar o backend.
+        """
+        connection_key = self._connection_key(port_name, port_type, backend)
+        
+        for attempt in range(3):
+            if attempt == 2 and not self._reprobe_send_strategy(port_name, port_type, backend):
+                break
+            port = self._get_midi_connection(port_name, port_type, backend)
+            if not port:
+                continue
+            stats = self._connection_stats[connection_key]
+            try:
+                write(port)
+                stats['sends'] += 1
+                if port_type == 'output':
+                    apply_state(self._device_state(port_name))
+                    self._on_port_send(port_name)
                 return True
+            except Exception as e:
+                stats['errors'] += 1
+                stats['healthy'] = False
+                stats['last_error'] = str(e)
+                self.logger.error(f"Erro ao enviar mensagem MIDI para {connection_key}: {e}")
+                if port_type == 'output' and not backend:
+                    # Trata como queda: fecha a porta e reenvia o estado se ela já voltou
+                    self._handle_send_failure(port_name)
+                else:
+                    # Remove conexão problemática; a próxima tentativa reabre a porta
+                    self._close_midi_connection(port_name, port_type, backend)
+                if attempt == 0:
+                    stats['reopens'] += 1
+        return False
+    
+    def _port_strategy(self, port_name: str) -> Optional[str]:
+        """Backend escolhido para a porta de saída (None = padrão do mido)"""
+        return self.midi_config.get('send_strategies', {}).get(port_name, {}).get('backend')
+    
+    def _probe_send_strategy(self, port_name: str, save: bool = True) -> Optional[str]:
+        """Fecha a conexão do pool, testa os backends para a porta e guarda o vencedor"""
+        # Mede com um único handle aberto; a próxima abertura do pool usa o backend escolhido
+        self._close_midi_connection(port_name, 'output')
+        result = self.backend_prober.probe(port_name)
+        if not result:
+            return None
+        self.midi_config.setdefault('send_strategies', {})[port_name] = result
+        if save:
+            self._save_midi_config()
+        return result['backend']
+    
+    def _probe_send_strategies(self):
+        """Escolhe o backend das saídas configuradas que ainda não têm estratégia"""
+        probed = 0
+        for device in self.midi_config.get('devices', {}).get('outputs', []):
+            port_name = device['real_name']
+            if self._port_strategy(port_name) or not self._port_available(port_name):
+                continue
+            if self._probe_send_strategy(port_name, save=False):
+                probed += 1
+        if probed:
+            self._save_midi_config()
+    
+    def _reprobe_send_strategy(self, port_name: str, port_type: str, backend: Optional[str]) -> bool:
+        """Após falha de envio, refaz o teste de backends (True se a estratégia mudou)"""
+        if port_type != 'output' or backend or not self._port_available(port_name):
             return False
-        except Exception as e:
-            self.logger.error(f"Erro ao enviar mensagem MIDI: {e}")
-            # Remove conexão problemática
-            self._close_midi_connection(port_name, port_type)
+        previous = self._port_strategy(port_name)
+        self.logger.warning(f"⚠️ Envio para {port_name} falhou com {previous or 'backend padrão'}, testando backends novamente")
+        chosen = self._probe_send_strategy(port_name)
+        return chosen is not None and chosen != previous
+    
+    def get_send_strategies(self) -> Dict:
+        """Retorna o backend escolhido e as medições de cada porta de saída"""
+        return dict(self.midi_config.get('send_strategies', {}))
+    
+    def _add_input_listener(self, port_name: str, callback) -> bool:
+        """Registra um listener na porta de entrada do pool (vários por porta)"""
+        port = self._get_midi_connection(port_name, 'input')
+        if not port:
             return False
+        listeners = self._input_listeners.setdefault(port_name, [])
+        if callback not in listeners:
+            # Copia e troca a lista para não alterar a que o callback está percorrendo
+            self._input_listeners[port_name] = listeners + [callback]
+        self._bind_input(port_name, port)
+        return True
+    
+    def _bind_input(self, port_name: str, port):
+        """Liga o callback da porta de entrada ao despachante de listeners"""
+        port.callback = lambda message: self._dispatch_input(port_name, message)
+    
+    def _remove_input_listener(self, port_name: str, callback):
+        """Remove um listener da porta de entrada"""
+        listeners = self._input_listeners.get(port_name, [])
+        self._input_listeners[port_name] = [cb for cb in listeners if cb != callback]
+    
+    def _dispatch_input(self, port_name: str, message):
+        """Entrega a mensagem recebida a todos os listeners da porta"""
+        for callback in self._input_listeners.get(port_name, ()):
+            try:
+                callback(message)
+            except Exception as e:
+                self.logger.error(f"Erro no listener de entrada {port_name}: {str(e)}")
+    
+    def _device_state(self, port_name: str) -> DeviceStateMirror:
+        """Obtém (ou cria) o espelho de estado de uma porta de saída"""
+        state = self._device_states.get(port_name)
+        if state is None:
+            state = self._device_states.setdefault(port_name, DeviceStateMirror())
+        return state
+    
+    def get_device_states(self) -> Dict:
+        """Retorna o último estado conhecido de cada porta de saída"""
+        return {name: state.to_dict() for name, state in list(self._device_states.items())}
+    
+    def _device_actor(self, port_name: str) -> DeviceActor:
+        """Obtém (ou cria) o actor que executa os envios de uma porta de saída"""
+        actor = self._device_actors.get(port_name)
+        if actor is None:
+            with self._connection_lock:
+                actor = self._device_actors.get(port_name)
+                if actor is None:
+                    actor = self._device_actors[port_name] = DeviceActor(port_name)
+        return actor
+    
+    def _run_on_device(self, port_name: str, command, *args):
+        """Executa o comando no actor da porta, levando o trace da ativação desta thread.
+
+        O callback de entrada MIDI não espera o resultado (uma porta travada não
+        pode congelar a entrada): o comando só é enfileirado e o Future é
+        retornado (ver _on_send_result). As demais threads esperam no máximo
+        MIDI_DEVICE_CALL_TIMEOUT segundos e recebem o resultado.
+        """
+        trace = self._current_trace()
+        
+        def traced():
+            self._activation_trace.t0 = trace
+            try:
+                return command(*args)
+            finally:
+                self._activation_trace.t0 = None
+        
+        actor = self._device_actor(port_name)
+        if getattr(self._input_context, 'active', False) and not actor.is_current_thread():
+            # A ordem dos comandos continua garantida pela fila do actor
+            return actor.submit(traced)
+        try:
+            return actor.call(traced, timeout=Config.MIDI_DEVICE_CALL_TIMEOUT)
+        except FutureTimeoutError:
+            self.logger.error(f"Porta {port_name} não respondeu em {Config.MIDI_DEVICE_CALL_TIMEOUT:.1f} s")
+            return False
+    
+    def _on_send_result(self, result, callback):
+        """Chama callback(sucesso) quando o envio terminar: na hora, ou quando o actor concluir o Future"""
+        if not isinstance(result, Future):
+            callback(bool(result))
+            return
+        
+        def done(future):
+            try:
+                success = bool(future.result())
+            except Exception:
+                success = False
+            callback(success)
+        result.add_done_callback(done)
+    
+    def _run_on_output(self, device_name: Optional[str], command, *args):
+        """Executa o envio no actor da porta de saída do dispositivo (padrão: o configurado)"""
+        device_name = device_name or self.midi_config.get('output_device')
+        if not device_name:
+            # Sem dispositivo o comando só registra o erro
+            return command(*args)
+        route = self._resolve_output(device_name)
+        return self._run_on_device(route[0] if route else device_name, command, *args)
+    
+    def start_zoom_patch_dump(self, cache_manager, force: bool = False) -> Optional[ZoomPatchDump]:
+        """Inicia a leitura em background dos nomes de patches da Zoom (reaproveita job em andamento)"""
+        if not self.zoom_g3x or not self.device_status['zoom_g3x']['connected']:
+            return None
+        if self.zoom_patch_dump and self.zoom_patch_dump.running:
+            return self.zoom_patch_dump
+        self.zoom_patch_dump = ZoomPatchDump(self.zoom_g3x, cache_manager, force=force)
+        self.zoom_patch_dump.start()
+        return self.zoom_patch_dump
+    
+    def get_zoom_bank_patches(self, bank_letter: str, force: bool = False, zoom=None) -> Optional[List[Dict]]:
+        """Patches de um banco da Zoom: do cache se já lidos deste pedal, senão lidos do pedal e gravados"""
+        zoom = zoom or self.zoom_g3x
+        if not zoom:
+            return None
+        bank_number = ZoomPatchDump.bank_number(bank_letter)
+        if self.cache_manager is None:
+            return zoom.get_bank_patches(bank_number)
+        fingerprint = zoom.get_fingerprint()
+        # Sonda barata: só o nome do primeiro patch do banco, antes de ler os 10
+        first_number = bank_number * ZOOM_PATCHES_PER_BANK
+        first_name = None if force else zoom.read_patch_names([first_number]).get(first_number)
+        if not force and self.cache_manager.is_zoom_bank_current(bank_letter, fingerprint, first_name):
+            return [dict(patch, bank=bank_number) for patch in self.cache_manager.get_zoom_patches_by_bank(bank_letter)]
+        patches = zoom.get_bank_patches(bank_number)
+        if patches:
+            self.cache_manager.store_zoom_bank(bank_letter, patches, fingerprint, force)
+        return patches
+    
+    def get_transmit_stats(self) -> Dict:
+        """Retorna profundidade e tempo de escoamento das filas e actors de transmissão por dispositivo"""
+        stats = {}
+        if self.zoom_g3x:
+            stats['zoom_g3x'] = self.zoom_g3x.get_transmit_stats()
+            stats['zoom_g3x_sysex'] = self.zoom_g3x.get_sysex_stats()
+        stats['actors'] = {name: actor.get_stats() for name, actor in list(self._device_actors.items())}
+        return stats
+    
+    def get_connection_pool_stats(self) -> Dict:
+        """Retorna estatísticas e saúde de cada porta do pool"""
+        with self._connection_lock:
+            return {
+                key: dict(stats, open=key in self._midi_connections)
+                for key, stats in self._connection_stats.items()
+            }
+    
+    def test_output(self, device_name: str) -> Tuple[bool, Optional[str]]:
+        """Envia uma mensagem de teste pela porta do pool; retorna (sucesso, erro)"""
+        route = self._resolve_output(device_name)
+        port_name = route[0] if route else device_name
+        test_msg = mido.Message('program_change', channel=0, program=0)
+        if self._send_midi_with_connection_pool(test_msg, port_name):
+            return True, None
+        return False, self._connection_last_error(port_name) or 'Falha ao enviar mensagem de teste'
+    
+    def _connection_last_error(self, port_name: str, port_type: str = 'output') -> Optional[str]:
+        """Retorna o último erro registrado no pool para a porta"""
+        stats = self._connection_stats.get(self._connection_key(port_name, port_type))
+        return stats['last_error'] if stats else None
     
     def _load_midi_config(self) -> Dict:
         """Carrega configurações MIDI do arquivo"""
@@ -198,10 +565,17 @@ class MIDIController:
             # Lista portas MIDI disponíveis
             self._list_midi_ports()
             
+            # Escolhe o backend de envio das saídas ainda não testadas
+            self._probe_send_strategies()
+            
             # Inicializa controladores específicos
             self._init_zoom_g3x()
             self._init_chocolate()
             
+            # Passa a acompanhar conexão/desconexão de portas em background
+            self.port_watcher.add_listener(self._on_ports_changed)
+            self.port_watcher.start()
+            
             # Conecta dispositivos configurados
             if self.midi_config['auto_connect']:
                 self._connect_configured_devices()
@@ -217,38 +591,167 @@ class MIDIController:
             return False
     
     def _list_midi_ports(self):
-        """Lista portas MIDI disponíveis"""
-        try:
-            import mido
-            
-            # Lista portas disponíveis
-            input_names = mido.get_input_names()
-            output_names = mido.get_output_names()
-            
-            self._available_ports = {
-                'inputs': input_names,
-                'outputs': output_names
-            }
-            
-            self.logger.info(f"Portas MIDI encontradas:")
-            self.logger.info(f"  Entradas: {input_names}")
-            self.logger.info(f"  Saídas: {output_names}")
-            
-            # Categoriza dispositivos
-            self._categorize_devices()
+        """Lista portas MIDI disponíveis (enumera agora e atualiza o snapshot)"""
+        self._apply_port_snapshot(self.port_watcher.refresh())
+        self.logger.info(f"Portas MIDI encontradas:")
+        self.logger.info(f"  Entradas: {self._available_ports['inputs']}")
+        self.logger.info(f"  Saídas: {self._available_ports['outputs']}")
+    
+    def _apply_port_snapshot(self, snapshot: Dict):
+        """Adota um snapshot do monitor de portas e recategoriza os dispositivos"""
+        self._available_ports = {
+            'inputs': list(snapshot['inputs']),
+            'outputs': list(snapshot['outputs']),
+            'version': snapshot['version']
+        }
+        self._categorize_devices()
+    
+    def _on_ports_changed(self, added: List[str], removed: List[str], snapshot: Dict):
+        """Listener do monitor de portas: chamado só quando o conjunto de portas muda"""
+        if added or removed:
+            self._apply_port_snapshot(snapshot)
+        for port_name in removed:
+            self._handle_port_lost(port_name)
+        for port_name in snapshot['outputs'] + snapshot['inputs']:
+            # Quedas pendentes cuja porta está presente, mesmo com outro número de cliente ALSA (24:0 -> 28:0)
+            if port_base_name(port_name) in self._dropouts:
+                self._recover_port(port_name)
+    
+    def _handle_port_lost(self, port_name: str):
+        """Porta sumiu (queda USB): fecha só ela no pool e guarda o estado para reenviar"""
+        with self._dropout_lock:
+            base_name = port_base_name(port_name)
+            if base_name in self._dropouts or base_name in self._recovering:
+                # Já registrada (erro de envio antes do monitor perceber a queda)
+                return
+            output_open = self._connection_key(port_name, 'output') in self._midi_connections
+            input_open = self._connection_key(port_name, 'input') in self._midi_connections
+            if not (output_open or input_open or self._input_listeners.get(port_name)):
+                return
             
-        except ImportError:
-            self.logger.warning("Módulo mido não disponível, usando simulação")
-            self._available_ports = {
-                'inputs': ['Chocolate MIDI In', 'Zoom G3X MIDI In'],
-                'outputs': ['Chocolate MIDI Out', 'Zoom G3X MIDI Out']
+            # O estado é capturado antes da reabertura, que invalida o espelho
+            self._dropouts[base_name] = {
+                'port': port_name,
+                'lost_at': time.monotonic(),
+                'output': output_open,
+                'state': self._device_state(port_name).capture() if output_open else None
             }
+        self._recovery_stats['dropouts'] += 1
+        if output_open:
+            self._close_midi_connection(port_name, 'output')
+        if input_open:
+            self._close_midi_connection(port_name, 'input')
+        
+        route = self._resolve_output(port_name)
+        if route and self.device_status[route[2]]['port'] == port_name:
+            self.device_status[route[2]]['connected'] = False
+        self.logger.warning(f"⚠️ Porta MIDI desconectada: {port_name} (aguardando reconexão)")
+    
+    def _handle_send_failure(self, port_name: str):
+        """Erro de envio conta como queda: quedas curtas não chegam a aparecer no monitor de portas"""
+        base_name = port_base_name(port_name)
+        with self._dropout_lock:
+            known = base_name in self._recovering or base_name in self._dropouts
+        if known:
+            # Falha durante a recuperação, ou queda já registrada: só descarta a conexão
+            self._close_midi_connection(port_name, 'output')
+            return
+        self._handle_port_lost(port_name)
+        # A enumeração fica com a thread do monitor (não trava os envios deste actor);
+        # se a porta estiver presente, o listener a recupera
+        self.port_watcher.request_refresh()
+    
+    def _rename_port(self, old_name: str, new_name: str):
+        """Porta voltou com outro número de cliente ALSA: leva listeners, estratégia e controladores para o novo nome"""
+        listeners = self._input_listeners.pop(old_name, None)
+        if listeners:
+            self._input_listeners[new_name] = listeners
+        strategies = self.midi_config.get('send_strategies', {})
+        if old_name in strategies:
+            strategies.setdefault(new_name, strategies[old_name])
+        for status in self.device_status.values():
+            if status.get('port') == old_name:
+                status['port'] = new_name
+        for controller in (self.zoom_g3x, self.chocolate):
+            if controller and getattr(controller, 'device_name', None) == old_name:
+                controller.device_name = new_name
+        self.logger.info(f"🔀 Porta MIDI reconectada com outro nome: {old_name} -> {new_name}")
+    
+    def _recover_port(self, port_name: str):
+        """Porta voltou: reabre só ela no pool, religa a entrada e reenvia o estado"""
+        base_name = port_base_name(port_name)
+        with self._dropout_lock:
+            # Monitor e actor podem tentar recuperar a mesma porta: só o primeiro a reivindica
+            dropout = self._dropouts.pop(base_name, None)
+            if dropout is None:
+                return
+            self._recovering.add(base_name)
+        started = time.monotonic()
+        replay = []
+        try:
+            if dropout['port'] != port_name:
+                self._rename_port(dropout['port'], port_name)
+            if dropout['output']:
+                if not self._get_midi_connection(port_name, 'output'):
+                    raise IOError(f"Não foi possível reabrir {port_name}")
+                route = self._resolve_output(port_name)
+                if route and self.device_status[route[2]]['port'] == port_name:
+                    self.device_status[route[2]]['connected'] = True
+                if dropout['state']:
+                    replay = self._device_state(port_name).restore_messages(dropout['state'])
+                self._replay_device_state(port_name, replay, route)
+            
+            if self._input_listeners.get(port_name):
+                port = self._get_midi_connection(port_name, 'input')
+                if not port:
+                    raise IOError(f"Não foi possível reabrir a entrada {port_name}")
+                self._bind_input(port_name, port)
+            
+            finished = time.monotonic()
+            recovery_ms = (finished - started) * 1000
+            stats = self._recovery_stats
+            stats['recoveries'] += 1
+            stats['last_ms'] = recovery_ms
+            stats['max_ms'] = max(stats['max_ms'] or 0.0, recovery_ms)
+            stats['last_port'] = port_name
+            message = (f"Porta MIDI recuperada: {port_name} em {recovery_ms:.1f} ms "
+                       f"(fora do ar por {(finished - dropout['lost_at']):.2f} s, {len(replay)} mensagens reenviadas)")
+            if recovery_ms > 1000:
+                self.logger.warning(f"⚠️ {message} - acima da meta de 1 s")
+            else:
+                self.logger.info(f"✅ {message}")
         except Exception as e:
-            self.logger.error(f"Erro ao listar portas MIDI: {str(e)}")
-            self._available_ports = {
-                'inputs': [],
-                'outputs': []
-            }
+            self.logger.error(f"Erro ao recuperar porta MIDI {port_name}: {str(e)}")
+        finally:
+            with self._dropout_lock:
+                self._recovering.discard(base_name)
+    
+    def _replay_device_state(self, port_name: str, messages: List, route=None):
+        """Reenvia o programa e os CCs que o dispositivo tinha antes da queda (mais os enviados depois)"""
+        if not messages:
+            return
+        controller = route[1] if route else None
+        if controller and getattr(controller, 'tx_queue', None):
+            if not controller.tx_queue.wait_idle(0):
+                # Uma ativação mais nova ainda está na fila e define o estado do pedal
+                return
+            # Zoom: respeita as pausas entre PC e CCs da fila cadenciada
+            controller.tx_queue.enqueue(
+                [(message, controller.pc_delay if message.type == 'program_change' else controller.cc_delay)
+                 for message in messages],
+                replace=True
+            )
+            return
+        for message in messages:
+            self._send_midi_with_connection_pool(message, port_name)
+    
+    def get_recovery_stats(self) -> Dict:
+        """Retorna quedas detectadas, recuperações e tempo de recuperação"""
+        return dict(self._recovery_stats, pending=sorted(self._dropouts))
+    
+    def _port_available(self, port_name: str, port_type: str = 'output') -> bool:
+        """Verifica no snapshot (sem enumerar o ALSA) se a porta existe"""
+        return port_name in self._available_ports.get('inputs' if port_type == 'input' else 'outputs', [])
     
     def _categorize_devices(self):
         """Categoriza dispositivos MIDI detectados"""
@@ -306,6 +809,7 @@ class MIDIController:
             
             # Atualiza configuração MIDI
             self.midi_config['devices'] = devices
+            self._rebuild_output_routes()
             
             # Se não há dispositivo configurado, usa o primeiro disponível (ignorando Midi Through)
             if not self.midi_config.get('input_device') and devices['inputs']:
@@ -345,6 +849,27 @@ class MIDIController:
         except Exception as e:
             self.logger.error(f"Erro ao categorizar dispositivos: {str(e)}")
     
+    def _rebuild_output_routes(self):
+        """Reconstrói a tabela de rotas de saída e a troca atomicamente"""
+        controllers = {'zoom_g3x': self.zoom_g3x, 'chocolate': self.chocolate}
+        routes = {}
+        for device in self.midi_config.get('devices', {}).get('outputs', []):
+            route = (device['real_name'], controllers.get(device['type']), device['type'])
+            # Nome amigável tem prioridade sobre um nome real igual de outro dispositivo
+            routes.setdefault(device['real_name'], route)
+            routes[device['name']] = route
+        self._output_routes = routes
+    
+    def _resolve_output(self, device_name: str):
+        """Resolve (porta real, controlador, tipo) para um dispositivo de saída"""
+        return self._output_routes.get(device_name)
+    
+    def _route_controller(self, controller, device_type: str):
+        """Retorna o controlador da rota se estiver conectado"""
+        if controller and self.device_status.get(device_type, {}).get('connected'):
+            return controller
+        return None
+    
     def _connect_configured_devices(self):
         """Conecta dispositivos configurados"""
         try:
@@ -392,17 +917,11 @@ class MIDIController:
                             zoom_port = device['real_name']
                             break
                     
-                    if zoom_port:
-                        try:
-                            import mido
-                            available_outputs = mido.get_output_names()
-                            if zoom_port in available_outputs:
-                                self.zoom_g3x.connect(zoom_port)
-                                self.device_status['zoom_g3x']['connected'] = True
-                                self.device_status['zoom_g3x']['port'] = zoom_port
-                                self.logger.info(f"Zoom G3X reconectado na porta: {zoom_port}")
-                        except ImportError:
-                            self.logger.warning("Módulo mido não disponível")
+                    if zoom_port and self._port_available(zoom_port):
+                        self.zoom_g3x.connect(zoom_port)
+                        self.device_status['zoom_g3x']['connected'] = True
+                        self.device_status['zoom_g3x']['port'] = zoom_port
+                        self.logger.info(f"Zoom G3X reconectado na porta: {zoom_port}")
             
             # Reconecta Chocolate se for o dispositivo de saída configurado
             if 'chocolate' in output_device.lower():
@@ -416,17 +935,11 @@ class MIDIController:
                             chocolate_port = device['real_name']
                             break
                     
-                    if chocolate_port:
-                        try:
-                            import mido
-                            available_outputs = mido.get_output_names()
-                            if chocolate_port in available_outputs:
-                                self.chocolate.connect(chocolate_port)
-                                self.device_status['chocolate']['connected'] = True
-                                self.device_status['chocolate']['port'] = chocolate_port
-                                self.logger.info(f"Chocolate reconectado na porta: {chocolate_port}")
-                        except ImportError:
-                            self.logger.warning("Módulo mido não disponível")
+                    if chocolate_port and self._port_available(chocolate_port):
+                        self.chocolate.connect(chocolate_port)
+                        self.device_status['chocolate']['connected'] = True
+                        self.device_status['chocolate']['port'] = chocolate_port
+                        self.logger.info(f"Chocolate reconectado na porta: {chocolate_port}")
             
         except Exception as e:
             self.logger.error(f"Erro ao reconectar controladores específicos: {str(e)}")
@@ -501,6 +1014,8 @@ class MIDIController:
         """Inicializa controlador do Zoom G3X"""
         try:
             self.zoom_g3x = ZoomG3XController()
+            self._attach_port_pool(self.zoom_g3x)
+            self._rebuild_output_routes()
             
             # Procura porta do Zoom G3X usando a configuração MIDI
             zoom_port = None
@@ -509,12 +1024,16 @@ class MIDIController:
                     zoom_port = device['real_name']
                     break
             
+            # Porta de entrada do Zoom, por onde chegam as respostas SysEx
+            for device in self.midi_config.get('devices', {}).get('inputs', []):
+                if device['type'] == 'zoom_g3x':
+                    self.zoom_g3x.input_name = device['real_name']
+                    break
+            
             if zoom_port:
                 # Verifica se a porta ainda existe
                 try:
-                    import mido
-                    available_outputs = mido.get_output_names()
-                    if zoom_port in available_outputs:
+                    if self._port_available(zoom_port):
                         # Tenta conectar e verifica se foi bem-sucedido
                         if self.zoom_g3x.connect(zoom_port):
                             self.device_status['zoom_g3x']['connected'] = True
@@ -550,36 +1069,45 @@ class MIDIController:
             self.device_status['zoom_g3x']['port'] = None
             self.logger.error(f"Erro ao inicializar Zoom G3X: {str(e)}")
     
+    def _attach_port_pool(self, controller):
+        """Faz o controlador abrir, usar e fechar suas portas através do pool"""
+        controller.send_listener = self._on_port_send
+        controller.trace_source = self._current_trace
+        controller.latency_listener = self._record_latency
+        controller.port_opener = lambda name: self._get_midi_connection(name, 'output')
+        controller.port_closer = lambda name: self._close_midi_connection(name, 'output')
+        controller.port_sender = lambda message, name: self._send_midi_with_connection_pool(message, name, 'output')
+        controller.raw_sender = self._send_raw_with_connection_pool
+        controller.state_provider = self._device_state
+        controller.input_attacher = self._add_input_listener
+        controller.input_detacher = self._remove_input_listener
+        controller.port_lister = lambda: self._available_ports.get('outputs', [])
+    
     def _try_alternative_zoom_connection(self, port_name: str) -> bool:
         """Tenta métodos alternativos de conexão com o Zoom G3X"""
         try:
             import mido
             import time
             
-            # Método 1: Conexão direta sem context manager
-            try:
-                self.logger.info("Tentando método 1: Conexão direta...")
-                port = mido.open_output(port_name)
-                test_msg = mido.Message('program_change', channel=0, program=0)
-                port.send(test_msg)
-                port.close()
+            # Método 1: Porta persistente do pool
+            self.logger.info("Tentando método 1: Conexão direta...")
+            test_msg = mido.Message('program_change', channel=0, program=0)
+            if self._send_midi_with_connection_pool(test_msg, port_name):
                 self.logger.info("Método 1 funcionou!")
                 return True
-            except Exception as e1:
-                self.logger.warning(f"Método 1 falhou: {e1}")
-            
-            # Método 2: Com delay
-            try:
-                self.logger.info("Tentando método 2: Com delay...")
-                time.sleep(1)
-                with mido.open_output(port_name) as port:
-                    time.sleep(0.5)
-                    test_msg = mido.Message('program_change', channel=0, program=1)
-                    port.send(test_msg)
-                self.logger.info("Método 2 funcionou!")
-                return True
-            except Exception as e2:
-                self.logger.warning(f"Método 2 falhou: {e2}")
+            self.logger.warning(f"Método 1 falhou: {self._connection_last_error(port_name)}")
+            
+            # Método 2: Reabre a porta do pool com delay
+            self.logger.info("Tentando método 2: Com delay...")
+            self._close_midi_connection(port_name)
+            time.sleep(1)
+            if self._get_midi_connection(port_name):
+                time.sleep(0.5)
+                test_msg = mido.Message('program_change', channel=0, program=1)
+                if self._send_midi_with_connection_pool(test_msg, port_name):
+                    self.logger.info("Método 2 funcionou!")
+                    return True
+            self.logger.warning(f"Método 2 falhou: {self._connection_last_error(port_name)}")
             
             # Método 3: Tenta reconectar o controlador
             try:
@@ -599,9 +1127,11 @@ class MIDIController:
             return False
     
     def _init_chocolate(self):
-        """Inicializa controlador do Chocolate (considera conectado se detectado via USB usando aconnect)"""
+        """Inicializa controlador do Chocolate (considera conectado se detectado via USB no snapshot de portas)"""
         try:
             self.chocolate = ChocolateController()
+            self._attach_port_pool(self.chocolate)
+            self._rebuild_output_routes()
             chocolate_port = None
             
             # Procura em entradas (Chocolate é um dispositivo de entrada)
@@ -618,46 +1148,17 @@ class MIDIController:
                 self.device_status['chocolate']['port'] = chocolate_port
                 self.logger.info(f"✅ Chocolate detectado via USB e configurado: {chocolate_port}")
             else:
-                # Se não encontrou na configuração, verifica se está disponível via aconnect
-                try:
-                    import subprocess
-                    result = subprocess.run(['aconnect', '-l'], capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0:
-                        aconnect_output = result.stdout
-                        self.logger.info(f"📋 Saída do aconnect: {aconnect_output}")
-                        
-                        # Procura por SINCO na saída do aconnect
-                        if 'sinco' in aconnect_output.lower():
-                            # Extrai o nome da porta do SINCO
-                            lines = aconnect_output.split('\n')
-                            for line in lines:
-                                if 'sinco' in line.lower():
-                                    # Extrai o nome da porta (ex: "SINCO MIDI 1")
-                                    if 'SINCO MIDI' in line:
-                                        chocolate_port = f"SINCO:SINCO MIDI 1"
-                                        break
-                            
-                            if chocolate_port:
-                                self.device_status['chocolate']['connected'] = True
-                                self.device_status['chocolate']['port'] = chocolate_port
-                                self.logger.info(f"✅ Chocolate detectado via USB (aconnect): {chocolate_port}")
-                            else:
-                                self.device_status['chocolate']['connected'] = False
-                                self.device_status['chocolate']['port'] = None
-                                self.logger.warning(f"❌ Chocolate não detectado via USB (aconnect)")
-                        else:
-                            self.device_status['chocolate']['connected'] = False
-                            self.device_status['chocolate']['port'] = None
-                            self.logger.warning(f"❌ Chocolate não detectado via USB (aconnect)")
-                    else:
-                        self.device_status['chocolate']['connected'] = False
-                        self.device_status['chocolate']['port'] = None
-                        self.logger.warning(f"❌ Erro ao executar aconnect: {result.stderr}")
-                        
-                except Exception as e:
+                # Se não encontrou na configuração, procura o SINCO no snapshot de portas
+                sinco_ports = [port for port in self._available_ports.get('inputs', []) if 'sinco' in port.lower()]
+                if sinco_ports:
+                    chocolate_port = sinco_ports[0]
+                    self.device_status['chocolate']['connected'] = True
+                    self.device_status['chocolate']['port'] = chocolate_port
+                    self.logger.info(f"✅ Chocolate detectado via USB: {chocolate_port}")
+                else:
                     self.device_status['chocolate']['connected'] = False
                     self.device_status['chocolate']['port'] = None
-                    self.logger.error(f"❌ Erro ao verificar porta Chocolate via aconnect: {str(e)}")
+                    self.logger.warning(f"❌ Chocolate não detectado via USB")
                 
         except Exception as e:
             self.device_status['chocolate']['connected'] = False
@@ -717,29 +1218,24 @@ class MIDIController:
                 'footctrl', 'chocolate', 'midi controller'
             ]
             
-            available_outputs = mido.get_output_names()
-            
-            for device_name in available_outputs:
+            for device_name in self._available_ports.get('outputs', []):
                 device_lower = device_name.lower()
                 
                 # Verifica se é um dispositivo que precisa de alimentação externa
                 needs_external_power = any(keyword in device_lower for keyword in external_power_devices)
                 
                 if needs_external_power:
-                    # Tenta abrir a porta para verificar se está respondendo
-                    try:
-                        with mido.open_output(device_name) as port:
-                            # Tenta enviar uma mensagem de teste
-                            test_msg = mido.Message('program_change', channel=0, program=0)
-                            port.send(test_msg)
-                            self.logger.info(f"✓ {device_name} está respondendo corretamente")
-                    except Exception as e:
-                        error_msg = str(e).lower()
-                        if any(keyword in error_msg for keyword in ['timeout', 'not responding', 'no response', 'error']):
-                            self.logger.warning(f"⚠ {device_name} pode precisar de alimentação externa. Erro: {str(e)}")
+                    # Envia uma mensagem de teste pela porta do pool
+                    test_msg = mido.Message('program_change', channel=0, program=0)
+                    if self._send_midi_with_connection_pool(test_msg, device_name):
+                        self.logger.info(f"✓ {device_name} está respondendo corretamente")
+                    else:
+                        error = self._connection_last_error(device_name) or ''
+                        if any(keyword in error.lower() for keyword in ['timeout', 'not responding', 'no response', 'error']):
+                            self.logger.warning(f"⚠ {device_name} pode precisar de alimentação externa. Erro: {error}")
                             self.logger.info(f"💡 Dica: Conecte a alimentação externa do {device_name} e tente novamente")
                         else:
-                            self.logger.error(f"✗ Erro ao testar {device_name}: {str(e)}")
+                            self.logger.error(f"✗ Erro ao testar {device_name}: {error}")
                             
         except Exception as e:
             self.logger.error(f"Erro ao verificar status de alimentação: {str(e)}")
@@ -761,13 +1257,17 @@ class MIDIController:
         return self.midi_config.copy()
     
     def update_midi_config(self, config: Dict) -> bool:
-        """Atualiza a configuração MIDI"""
+        """Atualiza a configuração MIDI (ValueError se cc_coalesce_rate for inválido)"""
+        if 'cc_coalesce_rate' in config:
+            config = dict(config, cc_coalesce_rate=self._parse_cc_coalesce_rate(config['cc_coalesce_rate']))
         with self._lock:
             # Atualiza apenas as chaves permitidas
-            allowed_keys = ['input_device', 'output_device', 'auto_connect']
+            allowed_keys = ['input_device', 'output_device', 'auto_connect', 'cc_coalesce_rate']
             for key in allowed_keys:
                 if key in config:
                     self.midi_config[key] = config[key]
+            if 'cc_coalesce_rate' in config:
+                self._configure_cc_coalescing()
             
             self.logger.info(f"Configuração MIDI atualizada: {self.midi_config}")
             self._save_midi_config()
@@ -778,54 +1278,92 @@ class MIDIController:
             return True
     
     def send_patch(self, patch_data: Dict) -> bool:
-        """Envia os comandos de um patch para o dispositivo de saída configurado"""
-        with self._lock:
-            try:
-                command_type = patch_data.get('command_type')
-                device_name = patch_data.get('output_device')
-                self.logger.info(f"[PATCH DEBUG] Dados completos do patch recebido: {patch_data}")
-                self.logger.info(f"Enviando patch '{patch_data.get('name')}' para {device_name} (tipo: {command_type})")
-                if not device_name:
-                    self.logger.error("Dispositivo de saída não definido no patch")
-                    return False
-                # Delega para o controlador Zoom G3X se for o caso
-                if self.zoom_g3x and getattr(self.zoom_g3x, 'connected', False) and ('zoom' in device_name.lower() or 'g3x' in device_name.lower()):
-                    self.logger.info(f"[PATCH DEBUG] Enviando para Zoom G3X: {patch_data}")
-                    return self.zoom_g3x.load_patch(patch_data)
-                # Lógica para comandos MIDI genéricos
-                if command_type == 'pc':
-                    program = patch_data.get('program')
-                    channel = patch_data.get('channel', 1) # Canal padrão 1
-                    self.logger.info(f"[PATCH DEBUG] Montando comando PC: channel={channel}, program={program}, device={device_name}")
-                    if program is not None:
-                        return self._send_pc_to_device(channel, program, device_name)
-                elif command_type == 'cc':
-                    cc = patch_data.get('cc')
-                    value = patch_data.get('value')
-                    channel = patch_data.get('channel', 1) # Canal padrão 1
-                    self.logger.info(f"[PATCH DEBUG] Montando comando CC: channel={channel}, cc={cc}, value={value}, device={device_name}")
-                    if cc is not None and value is not None:
-                        return self._send_cc_to_device(channel, cc, value, device_name)
-                elif command_type == 'note_on':
-                    note = patch_data.get('note')
-                    velocity = patch_data.get('velocity', 127) # Velocidade padrão
-                    channel = patch_data.get('channel', 1) # Canal padrão 1
-                    self.logger.info(f"[PATCH DEBUG] Montando comando Note On: channel={channel}, note={note}, velocity={velocity}, device={device_name}")
-                    if note is not None:
-                        return self._send_note_on_to_device(channel, note, velocity, device_name)
-                elif command_type == 'note_off':
-                    note = patch_data.get('note')
-                    channel = patch_data.get('channel', 1) # Canal padrão 1
-                    self.logger.info(f"[PATCH DEBUG] Montando comando Note Off: channel={channel}, note={note}, device={device_name}")
-                    if note is not None:
-                        return self._send_note_off_to_device(channel, note, device_name)
-                self.logger.warning(f"Tipo de comando '{command_type}' não suportado ou dados insuficientes para o patch.")
-                return False
-            except Exception as e:
-                self.logger.error(f"Erro ao enviar patch: {str(e)}")
+        """Envia os comandos de um patch pelo actor do dispositivo de saída"""
+        device_name = patch_data.get('output_device')
+        if not device_name:
+            self.logger.error("Dispositivo de saída não definido no patch")
+            return False
+        route = self._resolve_output(device_name)
+        plan = self.cache_manager.get_patch_plan(patch_data.get('id')) if self.cache_manager else None
+        try:
+            if plan and plan.source is patch_data:
+                # Patch do cache: reenvia o plano pré-compilado
+                return self._run_on_device(route[0] if route else device_name, self._play_patch_plan, plan, route)
+            return self._run_on_device(route[0] if route else device_name, self._send_patch_now, patch_data)
+        except Exception as e:
+            self.logger.error(f"Erro ao enviar patch: {str(e)}")
+            return False
+    
+    def _play_patch_plan(self, plan, route) -> bool:
+        """Transmite um plano pré-compilado (executado na thread do actor do dispositivo)"""
+        if plan.kind == 'zoom':
+            if not (self.zoom_g3x and getattr(self.zoom_g3x, 'connected', False)):
+                return self._send_patch_now(plan.source)
+            return self.zoom_g3x.play_items(plan.items, plan.source.get('name', 'Unknown'), plan.source.get('id'))
+        if not route:
+            self.logger.error(f"Dispositivo {plan.output_device} não encontrado")
+            return False
+        real_device_name, _, device_type = route
+        for step in plan.steps:
+            # Bytes compilados no plano: dispensa a validação do mido.Message
+            if not self._send_raw_with_connection_pool(step.data, real_device_name):
                 return False
+            if step.message.type == 'program_change' and device_type in self.device_status:
+                self.device_status[device_type]['last_pc'] = step.message.program
+        return True
     
+    def _send_patch_now(self, patch_data: Dict) -> bool:
+        """Envia os comandos de um patch (executado na thread do actor do dispositivo)"""
+        try:
+            command_type = patch_data.get('command_type')
+            device_name = patch_data.get('output_device')
+            self.logger.info(f"[PATCH DEBUG] Dados completos do patch recebido: {patch_data}")
+            self.logger.info(f"Enviando patch '{patch_data.get('name')}' para {device_name} (tipo: {command_type})")
+            if not device_name:
+                self.logger.error("Dispositivo de saída não definido no patch")
+                return False
+            # Delega para o controlador Zoom G3X se for o caso
+            if self.zoom_g3x and getattr(self.zoom_g3x, 'connected', False) and ('zoom' in device_name.lower() or 'g3x' in device_name.lower()):
+                self.logger.info(f"[PATCH DEBUG] Enviando para Zoom G3X: {patch_data}")
+                return self.zoom_g3x.load_patch(patch_data)
+            # Lógica para comandos MIDI genéricos
+            if command_type == 'pc':
+                program = patch_data.get('program')
+                channel = patch_data.get('channel', 1) # Canal padrão 1
+                self.logger.info(f"[PATCH DEBUG] Montando comando PC: channel={channel}, program={program}, device={device_name}")
+                if program is not None:
+                    return self._send_pc_to_device(channel, program, device_name)
+            elif command_type == 'cc':
+                cc = patch_data.get('cc')
+                value = patch_data.get('value')
+                channel = patch_data.get('channel', 1) # Canal padrão 1
+                self.logger.info(f"[PATCH DEBUG] Montando comando CC: channel={channel}, cc={cc}, value={value}, device={device_name}")
+                if cc is not None and value is not None:
+                    return self._send_cc_to_device(channel, cc, value, device_name)
+            elif command_type == 'note_on':
+                note = patch_data.get('note')
+                velocity = patch_data.get('velocity', 127) # Velocidade padrão
+                channel = patch_data.get('channel', 1) # Canal padrão 1
+                self.logger.info(f"[PATCH DEBUG] Montando comando Note On: channel={channel}, note={note}, velocity={velocity}, device={device_name}")
+                if note is not None:
+                    return self._send_note_on_to_device(channel, note, velocity, device_name)
+            elif command_type == 'note_off':
+                note = patch_data.get('note')
+                channel = patch_data.get('channel', 1) # Canal padrão 1
+                self.logger.info(f"[PATCH DEBUG] Montando comando Note Off: channel={channel}, note={note}, device={device_name}")
+                if note is not None:
+                    return self._send_note_off_to_device(channel, note, device_name)
+            self.logger.warning(f"Tipo de comando '{command_type}' não suportado ou dados insuficientes para o patch.")
+            return False
+        except Exception as e:
+            self.logger.error(f"Erro ao enviar patch: {str(e)}")
+            return False
+
     def toggle_effect(self, effect_name: str, enabled: bool) -> bool:
+        """Liga/desliga um efeito no dispositivo configurado (na thread do actor da porta de saída)"""
+        return self._run_on_output(None, self._toggle_effect_now, effect_name, enabled)
+    
+    def _toggle_effect_now(self, effect_name: str, enabled: bool) -> bool:
         """Liga/desliga um efeito no dispositivo configurado"""
         try:
             output_device = self.midi_config.get('output_device')
@@ -893,6 +1431,10 @@ class MIDIController:
             return False
     
     def _send_cc(self, channel: int, cc: int, value: int) -> bool:
+        """Envia mensagem Control Change (na thread do actor da porta de saída)"""
+        return self._run_on_output(None, self._send_cc_now, channel, cc, value)
+    
+    def _send_cc_now(self, channel: int, cc: int, value: int) -> bool:
         """Envia mensagem Control Change"""
         try:
             output_device = self.midi_config.get('output_device')
@@ -910,6 +1452,10 @@ class MIDIController:
             return False
     
     def _send_pc(self, channel: int, program: int) -> bool:
+        """Envia mensagem Program Change (na thread do actor da porta de saída)"""
+        return self._run_on_output(None, self._send_pc_now, channel, program)
+    
+    def _send_pc_now(self, channel: int, program: int) -> bool:
         """Envia mensagem Program Change"""
         try:
             output_device = self.midi_config.get('output_device')
@@ -941,6 +1487,10 @@ class MIDIController:
             return False
     
     def _send_note_on(self, channel: int, note: int, velocity: int) -> bool:
+        """Envia mensagem Note On (na thread do actor da porta de saída)"""
+        return self._run_on_output(None, self._send_note_on_now, channel, note, velocity)
+    
+    def _send_note_on_now(self, channel: int, note: int, velocity: int) -> bool:
         """Envia mensagem Note On"""
         try:
             output_device = self.midi_config.get('output_device')
@@ -955,6 +1505,10 @@ class MIDIController:
             return False
     
     def _send_note_off(self, channel: int, note: int) -> bool:
+        """Envia mensagem Note Off (na thread do actor da porta de saída)"""
+        return self._run_on_output(None, self._send_note_off_now, channel, note)
+    
+    def _send_note_off_now(self, channel: int, note: int) -> bool:
         """Envia mensagem Note Off"""
         try:
             output_device = self.midi_config.get('output_device')
@@ -969,26 +1523,23 @@ class MIDIController:
             return False
     
     def _send_cc_to_device(self, channel: int, cc: int, value: int, device_name: str) -> bool:
+        """Envia Control Change para dispositivo específico (na thread do actor da porta de saída)"""
+        return self._run_on_output(device_name, self._send_cc_to_device_now, channel, cc, value, device_name)
+    
+    def _send_cc_to_device_now(self, channel: int, cc: int, value: int, device_name: str) -> bool:
         """Envia Control Change para dispositivo específico"""
         try:
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == device_name:
-                    real_device_name = device['real_name']
-                    break
-            
-            if not real_device_name:
+            # Resolve porta real e controlador pela tabela de rotas
+            route = self._resolve_output(device_name)
+            if not route:
                 self.logger.error(f"Dispositivo {device_name} não encontrado")
                 return False
+            real_device_name, controller, device_type = route
             
             # Tenta enviar via controlador específico primeiro
-            if 'zoom' in device_name.lower() or 'g3x' in device_name.lower():
-                if self.zoom_g3x and self.device_status['zoom_g3x']['connected']:
-                    return self.zoom_g3x.send_cc(channel, cc, value)
-            elif 'chocolate' in device_name.lower():
-                if self.chocolate and self.device_status['chocolate']['connected']:
-                    return self.chocolate.send_cc(channel, cc, value)
+            controller = self._route_controller(controller, device_type)
+            if controller:
+                return controller.send_cc(channel, cc, value)
             
             # Se não conseguiu via controlador, tenta enviar diretamente via mido
             return self._send_midi_via_mido('control_change', real_device_name, channel=channel, control=cc, value=value)
@@ -998,26 +1549,23 @@ class MIDIController:
             return False
     
     def _send_note_on_to_device(self, channel: int, note: int, velocity: int, device_name: str) -> bool:
+        """Envia Note On para dispositivo específico (na thread do actor da porta de saída)"""
+        return self._run_on_output(device_name, self._send_note_on_to_device_now, channel, note, velocity, device_name)
+    
+    def _send_note_on_to_device_now(self, channel: int, note: int, velocity: int, device_name: str) -> bool:
         """Envia Note On para dispositivo específico"""
         try:
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == device_name:
-                    real_device_name = device['real_name']
-                    break
-            
-            if not real_device_name:
+            # Resolve porta real e controlador pela tabela de rotas
+            route = self._resolve_output(device_name)
+            if not route:
                 self.logger.error(f"Dispositivo {device_name} não encontrado")
                 return False
+            real_device_name, controller, device_type = route
             
             # Tenta enviar via controlador específico primeiro
-            if 'zoom' in device_name.lower() or 'g3x' in device_name.lower():
-                if self.zoom_g3x and self.device_status['zoom_g3x']['connected']:
-                    return self.zoom_g3x.send_note_on(channel, note, velocity)
-            elif 'chocolate' in device_name.lower():
-                if self.chocolate and self.device_status['chocolate']['connected']:
-                    return self.chocolate.send_note_on(channel, note, velocity)
+            controller = self._route_controller(controller, device_type)
+            if controller:
+                return controller.send_note_on(channel, note, velocity)
             
             # Se não conseguiu via controlador, tenta enviar diretamente via mido
             return self._send_midi_via_mido('note_on', real_device_name, channel=channel, note=note, velocity=velocity)
@@ -1027,26 +1575,23 @@ class MIDIController:
             return False
     
     def _send_note_off_to_device(self, channel: int, note: int, device_name: str) -> bool:
+        """Envia Note Off para dispositivo específico (na thread do actor da porta de saída)"""
+        return self._run_on_output(device_name, self._send_note_off_to_device_now, channel, note, device_name)
+    
+    def _send_note_off_to_device_now(self, channel: int, note: int, device_name: str) -> bool:
         """Envia Note Off para dispositivo específico"""
         try:
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == device_name:
-                    real_device_name = device['real_name']
-                    break
-            
-            if not real_device_name:
+            # Resolve porta real e controlador pela tabela de rotas
+            route = self._resolve_output(device_name)
+            if not route:
                 self.logger.error(f"Dispositivo {device_name} não encontrado")
                 return False
+            real_device_name, controller, device_type = route
             
             # Tenta enviar via controlador específico primeiro
-            if 'zoom' in device_name.lower() or 'g3x' in device_name.lower():
-                if self.zoom_g3x and self.device_status['zoom_g3x']['connected']:
-                    return self.zoom_g3x.send_note_off(channel, note)
-            elif 'chocolate' in device_name.lower():
-                if self.chocolate and self.device_status['chocolate']['connected']:
-                    return self.chocolate.send_note_off(channel, note)
+            controller = self._route_controller(controller, device_type)
+            if controller:
+                return controller.send_note_off(channel, note)
             
             # Se não conseguiu via controlador, tenta enviar diretamente via mido
             return self._send_midi_via_mido('note_off', real_device_name, channel=channel, note=note, velocity=0)
@@ -1080,47 +1625,16 @@ class MIDIController:
             self.logger.error(f"Erro ao enviar mensagem MIDI: {str(e)}")
             return False
     
-    def _send_midi_strategy_1(self, mido, message_type: str, device_name: str, **kwargs) -> bool:
-        """Estratégia 1: Conexão temporária com context manager"""
-        try:
-            with mido.open_output(device_name) as port:
-                msg = mido.Message(message_type, **kwargs)
-                port.send(msg)
-                return True
-        except Exception as e:
-            raise e
-    
-    def _send_midi_strategy_2(self, mido, message_type: str, device_name: str, **kwargs) -> bool:
-        """Estratégia 2: Conexão persistente"""
+    def scan_devices(self, refresh: bool = False) -> Dict:
+        """Retorna dispositivos MIDI do snapshot de portas (refresh=True enumera agora)"""
         try:
-            port = mido.open_output(device_name)
-            msg = mido.Message(message_type, **kwargs)
-            port.send(msg)
-            port.close()
-            return True
-        except Exception as e:
-            raise e
-    
-    def _send_midi_strategy_3(self, mido, message_type: str, device_name: str, **kwargs) -> bool:
-        """Estratégia 3: Usando backend específico"""
-        try:
-            # Tenta com backend específico para Windows
-            port = mido.open_output(device_name, backend='mido.backends.rtmidi')
-            msg = mido.Message(message_type, **kwargs)
-            port.send(msg)
-            port.close()
-            return True
-        except Exception as e:
-            raise e
-    
-    def scan_devices(self) -> Dict:
-        """Escaneia dispositivos MIDI disponíveis"""
-        try:
-            self._list_midi_ports()
+            if refresh or not self._available_ports.get('version'):
+                self._list_midi_ports()
             self._check_connectivity()
             
             return {
                 'available_ports': self._available_ports,
+                'ports_version': self._available_ports.get('version'),
                 'device_status': self.device_status,
                 'connected': self._connected,
                 'devices': self.midi_config['devices']
@@ -1130,34 +1644,26 @@ class MIDIController:
             self.logger.error(f"Erro ao escanear dispositivos: {str(e)}")
             return {}
     
-    def get_received_commands(self) -> List[Dict]:
-        """Retorna lista de comandos MIDI recebidos"""
-        commands = getattr(self, '_received_commands', [])
-        # Retorna apenas comandos que ainda não foram enviados
-        new_commands = commands[getattr(self, '_last_sent_index', 0):]
-        self._last_sent_index = len(commands)
-        return new_commands
+    def get_received_commands(self, after_seq: Optional[int] = None) -> List[Dict]:
+        """Retorna comandos MIDI recebidos com sequência maior que after_seq (todos se None)"""
+        commands, _ = self._received_commands.read(after_seq)
+        return commands
+    
+    def read_received_commands(self, after_seq: Optional[int] = None):
+        """Retorna (comandos com seq > after_seq, última sequência) para leitores com cursor próprio"""
+        return self._received_commands.read(after_seq)
     
     def clear_received_commands(self):
         """Limpa lista de comandos MIDI recebidos"""
-        self._received_commands = []
-        self._last_sent_index = 0
+        self._received_commands.clear()
         self.logger.info("Comandos MIDI recebidos limpos")
     
-    def add_received_command(self, command: Dict):
-        """Adiciona comando MIDI recebido à lista"""
-        if not hasattr(self, '_received_commands'):
-            self._received_commands = []
-        
-        # Adiciona timestamp
+    def add_received_command(self, command: Dict) -> int:
+        """Adiciona comando MIDI recebido ao buffer e retorna sua sequência"""
         command['timestamp'] = time.time()
-        
-        # Limita a 100 comandos
-        if len(self._received_commands) >= 100:
-            self._received_commands = self._received_commands[-99:]
-        
-        self._received_commands.append(command)
+        command['seq'] = self._received_commands.append(command)
         self.logger.debug(f"Comando MIDI recebido: {command}")
+        return command['seq']
     
     def start_midi_input_monitoring(self, device_name: str = None):
         """Inicia monitoramento de entrada MIDI usando pool de conexões"""
@@ -1168,11 +1674,6 @@ class MIDIController:
                 self.logger.warning("Nenhum dispositivo de entrada configurado")
                 return False
             
-            # Inicializa lista de comandos se não existir
-            if not hasattr(self, '_received_commands'):
-                self._received_commands = []
-                self._last_sent_index = 0
-            
             # Encontra o nome real do dispositivo
             real_device_name = None
             for device in self.midi_config.get('devices', {}).get('inputs', []):
@@ -1189,10 +1690,10 @@ class MIDIController:
                 if real_device_name in self._available_ports.get('inputs', []):
                     # Usa pool de conexões para entrada MIDI
                     port = self._get_midi_connection(real_device_name, 'input')
-                    if port:
-                        # Configura callback para mensagens recebidas
-                        port.callback = self._on_midi_message
+                    if port and self._add_input_listener(real_device_name, self._on_midi_message):
+                        # Callback registrado entre os listeners da porta
                         self._midi_input = port
+                        self._midi_input_name = real_device_name
                         self.logger.info(f"Monitoramento MIDI iniciado para: {real_device_name}")
                         self._input_monitoring_active = True
                         self._monitoring_device = input_device
@@ -1228,7 +1729,7 @@ class MIDIController:
             # Remove callback da porta
             if hasattr(self, '_midi_input') and self._midi_input:
                 try:
-                    self._midi_input.callback = None
+                    self._remove_input_listener(self._midi_input_name, self._on_midi_message)
                     self._midi_input = None
                 except:
                     pass
@@ -1246,11 +1747,64 @@ class MIDIController:
             'active': getattr(self, '_input_monitoring_active', False),
             'device': getattr(self, '_monitoring_device', None),
             'mode': getattr(self, '_monitoring_mode', 'DISCONNECTED'),
-            'command_count': len(getattr(self, '_received_commands', []))
+            'command_count': len(self._received_commands),
+            'cc_coalescing': self.get_cc_coalescing_stats()
         }
     
+    def _configure_cc_coalescing(self):
+        """(Re)cria o agrupamento de CCs com a taxa configurada (0 desativa)"""
+        try:
+            rate = self._parse_cc_coalesce_rate(self.midi_config.get('cc_coalesce_rate', Config.MIDI_CC_COALESCE_RATE))
+        except ValueError as e:
+            self.logger.warning(f"{str(e)}; usando {Config.MIDI_CC_COALESCE_RATE}")
+            rate = Config.MIDI_CC_COALESCE_RATE
+        previous = self.cc_coalescer
+        self.cc_coalescer = CCCoalescer(self._handle_midi_message, rate) if rate else None
+        if previous:
+            previous.stop()
+    
+    @staticmethod
+    def _parse_cc_coalesce_rate(value) -> float:
+        """Valida a taxa de agrupamento de CCs (número >= 0; 0 desativa)"""
+        if isinstance(value, bool):
+            raise ValueError("cc_coalesce_rate deve ser numérico")
+        try:
+            rate = float(value)
+        except (TypeError, ValueError):
+            raise ValueError("cc_coalesce_rate deve ser numérico")
+        if not math.isfinite(rate) or rate < 0:
+            raise ValueError("cc_coalesce_rate deve ser um número maior ou igual a 0")
+        return int(rate) if rate.is_integer() else rate
+    
+    def get_cc_coalescing_stats(self) -> Optional[Dict]:
+        """Retorna CCs encaminhados e suprimidos pelo agrupamento (None se desativado)"""
+        return self.cc_coalescer.get_stats() if self.cc_coalescer else None
+    
     def _on_midi_message(self, message):
         """Callback para mensagens MIDI recebidas"""
+        coalescer = self.cc_coalescer
+        if coalescer:
+            if message.type == 'control_change' and (message.channel, message.control) not in self._discrete_ccs:
+                # Encaminhado agora ou, se vier rápido demais, só o último valor depois
+                coalescer.submit(message)
+                return
+            if hasattr(message, 'channel'):
+                # PC, nota ou CC de footswitch: os CCs pendentes do canal vão antes
+                coalescer.flush(message.channel)
+        self._handle_midi_message(message)
+    
+    def _handle_midi_message(self, message):
+        """Processa uma mensagem MIDI recebida, uma por vez"""
+        with self._input_lock:
+            self._input_context.active = True
+            try:
+                self._process_midi_message(message)
+            finally:
+                self._input_context.active = False
+    
+    def _process_midi_message(self, message):
+        """Processa uma mensagem MIDI recebida (buffer, ativação de patch, mapeamentos)"""
+        t0 = time.monotonic_ns()
         try:
             # Converte mensagem para formato padrão
             command = {
@@ -1281,45 +1835,16 @@ class MIDIController:
             # Se for Program Change, ativa o patch correspondente do Chocolate
             if message.type == 'program_change':
                 try:
-                    # LOG DETALHADO: Busca de patch
                     self.logger.info(f"[CHOCOLATE DEBUG] Program Change detectado: program={command['program']}")
-                    self.logger.info(f"[CHOCOLATE DEBUG] Total de patches do Chocolate: {len(self.chocolate_patches)}")
-                    
-                    # Lista todos os patches do Chocolate para debug
-                    for i, patch in enumerate(self.chocolate_patches):
-                        self.logger.info(f"[CHOCOLATE DEBUG] Patch {i+1}: id={patch.get('id')}, name={patch.get('name')}, input_channel={patch.get('input_channel')}, program={patch.get('program')}, zoom_patch={patch.get('zoom_patch')}")
                     
-                    # Busca o patch correspondente
-                    patch_encontrado = None
-                    for patch in self.chocolate_patches:
-                        if int(patch.get('input_channel', -1)) == int(command['program']):
-                            patch_encontrado = patch
-                            self.logger.info(f"[CHOCOLATE DEBUG] ✅ Patch encontrado por input_channel: {patch['name']}")
-                            break
-                    
-                    # Se não encontrou por input_channel, tenta por program
-                    if not patch_encontrado:
-                        for patch in self.chocolate_patches:
-                            if int(patch.get('program', -1)) == int(command['program']):
-                                patch_encontrado = patch
-                                self.logger.info(f"[CHOCOLATE DEBUG] ✅ Patch encontrado por program: {patch['name']}")
-                                break
+                    # Busca o patch correspondente no índice (input_channel, depois program)
+                    patch_encontrado = self.find_patch_for_program('Chocolate MIDI', command['program'])
+                    self._record_latency('lookup', 'Chocolate MIDI', t0)
                     
                     if patch_encontrado:
                         self.logger.info(f"[CHOCOLATE DEBUG] Ativando patch: id={patch_encontrado['id']}, name={patch_encontrado['name']}, zoom_patch={patch_encontrado.get('zoom_patch')}")
-                        try:
-                            import requests
-                            response = requests.post(
-                                "http://localhost:5000/api/midi/patch/load",
-                                json={"patch_id": patch_encontrado["id"]}, timeout=2
-                            )
-                            if response.status_code == 200:
-                                self.logger.info(f"[CHOCOLATE DEBUG] ✅ Patch ativado com sucesso via HTTP")
-                            else:
-                                self.logger.error(f"[CHOCOLATE DEBUG] ❌ Erro HTTP ao ativar patch: {response.status_code} - {response.text}")
-                        except Exception as e:
-                            self.logger.error(f"[CHOCOLATE DEBUG] ❌ Erro ao ativar patch via HTTP: {e}")
-                        self._last_patch_activated = patch_encontrado
+                        # Só enfileira no actor; sucesso ou falha são registrados quando o envio terminar
+                        self.dispatch_patch_activation(patch_encontrado, t0)
                     else:
                         self.logger.warning(f"[CHOCOLATE DEBUG] ⚠️ Nenhum patch encontrado para program {command['program']}")
                 except Exception as e:
@@ -1333,65 +1858,70 @@ class MIDIController:
         except Exception as e:
             self.logger.error(f"Erro ao processar mensagem MIDI: {str(e)}")
     
+    def reload_bank_mappings(self, db_manager) -> bool:
+        """Compila os mapeamentos do banco ativo em uma tabela de despacho em memória"""
+        try:
+            active_bank = db_manager.get_active_bank()
+            table = {}
+            if active_bank:
+                for order, mapping in enumerate(active_bank.mappings):
+                    value = mapping.input_value
+                    if mapping.input_type not in ('control_change', 'note_on', 'note_off'):
+                        value = None
+                    key = (mapping.input_type, mapping.input_channel,
+                           self._dispatch_control(mapping.input_type, mapping.input_control), value)
+                    # Mantém o primeiro mapeamento, como na busca linear anterior
+                    table.setdefault(key, (order, mapping))
+            self._bank_dispatch = table
+            # Footswitches: o valor exato importa, então esses CCs não são agrupados
+            self._discrete_ccs = frozenset(
+                (channel, control) for (input_type, channel, control, value) in table
+                if input_type == 'control_change' and value is not None
+            )
+            self.logger.info(f"Mapeamentos de banco compilados: {len(table)} entradas (banco: {active_bank.name if active_bank else 'nenhum'})")
+            return True
+        except Exception as e:
+            self.logger.error(f"Erro ao compilar mapeamentos de banco: {str(e)}")
+            return False
+    
+    @staticmethod
+    def _dispatch_control(input_type: str, control):
+        """Normaliza o controle da chave de despacho (ignorado para tipos sem controle)"""
+        if input_type in ('control_change', 'note_on', 'note_off', 'program_change'):
+            return control
+        return None
+    
     def _process_bank_mappings(self, input_command: Dict):
         """Processa mapeamentos de banco para comandos de entrada"""
         try:
-            # Obtém o banco ativo
-            from app.database.models import DatabaseManager
-            db_path = os.path.join(Config.BASE_DIR, 'data', 'raspmidi.db')
-            db_manager = DatabaseManager(db_path)
-            active_bank = db_manager.get_active_bank()
-            
-            if not active_bank:
+            table = self._bank_dispatch
+            if not table:
                 return
             
-            # Procura por mapeamentos que correspondem ao comando de entrada
-            for mapping in active_bank.mappings:
-                if self._matches_input_command(input_command, mapping):
-                    self._execute_output_command(mapping)
-                    self.logger.info(f"Mapeamento executado: {mapping.description}")
-                    break
+            input_type = input_command['type']
+            if input_type == 'control_change':
+                control, value = input_command.get('cc'), input_command.get('value')
+            elif input_type in ('note_on', 'note_off'):
+                control, value = input_command.get('note'), input_command.get('velocity')
+            elif input_type == 'program_change':
+                control, value = input_command.get('program'), None
+            else:
+                control, value = None, None
+            
+            base = (input_type, input_command.get('channel', 0), control)
+            exact = table.get(base + (value,)) if value is not None else None
+            wildcard = table.get(base + (None,))
+            
+            # Entre um mapeamento com valor específico e um genérico, vale o definido primeiro
+            candidates = [c for c in (exact, wildcard) if c]
+            if candidates:
+                mapping = min(candidates, key=lambda c: c[0])[1]
+                self._execute_output_command(mapping)
+                self.logger.info(f"Mapeamento executado: {mapping.description}")
                     
         except Exception as e:
             self.logger.error(f"Erro ao processar mapeamentos de banco: {str(e)}")
     
-    def _matches_input_command(self, input_command: Dict, mapping) -> bool:
-        """Verifica se um comando de entrada corresponde a um mapeamento"""
-        try:
-            # Verifica tipo de comando
-            if mapping.input_type != input_command['type']:
-                return False
-            
-            # Verifica canal
-            if mapping.input_channel != input_command.get('channel', 0):
-                return False
-            
-            # Verifica controle específico
-            if mapping.input_type == 'control_change':
-                if mapping.input_control != input_command.get('cc'):
-                    return False
-            elif mapping.input_type in ['note_on', 'note_off']:
-                if mapping.input_control != input_command.get('note'):
-                    return False
-            elif mapping.input_type == 'program_change':
-                if mapping.input_control != input_command.get('program'):
-                    return False
-            
-            # Verifica valor específico se definido
-            if mapping.input_value is not None:
-                if mapping.input_type == 'control_change':
-                    if mapping.input_value != input_command.get('value'):
-                        return False
-                elif mapping.input_type in ['note_on', 'note_off']:
-                    if mapping.input_value != input_command.get('velocity'):
-                        return False
-            
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Erro ao verificar correspondência de comando: {str(e)}")
-            return False
-    
     def _execute_output_command(self, mapping):
         """Executa comando de saída baseado no mapeamento"""
         try:
@@ -1455,27 +1985,29 @@ class MIDIController:
             self.logger.error(f"Erro ao desconectar dispositivos: {str(e)}")
     
     def send_sysex(self, data: list, device_name: str = None, output_channel: int = 0) -> bool:
+        """Envia SysEx para o dispositivo de saída ou nome especificado (na thread do actor da porta de saída)"""
+        return self._run_on_output(device_name, self._send_sysex_now, data, device_name, output_channel)
+    
+    def _send_sysex_now(self, data: list, device_name: str = None, output_channel: int = 0) -> bool:
         """Envia mensagem SysEx para o dispositivo de saída ou nome especificado, aceita canal de saída para referência/log."""
         try:
             output_device = device_name or self.midi_config.get('output_device')
             if not output_device:
                 self.logger.error("Nenhum dispositivo de saída configurado")
                 return False
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == output_device or device['real_name'] == output_device:
-                    real_device_name = device['real_name']
-                    break
-            if not real_device_name:
+            # Resolve a porta real pela tabela de rotas
+            route = self._resolve_output(output_device)
+            if not route:
                 self.logger.error(f"Dispositivo {output_device} não encontrado")
                 return False
+            real_device_name = route[0]
             import mido
             sysex_data = [0xF0] + data + [0xF7]
             # Canal de saída não é usado diretamente em SysEx, mas pode ser incluído no log
             msg = mido.Message('sysex', data=sysex_data[1:-1])
-            with mido.open_output(real_device_name) as port:
-                port.send(msg)
+            if not self._send_midi_with_connection_pool(msg, real_device_name):
+                self.logger.error(f"Falha ao enviar SysEx para {real_device_name}")
+                return False
             self.logger.info(f"SysEx enviado para {real_device_name} (canal de saída {output_channel}): {sysex_data}")
             return True
         except Exception as e:
@@ -1489,23 +2021,21 @@ class MIDIController:
             if not output_device:
                 self.logger.error("Nenhum dispositivo de saída configurado")
                 return False
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == output_device or device['real_name'] == output_device:
-                    real_device_name = device['real_name']
-                    break
-            if not real_device_name:
+            # Resolve a porta real pela tabela de rotas
+            route = self._resolve_output(output_device)
+            if not route:
                 self.logger.error(f"Dispositivo {output_device} não encontrado")
                 return False
+            real_device_name = route[0]
             import mido
             # B0 20 ff
             msg1 = mido.Message('control_change', channel=0, control=32, value=ff)
             # C0 ss
             msg2 = mido.Message('program_change', channel=0, program=ss)
-            with mido.open_output(real_device_name) as port:
-                port.send(msg1)
-                port.send(msg2)
+            if not (self._send_midi_with_connection_pool(msg1, real_device_name) and
+                    self._send_midi_with_connection_pool(msg2, real_device_name)):
+                self.logger.error(f"Falha ao enviar Patch Select para {real_device_name}")
+                return False
             self.logger.info(f"Patch select enviado para {real_device_name}: ff={ff}, ss={ss}")
             return True
         except Exception as e:
@@ -1539,10 +2069,8 @@ class MIDIController:
             
             # Verifica se a porta do Zoom G3X está disponível
             try:
-                import mido
-                available_outputs = mido.get_output_names()
                 zoom_port = self.device_status['zoom_g3x']['port']
-                if zoom_port and zoom_port in available_outputs:
+                if zoom_port and self._port_available(zoom_port):
                     zoom_status['port_available'] = True
                     zoom_status['status_details'] += ' - Porta disponível no sistema'
                 else:
@@ -1573,10 +2101,8 @@ class MIDIController:
             
             # Verifica se a porta do Chocolate está disponível nas entradas
             try:
-                import mido
-                available_inputs = mido.get_input_names()
                 chocolate_port = self.device_status['chocolate']['port']
-                if chocolate_port and chocolate_port in available_inputs:
+                if chocolate_port and self._port_available(chocolate_port, 'input'):
                     chocolate_status['port_available'] = True
                     chocolate_status['status_details'] += ' - Porta disponível no sistema'
                 else:
@@ -1648,36 +2174,23 @@ class MIDIController:
     def _send_pc_to_device(self, channel: int, program: int, device_name: str) -> bool:
         """Envia mensagem Program Change para um dispositivo específico"""
         try:
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == device_name or device['real_name'] == device_name:
-                    real_device_name = device['real_name']
-                    break
-            
-            if not real_device_name:
+            # Resolve porta real e controlador pela tabela de rotas
+            route = self._resolve_output(device_name)
+            if not route:
                 self.logger.error(f"Dispositivo {device_name} não encontrado")
                 return False
+            real_device_name, controller, device_type = route
             
             # Tenta enviar via controlador específico primeiro
-            if 'zoom' in device_name.lower() or 'g3x' in device_name.lower():
-                if self.zoom_g3x and self.device_status['zoom_g3x']['connected']:
-                    try:
-                        result = self.zoom_g3x.send_pc(channel, program)
-                        if result:
-                            self.device_status['zoom_g3x']['last_pc'] = program
-                            return result
-                    except Exception as e:
-                        self.logger.warning(f"Erro ao enviar via controlador Zoom G3X: {str(e)}, tentando via mido")
-            elif 'chocolate' in device_name.lower():
-                if self.chocolate and self.device_status['chocolate']['connected']:
-                    try:
-                        result = self.chocolate.send_pc(channel, program)
-                        if result:
-                            self.device_status['chocolate']['last_pc'] = program
-                            return result
-                    except Exception as e:
-                        self.logger.warning(f"Erro ao enviar via controlador Chocolate: {str(e)}, tentando via mido")
+            controller = self._route_controller(controller, device_type)
+            if controller:
+                try:
+                    result = controller.send_pc(channel, program)
+                    if result:
+                        self.device_status[device_type]['last_pc'] = program
+                        return result
+                except Exception as e:
+                    self.logger.warning(f"Erro ao enviar via controlador {device_type}: {str(e)}, tentando via mido")
             
             # Sempre tenta enviar diretamente via mido como fallback
             self.logger.info(f"Tentando enviar PC via mido para {real_device_name}")
@@ -1685,10 +2198,8 @@ class MIDIController:
             
             # Atualiza last_pc se sucesso
             if result:
-                if 'zoom' in device_name.lower() or 'g3x' in device_name.lower():
-                    self.device_status['zoom_g3x']['last_pc'] = program
-                elif 'chocolate' in device_name.lower():
-                    self.device_status['chocolate']['last_pc'] = program
+                if device_type in self.device_status:
+                    self.device_status[device_type]['last_pc'] = program
                 self.logger.info(f"PC {program} enviado com sucesso para {real_device_name}")
             else:
                 self.logger.error(f"Falha ao enviar PC {program} para {real_device_name}")
@@ -1744,32 +2255,113 @@ class MIDIController:
         return None
 
     def atualizar_patches_chocolate(self, patches):
+        """Atualiza a lista de patches do Chocolate"""
         self.chocolate_patches = [p for p in patches if p.get('input_device') == 'Chocolate MIDI']
 
+    def find_patch_for_program(self, input_device: str, program: int) -> Optional[Dict]:
+        """Retorna o patch associado a um Program Change (índices do snapshot de patches do cache)"""
+        if not self.cache_manager:
+            return None
+        return self.cache_manager.find_patch_for_program(input_device, program)
+
+    def set_cache_manager(self, cache_manager):
+        """Define o gerenciador de cache usado na ativação direta de patches"""
+        self.cache_manager = cache_manager
+        self.atualizar_patches_chocolate(cache_manager.get_patches())
+        cache_manager.add_patches_listener(self.atualizar_patches_chocolate)
+
+    def dispatch_patch_activation(self, patch_data: Dict, t0: Optional[int] = None):
+        """Ativa um patch diretamente no processo (sem HTTP), a partir do callback de entrada MIDI.
+
+        Retorna o Future do envio quando chamado do callback de entrada (ver _run_on_device).
+        """
+        if t0 is None:
+            t0 = time.monotonic_ns()
+        patch_id = patch_data.get('id')
+        
+        # Usa a versão mais recente do patch no cache, como a rota /patch/load
+        if self.cache_manager and patch_id is not None:
+            patch_data = self.cache_manager.get_patch(patch_id) or patch_data
+        
+        self._activation_trace.t0 = t0
+        try:
+            result = self.activate_patch(patch_data)
+        finally:
+            self._activation_trace.t0 = None
+        
+        if self.cache_manager and patch_id is not None:
+            # Só marca como ativo depois que o actor enviou o patch com sucesso
+            self._on_send_result(result, lambda success: success and self.cache_manager.set_active_patch(patch_id))
+        return result
+
+    def _current_trace(self) -> Optional[int]:
+        """t0 (ns) da ativação em andamento nesta thread (None fora de uma ativação)"""
+        return getattr(self._activation_trace, 't0', None)
+
+    def _on_port_send(self, port_name: Optional[str] = None):
+        """Registra a latência entre o callback de entrada e o primeiro port.send da ativação"""
+        t0 = self._current_trace()
+        if t0 is None:
+            return
+        self._activation_trace.t0 = None
+        self._record_latency('send', port_name, t0)
+
+    def _record_latency(self, stage: str, device: Optional[str], t0: int):
+        """Registra no histograma o tempo desde o callback de entrada até a etapa"""
+        elapsed_ns = time.monotonic_ns() - t0
+        self.latency_metrics.record(stage, device or 'desconhecido', elapsed_ns)
+        if stage != 'send':
+            return
+        latency_ms = elapsed_ns / 1_000_000
+        
+        stats = self._activation_stats
+        stats['count'] += 1
+        stats['last_ms'] = latency_ms
+        stats['total_ms'] += latency_ms
+        if stats['max_ms'] is None or latency_ms > stats['max_ms']:
+            stats['max_ms'] = latency_ms
+        self.logger.info(f"⏱️ Latência da ativação (callback → port.send): {latency_ms:.3f} ms")
+
+    def get_activation_stats(self) -> Dict:
+        """Retorna estatísticas de latência da ativação via entrada MIDI"""
+        stats = self._activation_stats
+        return {
+            'count': stats['count'],
+            'last_ms': stats['last_ms'],
+            'max_ms': stats['max_ms'],
+            'avg_ms': stats['total_ms'] / stats['count'] if stats['count'] else None
+        }
+
+    def get_latency_metrics(self) -> Dict:
+        """Retorna p50/p95/p99/máximo por etapa da ativação e por dispositivo"""
+        return self.latency_metrics.to_dict()
+
     def send_patch_select(self, ff: int, ss: int, device_name: str = None) -> bool:
+        """Envia comando para selecionar patch, B0 20 ff C0 ss (na thread do actor da porta de saída)"""
+        return self._run_on_output(device_name, self._send_patch_select_now, ff, ss, device_name)
+    
+    def _send_patch_select_now(self, ff: int, ss: int, device_name: str = None) -> bool:
         """Envia comando para selecionar patch (B0 20 ff C0 ss)"""
         try:
             output_device = device_name or self.midi_config.get('output_device')
             if not output_device:
                 self.logger.error("Nenhum dispositivo de saída configurado")
                 return False
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == output_device or device['real_name'] == output_device:
-                    real_device_name = device['real_name']
-                    break
-            if not real_device_name:
+            # Resolve a porta real pela tabela de rotas
+            route = self._resolve_output(output_device)
+            if not route:
                 self.logger.error(f"Dispositivo {output_device} não encontrado")
                 return False
+            real_device_name = route[0]
             import mido
             # B0 20 ff
             msg1 = mido.Message('control_change', channel=0, control=32, value=ff)
             # C0 ss
             msg2 = mido.Message('program_change', channel=0, program=ss)
-            with mido.open_output(real_device_name) as port:
-                port.send(msg1)
-                port.send(msg2)
+            if not (self._send_midi_with_connection_pool(msg1, real_device_name) and
+                    self._send_midi_with_connection_pool(msg2, real_device_name)):
+                self.logger.error(f"Falha ao enviar Patch Select para {real_device_name}")
+                return False
             self.logger.info(f"Patch select enviado para {real_device_name}: ff={ff}, ss={ss}")
             return True
         except Exception as e:
@@ -1803,10 +2395,8 @@ class MIDIController:
             
             # Verifica se a porta do Zoom G3X está disponível
             try:
-                import mido
-                available_outputs = mido.get_output_names()
                 zoom_port = self.device_status['zoom_g3x']['port']
-                if zoom_port and zoom_port in available_outputs:
+                if zoom_port and self._port_available(zoom_port):
                     zoom_status['port_available'] = True
                     zoom_status['status_details'] += ' - Porta disponível no sistema'
                 else:
@@ -1837,10 +2427,8 @@ class MIDIController:
             
             # Verifica se a porta do Chocolate está disponível nas entradas
             try:
-                import mido
-                available_inputs = mido.get_input_names()
                 chocolate_port = self.device_status['chocolate']['port']
-                if chocolate_port and chocolate_port in available_inputs:
+                if chocolate_port and self._port_available(chocolate_port, 'input'):
                     chocolate_status['port_available'] = True
                     chocolate_status['status_details'] += ' - Porta disponível no sistema'
                 else:
@@ -1910,38 +2498,29 @@ class MIDIController:
             return False
 
     def _send_pc_to_device(self, channel: int, program: int, device_name: str) -> bool:
+        """Envia mensagem Program Change para um dispositivo específico (na thread do actor da porta de saída)"""
+        return self._run_on_output(device_name, self._send_pc_to_device_now, channel, program, device_name)
+    
+    def _send_pc_to_device_now(self, channel: int, program: int, device_name: str) -> bool:
         """Envia mensagem Program Change para um dispositivo específico"""
         try:
-            # Encontra o nome real do dispositivo
-            real_device_name = None
-            for device in self.midi_config.get('devices', {}).get('outputs', []):
-                if device['name'] == device_name or device['real_name'] == device_name:
-                    real_device_name = device['real_name']
-                    break
-            
-            if not real_device_name:
+            # Resolve porta real e controlador pela tabela de rotas
+            route = self._resolve_output(device_name)
+            if not route:
                 self.logger.error(f"Dispositivo {device_name} não encontrado")
                 return False
+            real_device_name, controller, device_type = route
             
             # Tenta enviar via controlador específico primeiro
-            if 'zoom' in device_name.lower() or 'g3x' in device_name.lower():
-                if self.zoom_g3x and self.device_status['zoom_g3x']['connected']:
-                    try:
-                        result = self.zoom_g3x.send_pc(channel, program)
-                        if result:
-                            self.device_status['zoom_g3x']['last_pc'] = program
-                            return result
-                    except Exception as e:
-                        self.logger.warning(f"Erro ao enviar via controlador Zoom G3X: {str(e)}, tentando via mido")
-            elif 'chocolate' in device_name.lower():
-                if self.chocolate and self.device_status['chocolate']['connected']:
-                    try:
-                        result = self.chocolate.send_pc(channel, program)
-                        if result:
-                            self.device_status['chocolate']['last_pc'] = program
-                            return result
-                    except Exception as e:
-                        self.logger.warning(f"Erro ao enviar via controlador Chocolate: {str(e)}, tentando via mido")
+            controller = self._route_controller(controller, device_type)
+            if controller:
+                try:
+                    result = controller.send_pc(channel, program)
+                    if result:
+                        self.device_status[device_type]['last_pc'] = program
+                        return result
+                except Exception as e:
+                    self.logger.warning(f"Erro ao enviar via controlador {device_type}: {str(e)}, tentando via mido")
             
             # Sempre tenta enviar diretamente via mido como fallback
             self.logger.info(f"Tentando enviar PC via mido para {real_device_name}")
@@ -1949,10 +2528,8 @@ class MIDIController:
             
             # Atualiza last_pc se sucesso
             if result:
-                if 'zoom' in device_name.lower() or 'g3x' in device_name.lower():
-                    self.device_status['zoom_g3x']['last_pc'] = program
-                elif 'chocolate' in device_name.lower():
-                    self.device_status['chocolate']['last_pc'] = program
+                if device_type in self.device_status:
+                    self.device_status[device_type]['last_pc'] = program
                 self.logger.info(f"PC {program} enviado com sucesso para {real_device_name}")
             else:
                 self.logger.error(f"Falha ao enviar PC {program} para {real_device_name}")
@@ -1963,31 +2540,31 @@ class MIDIController:
             self.logger.error(f"Erro ao enviar PC para dispositivo {device_name}: {str(e)}")
             return False
 
-    def activate_patch(self, patch_data: Dict) -> bool:
-        """Ativa um patch enviando para o dispositivo e marcando como ativo"""
+    def activate_patch(self, patch_data: Dict):
+        """Ativa um patch enviando para o dispositivo e marcando como ativo (após o envio concluir)"""
         try:
             self.logger.info(f"🎹 [ACTIVATE_PATCH_DEBUG] Iniciando ativação do patch: {patch_data.get('name')}")
             
-            # Envia o patch para o dispositivo
-            success = self.send_patch(patch_data)
-            
-            if success:
-                # Marca como último patch ativado
-                self._last_patch_activated = patch_data
-                self.logger.info(f"🎹 [ACTIVATE_PATCH_DEBUG] Patch '{patch_data.get('name')}' ativado e marcado como ativo")
-                self.logger.info(f"🎹 [ACTIVATE_PATCH_DEBUG] _last_patch_activated definido: {self._last_patch_activated.get('name') if self._last_patch_activated else 'None'}")
-                # Salva em disco
-                try:
-                    with open(os.path.join('data', 'active_patch.json'), 'w', encoding='utf-8') as f:
-                        json.dump(patch_data, f, ensure_ascii=False, indent=2)
-                    self.logger.info(f"🎹 [ACTIVATE_PATCH_DEBUG] Patch ativo salvo em data/active_patch.json")
-                except Exception as e:
-                    self.logger.error(f"🎹 [ACTIVATE_PATCH_DEBUG] Erro ao salvar patch ativo em disco: {str(e)}")
-            else:
-                self.logger.error(f"🎹 [ACTIVATE_PATCH_DEBUG] Falha ao enviar patch para dispositivo")
-            
-            return success
+            # Envia o patch para o dispositivo (Future se chamado do callback de entrada)
+            result = self.send_patch(patch_data)
+            self._on_send_result(result, lambda success: self._record_activation(patch_data, success))
+            return result
         except Exception as e:
             self.logger.error(f"🎹 [ACTIVATE_PATCH_DEBUG] Erro ao ativar patch: {str(e)}")
             return False
+    
+    def _record_activation(self, patch_data: Dict, success: bool):
+        """Marca o patch como último ativado (memória e disco) se o envio teve sucesso"""
+        if not success:
+            self.logger.error(f"🎹 [ACTIVATE_PATCH_DEBUG] Falha ao enviar patch para dispositivo")
+            return
+        self._last_patch_activated = patch_data
+        self.logger.info(f"🎹 [ACTIVATE_PATCH_DEBUG] Patch '{patch_data.get('name')}' ativado e marcado como ativo")
+        # Salva em disco
+        try:
+            with open(os.path.join('data', 'active_patch.json'), 'w', encoding='utf-8') as f:
+                json.dump(patch_data, f, ensure_ascii=False, indent=2)
+            self.logger.info(f"🎹 [ACTIVATE_PATCH_DEBUG] Patch ativo salvo em data/active_patch.json")
+        except Exception as e:
+            self.logger.error(f"🎹 [ACTIVATE_PATCH_DEBUG] Erro ao salvar patch ativo em disco: {str(e)}")
  
\ No newline at end of file
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Thread dona de um dispositivo de saída MIDI
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+class DeviceActor:
+    """Executa, em ordem e numa thread própria, os comandos de um dispositivo.
+
+    Cada porta de saída tem o seu actor: threads HTTP, o callback de entrada
+    e os controladores só colocam comandos na fila de entrada e aguardam o
+    resultado. Um dispositivo lento (carga de efeitos do Zoom, SysEx) atrasa
+    apenas os comandos dele; as outras portas seguem em paralelo.
+    """
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self._inbox = queue.Queue()
+        self._running = True
+        self._stats = {'executed': 0, 'errors': 0, 'max_depth': 0, 'busy_ms': 0.0, 'max_ms': None}
+        self._thread = threading.Thread(target=self._run, name=f"midi-actor-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, command: Callable, *args) -> Future:
+        """Enfileira um comando e retorna o Future com o resultado"""
+        future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError(f"Actor {self.name} encerrado"))
+            return future
+        self._inbox.put((command, args, future))
+        self._stats['max_depth'] = max(self._stats['max_depth'], self._inbox.qsize())
+        return future
+
+    def call(self, command: Callable, *args, timeout: float = None):
+        """Executa o comando na thread do actor e aguarda o resultado"""
+        if self.is_current_thread():
+            # Chamada feita de dentro de um comando: executa direto (evita deadlock)
+            return command(*args)
+        return self.submit(command, *args).result(timeout)
+
+    def is_current_thread(self) -> bool:
+        """True se chamado de dentro de um comando deste actor"""
+        return threading.current_thread() is self._thread
+
+    def stop(self):
+        """Encerra a thread depois dos comandos já enfileirados"""
+        self._running = False
+        self._inbox.put(None)
+
+    def get_stats(self) -> Dict:
+        """Retorna comandos executados, profundidade e tempo ocupado"""
+        stats = dict(self._stats, depth=self._inbox.qsize(), running=self._running)
+        stats['avg_ms'] = stats['busy_ms'] / stats['executed'] if stats['executed'] else None
+        return stats
+
+    def _run(self):
+        while True:
+            item = self._inbox.get()
+            if item is None:
+                return
+            command, args, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                future.set_result(command(*args))
+            except Exception as e:
+                self._stats['errors'] += 1
+                self.logger.error(f"Erro ao executar comando no actor {self.name}: {str(e)}")
+                future.set_exception(e)
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                stats = self._stats
+                stats['executed'] += 1
+                stats['busy_ms'] += elapsed_ms
+                if stats['max_ms'] is None or elapsed_ms > stats['max_ms']:
+                    stats['max_ms'] = elapsed_ms
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Espelho do estado conhecido dos dispositivos de saída
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+class DeviceStateMirror:
+    """Último estado conhecido de um dispositivo de saída.
+
+    Atualizado após cada envio bem-sucedido: programa atual e último valor
+    de cada CC por canal. Um Program Change enviado recarrega o patch salvo no
+    pedal, cujo estado dos efeitos o RaspMIDI não conhece, então os CCs
+    daquele canal passam a ser desconhecidos e a ativação seguinte os reenvia.
+    Um PC pulado por ser redundante (outro patch com o mesmo programa) mantém
+    os CCs, e só os efeitos que mudam são enviados. Quem ativa decide quando um
+    PC repetido deve ser reenviado para restaurar o pedal (ver ZoomG3XController).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._programs = {}  # canal -> programa
+        self._cc = {}        # canal -> {controle: valor}
+        self.updated_at = None
+
+    def apply(self, message):
+        """Registra uma mensagem enviada com sucesso"""
+        with self._lock:
+            if message.type == 'program_change':
+                self._programs[message.channel] = message.program
+                self._cc.pop(message.channel, None)
+            elif message.type == 'control_change':
+                self._cc.setdefault(message.channel, {})[message.control] = message.value
+            else:
+                return
+            self.updated_at = time.time()
+
+    def apply_bytes(self, data):
+        """Registra uma mensagem enviada como bytes crus (PC e CC)"""
+        status = data[0] & 0xF0
+        channel = data[0] & 0x0F
+        with self._lock:
+            if status == 0xC0:
+                self._programs[channel] = data[1]
+                self._cc.pop(channel, None)
+            elif status == 0xB0:
+                self._cc.setdefault(channel, {})[data[1]] = data[2]
+            else:
+                return
+            self.updated_at = time.time()
+    
+    def is_redundant(self, message) -> bool:
+        """True se a mensagem não mudaria nada no estado conhecido"""
+        with self._lock:
+            if message.type == 'program_change':
+                return self._programs.get(message.channel) == message.program
+            if message.type == 'control_change':
+                return self._cc.get(message.channel, {}).get(message.control) == message.value
+            return False
+
+    def get_program(self, channel: int = 0) -> Optional[int]:
+        """Retorna o programa atual do canal (None se desconhecido)"""
+        return self._programs.get(channel)
+
+    def get_cc(self, channel: int, control: int) -> Optional[int]:
+        """Retorna o último valor de CC enviado (None se desconhecido)"""
+        return self._cc.get(channel, {}).get(control)
+
+    def to_messages(self) -> List:
+        """Mensagens que reproduzem o estado conhecido (Program Change antes dos CCs)"""
+        with self._lock:
+            return self._build_messages(self._programs, self._cc)
+
+    def capture(self) -> Tuple[Dict, Dict]:
+        """Cópia do estado conhecido (programas, CCs por canal), guardada numa queda da porta"""
+        with self._lock:
+            return dict(self._programs), {channel: dict(values) for channel, values in self._cc.items()}
+
+    def restore_messages(self, captured: Tuple[Dict, Dict]) -> List:
+        """Mensagens que restauram o estado capturado somado ao que já foi enviado depois da reabertura.
+
+        Um programa enviado depois da reabertura substitui o capturado (e os
+        CCs capturados daquele canal); CCs enviados depois prevalecem.
+        """
+        programs = dict(captured[0])
+        cc = {channel: dict(values) for channel, values in captured[1].items()}
+        with self._lock:
+            for channel, program in self._programs.items():
+                if programs.get(channel) != program:
+                    cc.pop(channel, None)
+                programs[channel] = program
+            for channel, values in self._cc.items():
+                cc.setdefault(channel, {}).update(values)
+        return self._build_messages(programs, cc)
+
+    @staticmethod
+    def _build_messages(programs: Dict, cc: Dict) -> List:
+        import mido
+        messages = [mido.Message('program_change', channel=channel, program=program)
+                    for channel, program in sorted(programs.items())]
+        for channel, values in sorted(cc.items()):
+            messages.extend(mido.Message('control_change', channel=channel, control=control, value=value)
+                            for control, value in sorted(values.items()))
+        return messages
+    
+    def invalidate(self):
+        """Esquece o estado (reconexão ou alteração feita no próprio pedal)"""
+        with self._lock:
+            self._programs.clear()
+            self._cc.clear()
+            self.updated_at = None
+
+    def to_dict(self) -> Dict:
+        """Retorna o estado conhecido em formato serializável"""
+        with self._lock:
+            return {
+                'programs': dict(self._programs),
+                'cc': {channel: dict(values) for channel, values in self._cc.items()},
+                'updated_at': self.updated_at
+            }
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Histogramas de latência da ativação de patches
+"""
+
+import bisect
+import threading
+from typing import Dict
+
+# Limites superiores dos buckets em microssegundos (série 1-2-5 de 10 µs a 5 s)
+BUCKET_BOUNDS_US = [
+    10, 20, 50, 100, 200, 500,
+    1_000, 2_000, 5_000, 10_000, 20_000, 50_000,
+    100_000, 200_000, 500_000, 1_000_000, 2_000_000, 5_000_000
+]
+
+class LatencyHistogram:
+    """Histograma de buckets fixos: registro O(log n) sem guardar amostras.
+
+    Os percentis são estimados pelo limite superior do bucket que contém a
+    posição pedida (limitados ao máximo observado, que é exato).
+    """
+
+    def __init__(self):
+        self._counts = [0] * (len(BUCKET_BOUNDS_US) + 1)  # Último bucket: acima de 5 s
+        self.count = 0
+        self.max_ns = 0
+
+    def record(self, elapsed_ns: int):
+        """Registra uma amostra em nanossegundos"""
+        self._counts[bisect.bisect_left(BUCKET_BOUNDS_US, elapsed_ns / 1000)] += 1
+        self.count += 1
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+    def percentile(self, fraction: float) -> float:
+        """Percentil estimado em milissegundos"""
+        max_ms = self.max_ns / 1_000_000
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if count and seen >= rank:
+                if index == len(BUCKET_BOUNDS_US):
+                    return max_ms
+                return min(BUCKET_BOUNDS_US[index] / 1000, max_ms)
+        return max_ms
+
+    def to_dict(self) -> Dict:
+        """Resumo com contagem, p50/p95/p99 e máximo"""
+        if not self.count:
+            return {'count': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+        return {
+            'count': self.count,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max_ns / 1_000_000
+        }
+
+class LatencyMetrics:
+    """Histogramas por etapa da ativação e por dispositivo.
+
+    Cada amostra é o tempo desde o callback de entrada MIDI até a etapa:
+    'lookup' (patch encontrado), 'enqueue' (mensagens na fila de
+    transmissão) e 'send' (retorno do primeiro port.send).
+    """
+
+    STAGES = ('lookup', 'enqueue', 'send')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (etapa, dispositivo) -> LatencyHistogram
+
+    def record(self, stage: str, device: str, elapsed_ns: int):
+        """Registra a latência de uma etapa para um dispositivo"""
+        with self._lock:
+            histogram = self._histograms.get((stage, device))
+            if histogram is None:
+                histogram = self._histograms[(stage, device)] = LatencyHistogram()
+            histogram.record(elapsed_ns)
+
+    def reset(self):
+        """Descarta todas as amostras"""
+        with self._lock:
+            self._histograms = {}
+
+    def to_dict(self) -> Dict:
+        """Resumo por etapa e dispositivo"""
+        with self._lock:
+            summary = {stage: {} for stage in self.STAGES}
+            for (stage, device), histogram in self._histograms.items():
+                summary.setdefault(stage, {})[device] = histogram.to_dict()
+        summary['buckets_us'] = BUCKET_BOUNDS_US
+        return summary
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Planos de transmissão pré-compilados por patch
+"""
+
+import logging
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+class PlanStep(NamedTuple):
+    """Uma mensagem do plano: bytes MIDI, mensagem mido pronta e pausa após o envio"""
+    data: bytes
+    message: object
+    delay: float
+
+class PatchPlan(NamedTuple):
+    """Plano imutável de um patch: o que enviar e para qual dispositivo.
+
+    kind 'zoom' vai para a fila cadenciada do Zoom G3X; 'generic' é enviado
+    direto pela porta do pool. source é o dicionário do cache que originou o
+    plano: a ativação só reaproveita o plano se recebeu esse mesmo objeto.
+    """
+    patch_id: Optional[int]
+    output_device: str
+    kind: str
+    steps: Tuple[PlanStep, ...]
+    items: Tuple[Tuple[object, float], ...]  # Pares (mensagem, pausa) para a fila de transmissão
+    source: Dict
+
+def is_zoom_device(device_name: str) -> bool:
+    """Mesma regra de send_patch para delegar ao controlador Zoom G3X"""
+    name = device_name.lower()
+    return 'zoom' in name or 'g3x' in name
+
+def _step(message, delay: float = 0.0) -> PlanStep:
+    return PlanStep(bytes(message.bytes()), message, delay)
+
+def _plan(patch: Dict, kind: str, steps) -> PatchPlan:
+    steps = tuple(steps)
+    items = tuple((step.message, step.delay) for step in steps)
+    return PatchPlan(patch.get('id'), patch['output_device'], kind, steps, items, patch)
+
+def compile_patch_plan(patch: Dict) -> Optional[PatchPlan]:
+    """Compila o patch em um plano de transmissão (None se não der para pré-compilar)"""
+    device_name = patch.get('output_device')
+    if not device_name:
+        return None
+    try:
+        import mido
+        if is_zoom_device(device_name):
+            program = patch.get('zoom_patch')
+            if program is None:
+                return None
+            steps = [_step(mido.Message('program_change', channel=0, program=int(program)), Config.ZOOM_PC_DELAY)]
+            for effect_name, effect_params in (patch.get('effects') or {}).items():
+                if effect_name in Config.ZOOM_EFFECTS and 'enabled' in effect_params:
+                    value = 127 if effect_params['enabled'] else 0
+                    message = mido.Message('control_change', channel=0, control=Config.ZOOM_EFFECTS[effect_name]['cc'], value=value)
+                    steps.append(_step(message, Config.ZOOM_CC_DELAY))
+            return _plan(patch, 'zoom', steps)
+        
+        command_type = patch.get('command_type')
+        channel = patch.get('channel', 1)  # Canal padrão 1, como em send_patch
+        if command_type == 'pc' and patch.get('program') is not None:
+            message = mido.Message('program_change', channel=channel, program=patch['program'])
+        elif command_type == 'cc' and patch.get('cc') is not None and patch.get('value') is not None:
+            message = mido.Message('control_change', channel=channel, control=patch['cc'], value=patch['value'])
+        elif command_type == 'note_on' and patch.get('note') is not None:
+            message = mido.Message('note_on', channel=channel, note=patch['note'], velocity=patch.get('velocity', 127))
+        elif command_type == 'note_off' and patch.get('note') is not None:
+            message = mido.Message('note_off', channel=channel, note=patch['note'], velocity=0)
+        else:
+            return None
+        return _plan(patch, 'generic', [_step(message)])
+    except Exception as e:
+        # Dados inválidos: a ativação segue pelo caminho interpretado, que registra o erro
+        logger.debug(f"Patch {patch.get('id')} não pré-compilado: {str(e)}")
+        return None
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Monitor de conexão/desconexão de portas MIDI (hotplug)
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Sufixo "cliente:porta" do ALSA, que muda quando o USB reenumera (ex.: " 24:0")
+_ALSA_CLIENT_SUFFIX = re.compile(r'\s+\d+:\d+$')
+
+def port_base_name(port_name: str) -> str:
+    """Nome da porta sem o sufixo cliente:porta do ALSA (estável entre reconexões)"""
+    return _ALSA_CLIENT_SUFFIX.sub('', port_name)
+
+class PortWatcher:
+    """Mantém um snapshot versionado das portas MIDI disponíveis.
+
+    Uma única thread enumera as portas do mido. Se o pyudev estiver instalado,
+    ela só enumera quando um evento USB do subsistema de som a acorda (mais
+    uma verificação de segurança a cada `fallback_interval` segundos); sem
+    udev, verifica a cada `interval` segundos. Uma mudança só é publicada depois de
+    ficar estável por `debounce` segundos (a reenumeração USB cria as portas
+    em etapas); então a versão é incrementada e os listeners recebem
+    (adicionadas, removidas, snapshot).
+    """
+
+    def __init__(self, interval: float = 0.5, debounce: float = 0.3, fallback_interval: float = 30.0):
+        self.logger = logging.getLogger(__name__)
+        self.interval = interval
+        self.fallback_interval = fallback_interval
+        self.debounce = debounce
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._refresh_requested = False
+        self._running = False
+        self._thread = None
+        self._udev_observer = None
+        self._snapshot = {'version': 0, 'inputs': [], 'outputs': [], 'updated_at': None}
+
+    def snapshot(self) -> Dict:
+        """Retorna o snapshot atual (não enumera o ALSA)"""
+        return self._snapshot
+
+    def add_listener(self, callback: Callable):
+        """Registra callback(adicionadas, removidas, snapshot) chamado a cada mudança"""
+        self._listeners.append(callback)
+
+    def refresh(self) -> Dict:
+        """Enumera as portas agora e publica se houve mudança (sem debounce)"""
+        ports = self._enumerate()
+        if ports is not None:
+            self._publish(ports)
+        return self._snapshot
+
+    def request_refresh(self):
+        """Pede à thread uma enumeração imediata, publicada sem debounce e notificada mesmo sem mudança"""
+        self._refresh_requested = True
+        self._wake.set()
+
+    def start(self):
+        """Inicia a thread de monitoramento"""
+        if self._running:
+            return
+        self._running = True
+        self._start_udev_observer()
+        self._thread = threading.Thread(target=self._run, name="midi-port-watcher", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Monitor de portas MIDI iniciado ({'udev' if self._udev_observer else 'verificação periódica'})")
+
+    def stop(self):
+        """Para a thread de monitoramento"""
+        self._running = False
+        self._wake.set()
+        if self._udev_observer:
+            try:
+                self._udev_observer.stop()
+            except Exception:
+                pass
+            self._udev_observer = None
+
+    def _start_udev_observer(self):
+        """Usa eventos udev do subsistema de som para acordar a thread (opcional)"""
+        try:
+            import pyudev
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by(subsystem='sound')
+            self._udev_observer = pyudev.MonitorObserver(monitor, callback=lambda device: self._wake.set())
+            self._udev_observer.start()
+        except ImportError:
+            self._udev_observer = None
+        except Exception as e:
+            self.logger.warning(f"Eventos udev indisponíveis, usando verificação periódica: {str(e)}")
+            self._udev_observer = None
+
+    def _run(self):
+        pending = None
+        pending_since = 0.0
+        while self._running:
+            # Com mudança pendente, volta assim que o debounce vencer; com udev,
+            # sem evento só acorda na verificação de segurança
+            if pending is not None:
+                timeout = self.debounce
+            else:
+                timeout = self.fallback_interval if self._udev_observer else self.interval
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if not self._running:
+                return
+            requested, self._refresh_requested = self._refresh_requested, False
+
+            ports = self._enumerate()
+            if ports is None:
+                continue
+            if requested:
+                # Pedido do controlador (erro de envio): a queda pode ter sido curta demais para mudar a lista
+                pending = None
+                self._publish(ports, notify_unchanged=True)
+                continue
+            current = (self._snapshot['inputs'], self._snapshot['outputs'])
+            if ports == current:
+                pending = None
+                continue
+            now = time.monotonic()
+            if ports != pending:
+                pending, pending_since = ports, now
+                continue
+            if now - pending_since >= self.debounce:
+                self._publish(ports)
+                pending = None
+
+    def _enumerate(self) -> Optional[tuple]:
+        """Lista (entradas, saídas) ordenadas; None se a enumeração falhar"""
+        try:
+            import mido
+            return sorted(mido.get_input_names()), sorted(mido.get_output_names())
+        except ImportError:
+            return ['Chocolate MIDI In', 'Zoom G3X MIDI In'], ['Chocolate MIDI Out', 'Zoom G3X MIDI Out']
+        except Exception as e:
+            self.logger.error(f"Erro ao listar portas MIDI: {str(e)}")
+            return None
+
+    def _publish(self, ports: tuple, notify_unchanged: bool = False):
+        inputs, outputs = ports
+        with self._lock:
+            old = self._snapshot
+            if (inputs, outputs) == (old['inputs'], old['outputs']) and old['version']:
+                if not notify_unchanged:
+                    return
+                added, removed, snapshot = [], [], old
+            else:
+                added = sorted(set(inputs + outputs) - set(old['inputs'] + old['outputs']))
+                removed = sorted(set(old['inputs'] + old['outputs']) - set(inputs + outputs))
+                # Troca atômica: leitores sempre veem um snapshot completo
+                self._snapshot = {
+                    'version': old['version'] + 1,
+                    'inputs': inputs,
+                    'outputs': outputs,
+                    'updated_at': time.time()
+                }
+                snapshot = self._snapshot
+        if old['version'] and snapshot is not old:
+            self.logger.info(f"Portas MIDI alteradas (versão {snapshot['version']}): +{added} -{removed}")
+        self._notify(added, removed, snapshot)
+
+    def _notify(self, added: list, removed: list, snapshot: Dict):
+        for callback in list(self._listeners):
+            try:
+                callback(added, removed, snapshot)
+            except Exception as e:
+                self.logger.error(f"Erro ao notificar mudança de portas MIDI: {str(e)}")
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Envio de bytes MIDI crus, sem montar mido.Message
+"""
+
+def cc_bytes(channel: int, control: int, value: int) -> bytes:
+    """Control Change pronto para envio (sem validação: valores já conferidos)"""
+    return bytes((0xB0 | channel, control, value))
+
+def pc_bytes(channel: int, program: int) -> bytes:
+    """Program Change pronto para envio (sem validação: valores já conferidos)"""
+    return bytes((0xC0 | channel, program))
+
+def write_raw(port, data) -> None:
+    """Escreve uma mensagem MIDI completa direto no backend da porta.
+
+    No backend rtmidi do mido os bytes vão direto para o MidiOut; nos demais
+    backends a mensagem é montada a partir dos bytes e enviada normalmente.
+    """
+    writer = getattr(port, '_rt', None)
+    if writer is not None:
+        writer.send_message(data)
+        return
+    import mido
+    port.send(mido.Message.from_bytes(data))
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Correlação de requisições e respostas SysEx
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional
+
+ANY_REPLY = '*'  # Aceita qualquer SysEx que nenhuma outra requisição esperava
+PATCH_NAME_REPLY = 0x08  # Resposta Zoom com os dados de um patch
+PATCH_NUMBER_INDEX = 7  # Byte da resposta 0x08 com o número do patch
+
+def reply_key(data) -> Optional[object]:
+    """Chave de correlação de uma resposta SysEx (sem F0/F7)"""
+    if len(data) >= 4 and data[0] == 0x7E and data[2] == 0x06 and data[3] == 0x02:
+        return 'identity'
+    if len(data) >= 4 and data[0] == 0x52:
+        if data[3] == PATCH_NAME_REPLY and len(data) > PATCH_NUMBER_INDEX:
+            # Cada patch tem sua própria chave: uma resposta perdida não desloca as seguintes
+            return (PATCH_NAME_REPLY, data[PATCH_NUMBER_INDEX])
+        return data[3]  # Byte de comando Zoom (F0 52 00 6E <cmd> ...)
+    return None
+
+class SysexCorrelator:
+    """Associa respostas SysEx recebidas às requisições pendentes.
+
+    Cada requisição registra um Future pela chave da resposta esperada (byte
+    de comando) antes de enviar; o listener de entrada completa o Future
+    assim que a resposta chega, então o chamador só espera o tempo real de
+    resposta, limitado pelo timeout da requisição. Requisições com a mesma
+    chave são atendidas em ordem de chegada; respostas de patch (0x08) têm
+    chave (0x08, número do patch).
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._pending = {}  # chave -> [Future]
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'replies': 0, 'timeouts': 0, 'unmatched': 0}
+
+    def expect(self, key) -> Future:
+        """Registra uma resposta esperada e retorna o Future correspondente"""
+        future = Future()
+        with self._lock:
+            self._pending.setdefault(key, []).append(future)
+            self._stats['requests'] += 1
+        return future
+
+    def feed(self, message):
+        """Listener de entrada: completa a requisição pendente da resposta"""
+        if message.type != 'sysex':
+            return
+        key = reply_key(message.data)
+        with self._lock:
+            waiters = self._pending.get(key) or self._pending.get(ANY_REPLY)
+            future = waiters.pop(0) if waiters else None
+            if future:
+                self._stats['replies'] += 1
+            else:
+                self._stats['unmatched'] += 1
+        if future and not future.done():
+            future.set_result(tuple(message.data))
+
+    def request(self, send: Callable, message, key, timeout: float = 0.5) -> Optional[tuple]:
+        """Envia a mensagem e aguarda a resposta com a chave (None em timeout)"""
+        future = self.expect(key)
+        try:
+            send(message)
+            return future.result(timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            return None
+        finally:
+            self.discard(key, future)
+
+    def cancel_all(self):
+        """Cancela todas as requisições pendentes (desconexão)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for futures in pending.values():
+            for future in futures:
+                future.cancel()
+
+    def get_stats(self) -> Dict:
+        """Retorna contadores de requisições, respostas e timeouts"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = sum(len(futures) for futures in self._pending.values())
+        return stats
+
+    def discard(self, key, future: Future):
+        """Remove uma requisição que não será mais aguardada"""
+        with self._lock:
+            waiters = self._pending.get(key)
+            if waiters and future in waiters:
+                waiters.remove(future)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Fila de transmissão MIDI com cadência por dispositivo
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+class PacedTransmitQueue:
+    """Fila de saída com uma thread escritora dedicada por dispositivo.
+
+    Quem ativa um patch apenas enfileira as mensagens e retorna; a thread
+    escritora envia uma a uma respeitando a pausa pedida após cada mensagem
+    (tempo para o pedal processar a mudança), sem segurar locks do chamador.
+    Uma rajada enfileirada com replace=True descarta o que ainda não foi
+    enviado da rajada anterior e interrompe a pausa em andamento. Se
+    informado, skip(mensagem) é consultado no momento do envio para pular
+    mensagens que não mudariam o estado do dispositivo. Uma rajada pode
+    levar um trace (t0 da ativação); on_sent(trace) é chamado quando a
+    primeira mensagem dela é de fato enviada.
+    """
+
+    def __init__(self, name: str, send: Callable, skip: Optional[Callable] = None,
+                 on_sent: Optional[Callable] = None):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self._send = send
+        self._skip = skip
+        self._on_sent = on_sent
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._busy = False
+        self._burst_started = None
+        self._generation = 0  # Incrementado a cada preempção
+        self._stats = {
+            'enqueued': 0, 'sent': 0, 'skipped': 0, 'errors': 0, 'dropped': 0, 'preemptions': 0, 'max_depth': 0,
+            'drains': 0, 'last_drain_ms': None, 'max_drain_ms': None, 'total_drain_ms': 0.0
+        }
+        self._thread = threading.Thread(target=self._run, name=f"midi-tx-{name}", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, items: Iterable[Tuple[object, float]], replace: bool = False, trace=None) -> int:
+        """Enfileira (mensagem, pausa após envio em segundos) e retorna a profundidade da fila"""
+        with self._cond:
+            if replace and (self._items or self._busy):
+                # Rajada obsoleta: descarta o que não foi enviado
+                self._stats['dropped'] += len(self._items)
+                self._stats['preemptions'] += 1
+                self._items.clear()
+                self._generation += 1
+            if not self._items and not self._busy:
+                self._burst_started = time.monotonic()
+            for message, delay in items:
+                # O trace acompanha só a primeira mensagem da rajada
+                self._items.append((message, delay, trace))
+                self._stats['enqueued'] += 1
+                trace = None
+            depth = len(self._items)
+            self._stats['max_depth'] = max(self._stats['max_depth'], depth)
+            self._cond.notify_all()
+            return depth
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Aguarda a fila esvaziar (True se esvaziou dentro do tempo)"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._items and not self._busy, timeout)
+
+    def stop(self):
+        """Encerra a thread escritora descartando o que não foi enviado"""
+        with self._cond:
+            self._running = False
+            self._items.clear()
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        """Retorna profundidade atual e estatísticas de escoamento da fila"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = len(self._items)
+        stats['avg_drain_ms'] = stats['total_drain_ms'] / stats['drains'] if stats['drains'] else None
+        return stats
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._items or not self._running)
+                if not self._running:
+                    return
+                message, delay, trace = self._items.popleft()
+                self._busy = True
+                generation = self._generation
+
+            try:
+                if self._skip and self._skip(message):
+                    # Nada muda no dispositivo: nem envia nem espera
+                    self._stats['skipped'] += 1
+                    delay = 0
+                    if trace is not None:
+                        self._pass_trace(trace)
+                else:
+                    self._send(message)
+                    self._stats['sent'] += 1
+                    if trace is not None and self._on_sent:
+                        self._on_sent(trace)
+            except Exception as e:
+                self._stats['errors'] += 1
+                self.logger.error(f"Erro ao transmitir mensagem na fila {self.name}: {str(e)}")
+
+            with self._cond:
+                if delay:
+                    # Pausa interrompida se uma rajada mais nova preemptar a atual
+                    self._cond.wait_for(lambda: self._generation != generation or not self._running, delay)
+                self._busy = False
+                if not self._items:
+                    self._record_drain()
+                    self._cond.notify_all()
+
+    def _pass_trace(self, trace):
+        """Mensagem pulada: o trace passa para a próxima da mesma rajada"""
+        with self._cond:
+            if self._items and self._items[0][2] is None:
+                message, delay, _ = self._items[0]
+                self._items[0] = (message, delay, trace)
+
+    def _record_drain(self):
+        """Registra o tempo entre o início da rajada e a fila vazia"""
+        if self._burst_started is None:
+            return
+        drain_ms = (time.monotonic() - self._burst_started) * 1000
+        self._burst_started = None
+        stats = self._stats
+        stats['drains'] += 1
+        stats['last_drain_ms'] = drain_ms
+        stats['total_drain_ms'] += drain_ms
+        if stats['max_drain_ms'] is None or drain_ms > stats['max_drain_ms']:
+            stats['max_drain_ms'] = drain_ms
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+RaspMIDI - Leitura em background dos nomes de patches da Zoom G3X
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Tuple
+
+BANK_LETTERS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
+PATCHES_PER_BANK = 10
+
+class ZoomPatchDump:
+    """Job que lê os nomes de todos os patches do pedal sem bloquear o Flask.
+
+    As requisições SysEx são encadeadas (várias em voo) pelo controlador Zoom.
+    Sem `force`, primeiro só o nome do primeiro patch de cada banco é lido
+    (sonda barata); bancos já lidos deste pedal cuja sonda bate com o cache
+    não são relidos. Os demais são lidos inteiros, comparados pelo checksum e
+    gravados em zoom_patches e no cache somente se mudaram. O progresso é publicado como eventos numerados para
+    que a interface acompanhe a leitura por streaming.
+    """
+
+    def __init__(self, zoom, cache_manager, banks: List[str] = None, force: bool = False):
+        self.logger = logging.getLogger(__name__)
+        self.zoom = zoom
+        self.cache_manager = cache_manager
+        self.banks = banks or BANK_LETTERS
+        self.force = force
+        self.fingerprint = None
+        self._cond = threading.Condition()
+        self._events = []
+        self._pending = {bank: {} for bank in self.banks}  # banco -> {número local: nome}
+        self.running = False
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    @staticmethod
+    def bank_number(bank_letter: str) -> int:
+        """Converte a letra do banco (A-J) no número (0-9)"""
+        return BANK_LETTERS.index(bank_letter)
+
+    def start(self) -> bool:
+        """Inicia a leitura em uma thread (False se já estiver em andamento)"""
+        with self._cond:
+            if self.running:
+                return False
+            self.running = True
+            self.started_at = time.time()
+        threading.Thread(target=self._run, name="zoom-patch-dump", daemon=True).start()
+        return True
+
+    def status(self) -> Dict:
+        """Retorna o progresso por banco"""
+        with self._cond:
+            banks = {
+                bank: {'read': len(names), 'total': PATCHES_PER_BANK, 'done': len(names) == PATCHES_PER_BANK}
+                for bank, names in self._pending.items()
+            }
+            return {
+                'running': self.running,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'error': self.error,
+                'banks': banks,
+                'read': sum(bank['read'] for bank in banks.values()),
+                'total': len(banks) * PATCHES_PER_BANK,
+                'last_seq': len(self._events)
+            }
+
+    def wait_events(self, after: int = 0, timeout: float = 15.0) -> Tuple[List[Dict], bool]:
+        """Aguarda eventos com seq > after; retorna (eventos, job finalizado)"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._events) > after or not self.running, timeout)
+            return self._events[after:], not self.running
+
+    def _emit(self, event: Dict, finished: bool = False):
+        with self._cond:
+            event['seq'] = len(self._events) + 1
+            self._events.append(event)
+            if finished:
+                # Publica o evento final junto com o fim do job
+                self.running = False
+            self._cond.notify_all()
+
+    def _run(self):
+        try:
+            self.fingerprint = self.zoom.get_fingerprint()
+            self.logger.info(f"Iniciando leitura dos patches da Zoom ({len(self.banks)} bancos, identidade {self.fingerprint})")
+            banks = self.banks if self.force else self._probe_banks()
+            with self._cond:
+                numbers = [
+                    self.bank_number(bank) * PATCHES_PER_BANK + i
+                    for bank in banks for i in range(PATCHES_PER_BANK) if i not in self._pending[bank]
+                ]
+            self.zoom.read_patch_names(numbers, on_result=self._on_patch_name)
+        except Exception as e:
+            self.error = str(e)
+            self.logger.error(f"Erro na leitura dos patches da Zoom: {str(e)}")
+        finally:
+            self.finished_at = time.time()
+            self._emit({'type': 'done', 'error': self.error, 'elapsed_s': self.finished_at - self.started_at}, finished=True)
+
+    def _probe_banks(self) -> List[str]:
+        """Lê o primeiro patch de cada banco; retorna os bancos que precisam de leitura completa"""
+        first_numbers = {bank: self.bank_number(bank) * PATCHES_PER_BANK for bank in self.banks}
+        first_names = self.zoom.read_patch_names(list(first_numbers.values()))
+        stale = []
+        for bank, number in first_numbers.items():
+            if self.cache_manager.is_zoom_bank_current(bank, self.fingerprint, first_names.get(number)):
+                self._use_cached_bank(bank)
+            else:
+                stale.append(bank)
+                # O primeiro patch já foi lido pela sonda
+                self._on_patch_name(number, first_names[number])
+        self.logger.info(f"Sonda dos bancos da Zoom: {len(stale)} de {len(self.banks)} precisam de leitura completa")
+        return stale
+
+    def _use_cached_bank(self, bank: str):
+        """Banco sem mudança na sonda: publica os nomes do cache sem reler o pedal"""
+        patches = [
+            {'number': patch['number'], 'name': patch['name']}
+            for patch in self.cache_manager.get_zoom_patches_by_bank(bank)
+        ]
+        with self._cond:
+            self._pending[bank] = {patch['number']: patch['name'] for patch in patches}
+        self._emit({'type': 'bank', 'bank': bank, 'patches': patches, 'changed': False, 'cached': True})
+
+    def _on_patch_name(self, number: int, name: str):
+        bank = BANK_LETTERS[number // PATCHES_PER_BANK]
+        local_number = number % PATCHES_PER_BANK
+        with self._cond:
+            names = self._pending[bank]
+            names[local_number] = name
+            complete = len(names) == PATCHES_PER_BANK
+        self._emit({'type': 'patch', 'bank': bank, 'number': local_number, 'name': name})
+        if complete:
+            self._save_bank(bank)
+
+    def _save_bank(self, bank: str):
+        """Grava um banco completo no banco de dados e no cache (se mudou)"""
+        patches = [{'number': number, 'name': name} for number, name in sorted(self._pending[bank].items())]
+        try:
+            changed = self.cache_manager.store_zoom_bank(bank, patches, self.fingerprint, self.force)
+            self._emit({'type': 'bank', 'bank': bank, 'patches': patches, 'changed': changed})
+        except Exception as e:
+            self.logger.error(f"Erro ao salvar banco {bank} da Zoom: {str(e)}")
+            self._emit({'type': 'bank', 'bank': bank, 'error': str(e)})
@@ -7,9 +7,15 @@ Baseado na documentação do zoom-explorer para MS-50G+ (device ID 6E)
 import logging
 import mido
 import time
-from typing import Dict, Optional, List
+from collections import deque
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Iterable, Optional, List
 
 from app.config import Config
+from app.midi.transmit_queue import PacedTransmitQueue
+from app.midi.device_state import DeviceStateMirror
+from app.midi.sysex_correlator import SysexCorrelator, ANY_REPLY
+from app.midi.raw_send import write_raw
 
 class ZoomG3XController:
     """Controlador específico para Zoom G3X usando comandos SysEx documentados"""
@@ -20,6 +26,33 @@ class ZoomG3XController:
         self.connected = False
         self.effects = Config.ZOOM_EFFECTS
         self.device_name = None  # Adicionado para compatibilidade com controller.py
+        self.send_listener = None  # Chamado após cada port.send (medição de latência)
+        self.trace_source = None     # () -> t0 (ns) da ativação em andamento nesta thread
+        self.latency_listener = None  # (etapa, porta, t0) ao enfileirar e ao enviar
+        # Hooks do pool de portas do MIDIController (opcionais)
+        self.port_opener = None
+        self.port_closer = None
+        self.port_sender = None
+        self.raw_sender = None      # (bytes, porta) -> bool
+        self.state_provider = None  # nome da porta -> DeviceStateMirror
+        self._local_state = DeviceStateMirror()  # Usado sem o pool
+        self._last_activation = None  # Patch da última ativação (reativar = restaurar)
+        self._restore_pc = None       # PC que não pode ser pulado na rajada atual
+        
+        # Respostas SysEx chegam pela porta de entrada do pedal
+        self.input_name = None      # Porta de entrada real (definida pelo MIDIController)
+        self.input_attacher = None  # (porta, callback) -> bool
+        self.input_detacher = None  # (porta, callback)
+        self.sysex = SysexCorrelator()
+        self.sysex_timeout = Config.ZOOM_SYSEX_TIMEOUT
+        self.sysex_max_in_flight = Config.ZOOM_SYSEX_MAX_IN_FLIGHT
+        self._listening = False
+        self.identity = None  # Resposta do Identity Request (bytes sem F0/F7)
+        
+        # Fila de transmissão cadenciada (criada ao conectar)
+        self.tx_queue = None
+        self.pc_delay = Config.ZOOM_PC_DELAY
+        self.cc_delay = Config.ZOOM_CC_DELAY
         
         # Device ID para Zoom G3X (baseado na documentação MS-50G+)
         self.device_id = 0x6E
@@ -41,9 +74,15 @@ class ZoomG3XController:
             self.logger.info(f"Tentando conectar ao Zoom G3X na porta: {port_name}")
             
             # Tenta abrir a porta com timeout
-            self.port = mido.open_output(port_name)
+            self.port = self.port_opener(port_name) if self.port_opener else mido.open_output(port_name)
+            if self.port is None:
+                raise IOError(f"Não foi possível abrir a porta {port_name}")
             self.connected = True
             self.device_name = port_name  # Salva o nome da porta conectada
+            if self.tx_queue:
+                self.tx_queue.stop()
+            self.tx_queue = PacedTransmitQueue(port_name, self._send, skip=self._is_redundant, on_sent=self._on_traced_send)
+            self._attach_input()
             self.logger.info(f"Zoom G3X conectado na porta: {port_name}")
             
             # Testa se a conexão está funcionando com Identity Request
@@ -79,6 +118,32 @@ class ZoomG3XController:
             
             return False
     
+    def _attach_input(self):
+        """Registra o correlator SysEx como listener da porta de entrada do pedal"""
+        if self._listening or not (self.input_attacher and self.input_name):
+            return
+        self._listening = bool(self.input_attacher(self.input_name, self.sysex.feed))
+        if self._listening:
+            self.logger.info(f"Escutando respostas SysEx em: {self.input_name}")
+        else:
+            self.logger.warning(f"Não foi possível escutar respostas SysEx em: {self.input_name}")
+    
+    def _detach_input(self):
+        """Remove o listener de entrada e cancela requisições pendentes"""
+        if self._listening and self.input_detacher:
+            self.input_detacher(self.input_name, self.sysex.feed)
+        self._listening = False
+        self.sysex.cancel_all()
+    
+    def _sysex_request(self, data: List[int], key, timeout: float = None) -> Optional[tuple]:
+        """Envia SysEx e aguarda a resposta correlacionada (None sem resposta)"""
+        if not self._listening:
+            # Sem porta de entrada não há como receber resposta
+            self._send(mido.Message('sysex', data=data))
+            return None
+        message = mido.Message('sysex', data=data)
+        return self.sysex.request(self._send, message, key, timeout or self.sysex_timeout)
+    
     def _send_identity_request(self) -> Optional[str]:
         """Envia MIDI Identity Request e retorna a resposta"""
         try:
@@ -87,33 +152,26 @@ class ZoomG3XController:
             
             # MIDI Identity Request: F0 7E 7F 06 01 F7
             sysex_data = self.sysex_commands['identity_request']
-            sysex_msg = mido.Message('sysex', data=sysex_data)
-            self.port.send(sysex_msg)
-            
             self.logger.debug(f"Identity Request enviado: {sysex_data}")
-            
-            # Aguarda resposta
-            time.sleep(0.2)
-            
-            # Tenta ler resposta (se disponível)
-            for msg in getattr(self.port, 'iter_pending', lambda: [])():
-                if msg.type == 'sysex' and len(msg.data) >= 7:
-                    # Resposta esperada: F0 7E 00 06 02 52 6E 00 23 00 31 2E 31 30 F7
-                    if msg.data[0] == 0x7E and msg.data[2] == 0x06 and msg.data[3] == 0x02:
-                        manufacturer = msg.data[4]
-                        family_code = msg.data[5:7]
-                        model = msg.data[7:9]
-                        version = msg.data[9:]
-                        
-                        response_info = {
-                            'manufacturer': f"0x{manufacturer:02X}",
-                            'family_code': f"0x{family_code[0]:02X}{family_code[1]:02X}",
-                            'model': f"0x{model[0]:02X}{model[1]:02X}",
-                            'version': bytes(version).decode('ascii', errors='ignore')
-                        }
-                        
-                        self.logger.info(f"Identity Response: {response_info}")
-                        return str(response_info)
+            data = self._sysex_request(sysex_data, 'identity')
+            self.identity = data if data and len(data) >= 9 else None
+            
+            # Resposta esperada: F0 7E 00 06 02 52 6E 00 23 00 31 2E 31 30 F7
+            if data and len(data) >= 9:
+                manufacturer = data[4]
+                family_code = data[5:7]
+                model = data[7:9]
+                version = data[9:]
+                
+                response_info = {
+                    'manufacturer': f"0x{manufacturer:02X}",
+                    'family_code': f"0x{family_code[0]:02X}{family_code[1]:02X}",
+                    'model': f"0x{model[0]:02X}{model[1]:02X}",
+                    'version': bytes(version).decode('ascii', errors='ignore')
+                }
+                
+                self.logger.info(f"Identity Response: {response_info}")
+                return str(response_info)
             
             return None
             
@@ -121,11 +179,66 @@ class ZoomG3XController:
             self.logger.error(f"Erro ao enviar Identity Request: {str(e)}")
             return None
 
+    def _send(self, message):
+        """Envia pela porta do pool (reabre se preciso) ou diretamente pela porta local"""
+        if self.port_sender and self.device_name:
+            if not self.port_sender(message, self.device_name):
+                raise IOError(f"Falha ao enviar para {self.device_name}")
+            # self.port é atualizada pelo MIDIController quando o pool reabre a porta
+            return
+        self.port.send(message)
+        self._local_state.apply(message)
+        if self.send_listener:
+            self.send_listener()
+    
+    def send_raw(self, data) -> bool:
+        """Envia uma mensagem MIDI completa já em bytes (sem montar nem validar mido.Message)"""
+        try:
+            if not self.connected or self.port is None:
+                return False
+            if self.raw_sender and self.device_name:
+                return self.raw_sender(data, self.device_name)
+            write_raw(self.port, data)
+            self._local_state.apply_bytes(data)
+            if self.send_listener:
+                self.send_listener()
+            return True
+        except Exception as e:
+            self.logger.error(f"Erro ao enviar bytes MIDI: {str(e)}")
+            return False
+    
+    def _on_traced_send(self, trace):
+        """Primeira mensagem de uma ativação enviada pela fila"""
+        if self.latency_listener:
+            self.latency_listener('send', self.device_name, trace)
+    
+    @property
+    def state(self) -> DeviceStateMirror:
+        """Último estado conhecido do pedal"""
+        if self.state_provider and self.device_name:
+            return self.state_provider(self.device_name)
+        return self._local_state
+    
+    def _is_redundant(self, message) -> bool:
+        """True se a mensagem não mudaria o estado conhecido do pedal"""
+        if message is self._restore_pc:
+            # Reativação explícita: o PC recarrega o patch salvo e desfaz edições feitas no pedal
+            self._restore_pc = None
+            return False
+        return self.state.is_redundant(message)
+    
     def disconnect(self):
         """Desconecta do Zoom G3X"""
         try:
+            if self.tx_queue:
+                self.tx_queue.stop()
+                self.tx_queue = None
+            self._detach_input()
             if self.port:
-                self.port.close()
+                if self.port_closer and self.device_name:
+                    self.port_closer(self.device_name)
+                else:
+                    self.port.close()
                 self.port = None
                 self.connected = False
                 self.logger.info("Zoom G3X desconectado")
@@ -153,32 +266,53 @@ class ZoomG3XController:
 
             self.logger.info(f"[ZOOM DEBUG] Enviando Program Change para Zoom: channel=0, program={program_number}")
 
-            # Envia o comando PC
-            if not self.send_pc(0, int(program_number)):
-                self.logger.error(f"[ZOOM DEBUG] Falha ao enviar Program Change {program_number}")
-                return False
-            
-            # Pequena pausa para o pedal processar a mudança de patch
-            time.sleep(0.1)
-
-            # 2. Configura os efeitos (ligado/desligado)
+            # Monta PC seguido dos CCs de efeitos (ligado/desligado), com a pausa após cada um
+            items = [(mido.Message('program_change', channel=0, program=int(program_number)), self.pc_delay)]
             effects = patch_data.get('effects', {})
-            if effects:
-                self.logger.info("Configurando efeitos...")
-                for effect_name, effect_params in effects.items():
-                    if effect_name in self.effects and 'enabled' in effect_params:
-                        cc_number = self.effects[effect_name]['cc']
-                        value = 127 if effect_params['enabled'] else 0
-                        self.send_cc(0, cc_number, value)
-                        time.sleep(0.05)  # Pequena pausa entre comandos CC
+            for effect_name, effect_params in effects.items():
+                if effect_name in self.effects and 'enabled' in effect_params:
+                    cc_number = self.effects[effect_name]['cc']
+                    value = 127 if effect_params['enabled'] else 0
+                    items.append((mido.Message('control_change', channel=0, control=cc_number, value=value), self.cc_delay))
             
-            self.logger.info(f"Patch '{patch_data.get('name', 'Unknown')}' carregado com sucesso")
-            return True
+            return self.play_items(items, patch_data.get('name', 'Unknown'), patch_data.get('id'))
             
         except Exception as e:
             self.logger.error(f"Erro ao carregar patch: {str(e)}", exc_info=True)
             return False
     
+    def play_items(self, items, name: str = 'Unknown', activation=None) -> bool:
+        """Transmite pares (mensagem, pausa) já montados, como um plano pré-compilado.
+
+        Outro patch com o mesmo programa só envia os CCs que mudam; reativar o
+        mesmo patch (ou um sem identificação) sempre reenvia o PC e, como o PC
+        zera os CCs conhecidos, todos os efeitos.
+        """
+        if activation is None or activation == self._last_activation:
+            first = items[0][0] if items else None
+            self._restore_pc = first if first is not None and first.type == 'program_change' else None
+        else:
+            self._restore_pc = None
+        self._last_activation = activation
+        # Sem fila (porta aberta fora do connect), envia de forma síncrona
+        if not self.tx_queue:
+            for message, delay in items:
+                if self._is_redundant(message):
+                    continue
+                self._send(message)
+                time.sleep(delay)
+            self.logger.info(f"Patch '{name}' carregado com sucesso")
+            return True
+        
+        # A thread escritora envia com a cadência configurada; retorna imediatamente.
+        # Mensagens ainda não enviadas de um patch anterior ficam obsoletas e são descartadas
+        trace = self.trace_source() if self.trace_source else None
+        depth = self.tx_queue.enqueue(items, replace=True, trace=trace)
+        if trace is not None and self.latency_listener:
+            self.latency_listener('enqueue', self.device_name, trace)
+        self.logger.info(f"Patch '{name}' enfileirado ({len(items)} mensagens, fila={depth})")
+        return True
+    
     def toggle_effect(self, effect_name: str, enabled: bool) -> bool:
         """Liga/desliga um efeito específico"""
         try:
@@ -211,7 +345,7 @@ class ZoomG3XController:
                 return False
 
             message = mido.Message('control_change', channel=channel, control=cc, value=int(value))
-            self.port.send(message)
+            self._send(message)
 
             self.logger.debug(f"CC enviado: Channel={channel}, CC={cc}, Value={value}")
             return True
@@ -228,7 +362,7 @@ class ZoomG3XController:
                 return False
 
             message = mido.Message('program_change', channel=channel, program=program)
-            self.port.send(message)
+            self._send(message)
 
             self.logger.info(f"[ZOOM DEBUG] ✅ PC enviado com sucesso: Channel={channel}, Program={program}")
             return True
@@ -295,12 +429,25 @@ class ZoomG3XController:
         except Exception as e:
             self.logger.error(f"Erro ao enviar parâmetros do efeito {effect_name}: {str(e)}")
     
+    def get_sysex_stats(self) -> Dict:
+        """Retorna contadores do correlator SysEx"""
+        return dict(self.sysex.get_stats(), listening=self._listening, input=self.input_name)
+    
+    def get_transmit_stats(self) -> Optional[Dict]:
+        """Retorna estatísticas da fila de transmissão (None se desconectado)"""
+        return self.tx_queue.get_stats() if self.tx_queue else None
+    
     def get_effect_status(self) -> Dict:
         """Retorna status dos efeitos"""
         return {
             'connected': self.connected,
             'effects': self.effects,
-            'port': self.port.name if self.port else None
+            'port': self.port.name if self.port else None,
+            'program': self.state.get_program(0),
+            'effects_state': {
+                name: (None if value is None else value >= 64)
+                for name, value in ((name, self.state.get_cc(0, effect['cc'])) for name, effect in self.effects.items())
+            }
         }
     
     def get_bank_patches(self, bank_number: int) -> Optional[List[Dict]]:
@@ -339,6 +486,61 @@ class ZoomG3XController:
             self.logger.error(f"Erro ao importar patches do banco {bank_number}: {str(e)}")
             return None
 
+    def get_fingerprint(self) -> Optional[str]:
+        """Identidade do pedal (fabricante, modelo e firmware) usada como chave do cache de nomes"""
+        if self.identity is None and self.connected:
+            self._send_identity_request()
+        if self.identity is None:
+            return None
+        return bytes(self.identity).hex()
+    
+    def read_patch_names(self, patch_numbers: Iterable[int], on_result: Callable = None,
+                         max_in_flight: int = None) -> Dict[int, str]:
+        """Lê nomes de patches (números globais) mantendo várias requisições SysEx em voo.
+
+        Envia get_patch_name até max_in_flight pendentes e, a cada resposta (ou
+        timeout) da mais antiga, envia a próxima. Cada requisição espera a chave
+        (0x08, número do patch), então só a resposta do próprio patch a completa.
+        """
+        max_in_flight = max(1, max_in_flight or self.sysex_max_in_flight)
+        names = {}
+        window = deque()
+
+        def finish(number, future):
+            try:
+                data = future.result(self.sysex_timeout)
+            except (FutureTimeoutError, CancelledError):
+                data = None
+            finally:
+                self.sysex.discard((0x08, number), future)
+            name = self._extract_ascii_string(list(data[8:])) if data and len(data) > 7 else ''
+            names[number] = name or f"Patch {number % 10}"
+            if on_result:
+                on_result(number, names[number])
+
+        for number in patch_numbers:
+            if not self._listening:
+                # Sem porta de entrada não há resposta: usa o nome padrão
+                names[number] = f"Patch {number % 10}"
+                if on_result:
+                    on_result(number, names[number])
+                continue
+            future = self.sysex.expect((0x08, number))
+            try:
+                # F0 52 00 6E 09 00 00 <patch_number> F7
+                sysex_data = self.sysex_commands['get_patch_name'] + [0x00, 0x00, number]
+                self._send(mido.Message('sysex', data=sysex_data))
+            except Exception as e:
+                self.logger.debug(f"Erro ao enviar get_patch_name para patch {number}: {e}")
+                future.cancel()
+            window.append((number, future))
+            if len(window) >= max_in_flight:
+                finish(*window.popleft())
+
+        while window:
+            finish(*window.popleft())
+        return names
+
     def _try_read_patch_name_documented(self, patch_number: int, bank_number: int) -> str:
         """Tenta ler o nome de um patch usando comandos SysEx documentados."""
         # Calcula o número local (0-9) para o nome padrão
@@ -352,28 +554,14 @@ class ZoomG3XController:
         try:
             # F0 52 00 6E 09 00 00 <patch_number> F7
             sysex_data = self.sysex_commands['get_patch_name'] + [0x00, 0x00, patch_number]
-            sysex_msg = mido.Message('sysex', data=sysex_data)
-            self.port.send(sysex_msg)
             self.logger.debug(f"Enviado SysEx get_patch_name para patch {patch_number}: {sysex_data}")
-            
-            # Aguarda resposta
-            time.sleep(0.2)
-            
-            # Tenta ler resposta
-            for msg in getattr(self.port, 'iter_pending', lambda: [])():
-                if msg.type == 'sysex' and len(msg.data) > 7:
-                    try:
-                        # Resposta esperada: F0 52 00 6E 08 00 00 <patch_number> <length LSB> <length MSB> <patch_data> F7
-                        if msg.data[0:4] == [0x52, 0x00, 0x6E, 0x08]:
-                            # Extrai dados do patch
-                            patch_data = msg.data[8:]  # Remove cabeçalho
-                            # Procura por string ASCII no patch data
-                            name = self._extract_ascii_string(patch_data)
-                            if name and name != '':
-                                self.logger.info(f"Patch {patch_number} nome lido via get_patch_name: '{name}'")
-                                return name
-                    except Exception as e:
-                        self.logger.debug(f"Erro ao decodificar resposta get_patch_name do patch {patch_number}: {e}")
+            # Resposta esperada: F0 52 00 6E 08 00 00 <patch_number> <length LSB> <length MSB> <patch_data> F7
+            data = self._sysex_request(sysex_data, (0x08, patch_number))
+            if data and len(data) > 7:
+                name = self._extract_ascii_string(list(data[8:]))
+                if name:
+                    self.logger.info(f"Patch {patch_number} nome lido via get_patch_name: '{name}'")
+                    return name
         except Exception as e:
             self.logger.debug(f"Método get_patch_name falhou para patch {patch_number}: {e}")
 
@@ -381,23 +569,13 @@ class ZoomG3XController:
         try:
             # F0 52 00 6E 08 00 00 <patch_number> F7
             sysex_data = self.sysex_commands['get_bank_patch'] + [0x00, 0x00, patch_number]
-            sysex_msg = mido.Message('sysex', data=sysex_data)
-            self.port.send(sysex_msg)
             self.logger.debug(f"Enviado SysEx get_bank_patch para patch {patch_number}: {sysex_data}")
-            
-            time.sleep(0.2)
-            
-            for msg in getattr(self.port, 'iter_pending', lambda: [])():
-                if msg.type == 'sysex' and len(msg.data) > 7:
-                    try:
-                        if msg.data[0:4] == [0x52, 0x00, 0x6E, 0x08]:
-                            patch_data = msg.data[8:]
-                            name = self._extract_ascii_string(patch_data)
-                            if name and name != '':
-                                self.logger.info(f"Patch {patch_number} nome lido via get_bank_patch: '{name}'")
-                                return name
-                    except Exception as e:
-                        self.logger.debug(f"Erro ao decodificar resposta get_bank_patch do patch {patch_number}: {e}")
+            data = self._sysex_request(sysex_data, (0x08, patch_number))
+            if data and len(data) > 7:
+                name = self._extract_ascii_string(list(data[8:]))
+                if name:
+                    self.logger.info(f"Patch {patch_number} nome lido via get_bank_patch: '{name}'")
+                    return name
         except Exception as e:
             self.logger.debug(f"Método get_bank_patch falhou para patch {patch_number}: {e}")
 
@@ -405,48 +583,29 @@ class ZoomG3XController:
         try:
             # F0 52 00 6E 29 F7
             sysex_data = self.sysex_commands['get_current_patch']
-            sysex_msg = mido.Message('sysex', data=sysex_data)
-            self.port.send(sysex_msg)
             self.logger.debug(f"Enviado SysEx get_current_patch: {sysex_data}")
-            
-            time.sleep(0.2)
-            
-            for msg in getattr(self.port, 'iter_pending', lambda: [])():
-                if msg.type == 'sysex' and len(msg.data) > 3:
-                    try:
-                        # Resposta esperada: F0 52 00 6E 28 <patch_data> F7
-                        if msg.data[0:4] == [0x52, 0x00, 0x6E, 0x28]:
-                            patch_data = msg.data[4:]
-                            name = self._extract_ascii_string(patch_data)
-                            if name and name != '':
-                                self.logger.info(f"Patch atual nome lido via get_current_patch: '{name}'")
-                                return name
-                    except Exception as e:
-                        self.logger.debug(f"Erro ao decodificar resposta get_current_patch: {e}")
+            # Resposta esperada: F0 52 00 6E 28 <patch_data> F7
+            data = self._sysex_request(sysex_data, 0x28)
+            if data and len(data) > 3:
+                name = self._extract_ascii_string(list(data[4:]))
+                if name:
+                    self.logger.info(f"Patch atual nome lido via get_current_patch: '{name}'")
+                    return name
         except Exception as e:
             self.logger.debug(f"Método get_current_patch falhou: {e}")
 
-        # Método 4: Program Change + tentativa de leitura
+        # Método 4: Program Change + qualquer SysEx que o pedal envie em seguida
         try:
-            # Envia Program Change para o patch
-            pc_msg = mido.Message('program_change', channel=0, program=patch_number)
-            self.port.send(pc_msg)
-            self.logger.debug(f"Enviado PC {patch_number}")
-            
-            time.sleep(0.1)
-            
-            # Tenta ler qualquer resposta SysEx
-            for msg in getattr(self.port, 'iter_pending', lambda: [])():
-                if msg.type == 'sysex':
-                    self.logger.debug(f"Resposta SysEx recebida para PC {patch_number}: {msg.data}")
-                    if len(msg.data) > 3:
-                        try:
-                            name = self._extract_ascii_string(msg.data)
-                            if name and name != '':
-                                self.logger.info(f"Patch {patch_number} nome lido via PC: '{name}'")
-                                return name
-                        except Exception as e:
-                            self.logger.debug(f"Erro ao decodificar resposta PC do patch {patch_number}: {e}")
+            if self._listening:
+                pc_msg = mido.Message('program_change', channel=0, program=patch_number)
+                self.logger.debug(f"Enviado PC {patch_number}")
+                data = self.sysex.request(self._send, pc_msg, ANY_REPLY, 0.1)
+                if data and len(data) > 3:
+                    self.logger.debug(f"Resposta SysEx recebida para PC {patch_number}: {data}")
+                    name = self._extract_ascii_string(list(data))
+                    if name:
+                        self.logger.info(f"Patch {patch_number} nome lido via PC: '{name}'")
+                        return name
         except Exception as e:
             self.logger.debug(f"Método PC falhou para patch {patch_number}: {e}")
 
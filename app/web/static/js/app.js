@@ -22,7 +22,8 @@ class RaspMIDI {
             commandCount: 0,
             lastCommand: null,
             maxLines: 100,
-            polling: false
+            polling: false,
+            lastSeq: null // Cursor próprio no buffer de comandos recebidos
         };
         
         // Log de comandos
@@ -2504,6 +2505,12 @@ class RaspMIDI {
         });
     }
     
+    receivedCommandsUrl() {
+        // Pede apenas os comandos posteriores ao último visto por este cliente
+        const lastSeq = this.midiMonitor.lastSeq;
+        return '/api/midi/commands/received' + (lastSeq === null ? '?sync=1' : `?after=${lastSeq}`);
+    }
+    
     startMidiPolling() {
         // Polling para verificar novos comandos MIDI
         setInterval(() => {
@@ -2518,9 +2525,10 @@ class RaspMIDI {
         
         try {
             this.midiMonitor.polling = true;
-            const response = await fetch('/api/midi/commands/received');
+            const response = await fetch(this.receivedCommandsUrl());
             if (response.ok) {
                 const data = await response.json();
+                if (data.success) this.midiMonitor.lastSeq = data.last_seq;
                 if (data.success && data.commands && data.commands.length > 0) {
                     data.commands.forEach(cmd => {
                         this.addMidiCommand(cmd);
@@ -2567,9 +2575,10 @@ class RaspMIDI {
         this.midiMonitor.polling = true;
         
         try {
-            const response = await fetch('/api/midi/commands/received');
+            const response = await fetch(this.receivedCommandsUrl());
             const data = await response.json();
             
+            if (data.success) this.midiMonitor.lastSeq = data.last_seq;
             if (data.success && data.commands) {
                 if (data.commands.length > 0) {
                     this.midiMonitor.commands = [...this.midiMonitor.commands, ...data.commands];
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /api/patches com jsonify a cada requisição x corpo pré-serializado por versão
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from flask import Flask, jsonify
+
+from app.api.routes import api_bp
+from app.cache.cache_manager import CacheManager
+from app.config import Config
+from app.database import database
+from app.database.models import DatabaseManager, Patch
+
+def make_patch(i: int) -> Patch:
+    """Patch sintético com o mesmo formato dos criados pela interface"""
+    return Patch(
+        name=f"Patch {i:05d}",
+        effects={name: {'enabled': bool(i & 1), 'cc': effect['cc']} for name, effect in Config.ZOOM_EFFECTS.items()},
+        input_device='Chocolate MIDI',
+        input_channel=i % 16,
+        output_device='Zoom G3X',
+        command_type='pc',
+        zoom_bank=chr(ord('A') + i % 10),
+        zoom_patch=i % 10,
+        program=i % 128
+    )
+
+def measure(client, path: str, duration: float, headers: dict = None) -> dict:
+    """Requisições por segundo e latência média de uma rota pelo test client do Flask"""
+    count = 0
+    size = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        response = client.get(path, headers=headers or {})
+        size = len(response.get_data())
+        count += 1
+    elapsed = time.perf_counter() - started
+    return {'rps': count / elapsed, 'media_ms': elapsed / count * 1000, 'bytes': size, 'status': response.status_code}
+
+def benchmark():
+    """Mede as rotas com 100, 1.000 e 10.000 patches no cache"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=3.0, help='Segundos por medição')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='Quantidades de patches')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.db_manager = DatabaseManager(os.path.join(tmp, 'benchmark.db'))
+
+        app = Flask(__name__)
+        app.config.from_object(Config)
+        app.register_blueprint(api_bp, url_prefix='/api')
+        app.cache_manager = CacheManager()
+
+        @app.route('/bench/jsonify')
+        def patches_jsonify():
+            # Comportamento anterior: serializa a lista inteira a cada requisição
+            patches = app.cache_manager.get_patches()
+            return jsonify({'success': True, 'data': patches, 'count': len(patches)})
+
+        client = app.test_client()
+        created = 0
+        for size in sorted(args.sizes):
+            for i in range(created, size):
+                database.db_manager.create_patch(make_patch(i))
+            created = size
+            app.cache_manager.load_all_data()
+            etag = client.get('/api/patches').headers['ETag']
+
+            print(f"\n📊 {size} patches ({args.duration:.1f} s por rota)")
+            results = {
+                'jsonify (antes)': measure(client, '/bench/jsonify', args.duration),
+                'pré-serializado': measure(client, '/api/patches', args.duration),
+                'pré-serializado gzip': measure(client, '/api/patches', args.duration, {'Accept-Encoding': 'gzip'}),
+                'If-None-Match (304)': measure(client, '/api/patches', args.duration, {'If-None-Match': etag})
+            }
+            for name, result in results.items():
+                print(f"   {name:<22} {result['rps']:8.0f} req/s  média={result['media_ms']:.3f} ms  "
+                      f"corpo={result['bytes']} bytes  HTTP {result['status']}")
+            baseline = results['jsonify (antes)']['rps']
+            if baseline:
+                print(f"   ⚡ pré-serializado {results['pré-serializado']['rps'] / baseline:.1f}x, "
+                      f"304 {results['If-None-Match (304)']['rps'] / baseline:.1f}x as requisições/s do jsonify")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: envio pelo caminho real do app (controlador Zoom -> actor da porta -> pool),
+mido.Message (send_cc/send_pc) x bytes crus (send_raw)
+"""
+
+import argparse
+import time
+
+import mido
+
+from app.midi.controller import MIDIController
+from app.midi.raw_send import cc_bytes, pc_bytes
+from app.midi.zoom_g3x import ZoomG3XController
+
+def run_paced(send, rate: int, duration: float):
+    """Envia CCs na taxa pedida e mede o tempo de cada chamada de envio"""
+    total = int(rate * duration)
+    samples = []
+    started = time.perf_counter()
+    for i in range(total):
+        # Espera o instante da próxima mensagem (cadência fixa)
+        deadline = started + i / rate
+        while time.perf_counter() < deadline:
+            pass
+        t0 = time.perf_counter_ns()
+        send(i & 0x7F)
+        samples.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - started
+    send_ms = sum(samples) / 1_000_000
+    samples.sort()
+    return {
+        'mensagens': total,
+        'taxa_real': total / elapsed,
+        'media_us': sum(samples) / total / 1000,
+        'p50_us': samples[total // 2] / 1000,
+        'p99_us': samples[min(total - 1, int(total * 0.99))] / 1000,
+        'max_us': samples[-1] / 1000,
+        'envio_ms': send_ms
+    }
+
+def connect_zoom(midi_controller: MIDIController, port_name: str) -> ZoomG3XController:
+    """Controlador Zoom ligado ao pool do MIDIController, como no app (sem Identity Request)"""
+    zoom = ZoomG3XController()
+    midi_controller._attach_port_pool(zoom)
+    zoom.device_name = port_name
+    zoom.port = midi_controller._get_midi_connection(port_name, 'output')
+    zoom.connected = zoom.port is not None
+    return zoom
+
+def benchmark():
+    """Compara os dois caminhos de envio a 1k e 10k mensagens/s"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', help='Porta de saída (padrão: porta virtual criada pelo benchmark)')
+    parser.add_argument('--duration', type=float, default=2.0, help='Segundos por medição')
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 10000], help='Mensagens por segundo')
+    args = parser.parse_args()
+    
+    midi_controller = MIDIController()
+    virtual_port = None
+    port_name = args.port
+    if not port_name:
+        # Porta virtual entregue ao pool como se ele a tivesse aberto
+        virtual_port = mido.open_output('RaspMIDI Benchmark', virtual=True)
+        port_name = virtual_port.name
+        midi_controller._midi_connections[midi_controller._connection_key(port_name, 'output')] = virtual_port
+    zoom = connect_zoom(midi_controller, port_name)
+    if not zoom.connected:
+        print(f"❌ Não foi possível abrir {port_name}")
+        return
+    print(f"🎹 Porta: {port_name} (backend {mido.backend.name}, backend do pool: "
+          f"{midi_controller._port_strategy(port_name) or 'padrão'})")
+    
+    paths = {
+        'CC mido.Message': lambda value: zoom.send_cc(0, 11, value),
+        'CC bytes crus': lambda value: zoom.send_raw(cc_bytes(0, 11, value)),
+        'PC mido.Message': lambda value: zoom.send_pc(0, value),
+        'PC bytes crus': lambda value: zoom.send_raw(pc_bytes(0, value))
+    }
+    try:
+        for rate in args.rates:
+            print(f"\n📊 {rate} mensagens/s por {args.duration:.1f} s (send_* -> actor da porta -> pool)")
+            results = {name: run_paced(send, rate, args.duration) for name, send in paths.items()}
+            for name, result in results.items():
+                print(f"   {name:<16} taxa={result['taxa_real']:.0f}/s média={result['media_us']:.2f} µs "
+                      f"p50={result['p50_us']:.2f} µs p99={result['p99_us']:.2f} µs máx={result['max_us']:.1f} µs "
+                      f"tempo em envio={result['envio_ms']:.1f} ms")
+            for kind in ('CC', 'PC'):
+                baseline = results[f'{kind} mido.Message']['media_us']
+                raw = results[f'{kind} bytes crus']['media_us']
+                if raw:
+                    print(f"   ⚡ {kind}: bytes crus {baseline / raw:.1f}x mais rápido por mensagem")
+    finally:
+        midi_controller.cleanup()
+        if virtual_port:
+            virtual_port.close()
+
+if __name__ == "__main__":
+    benchmark()